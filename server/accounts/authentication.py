@@ -0,0 +1,102 @@
+"""
+Token authentication resolving tokens from a cache instead of the database.
+
+A token resolves to its user, cached in the `tokens` cache for its TIMEOUT.
+The entry is deleted when the token is deleted (logout) and when the user is
+saved, which covers password changes and deactivation (see `accounts.signals`).
+The cache is on the BUDGETS_CACHE_BACKEND shared by the workers, so that a
+token forgotten by one of them is refused by all of them.
+"""
+import hashlib
+import threading
+from collections import Counter
+
+from django.core.cache import caches
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+CACHE_ALIAS = 'tokens'
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def token_cache_key(key):
+    # Hashed so the cache doesn't hold usable tokens
+    return 'accounts:token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def count(event):
+    with _stats_lock:
+        _stats[event] += 1
+
+
+def stats():
+    """
+    Hits and misses of the token cache in this process.
+    """
+    with _stats_lock:
+        return {'hits': _stats['hits'], 'misses': _stats['misses']}
+
+
+def forget(*keys):
+    caches[CACHE_ALIAS].delete_many([token_cache_key(key) for key in keys])
+
+
+def check_user(user):
+    if user is None:
+        raise exceptions.AuthenticationFailed('Invalid token.')
+    if not user.is_active:
+        raise exceptions.AuthenticationFailed('User inactive or deleted.')
+    return user
+
+
+def token_user(key):
+    """
+    The user of the token `key`, None if there is no such token.
+    """
+    cache = caches[CACHE_ALIAS]
+    cache_key = token_cache_key(key)
+    user = cache.get(cache_key)
+    if user is not None:
+        count('hits')
+        return user
+
+    count('misses')
+    try:
+        token = Token.objects.select_related('user').get(key=key)
+    except Token.DoesNotExist:
+        return None
+    cache.set(cache_key, token.user)
+    return token.user
+
+
+async def atoken_user(key):
+    """
+    `token_user` for async views.
+    """
+    cache = caches[CACHE_ALIAS]
+    cache_key = token_cache_key(key)
+    user = await cache.aget(cache_key)
+    if user is not None:
+        count('hits')
+        return user
+
+    count('misses')
+    try:
+        token = await Token.objects.select_related('user').aget(key=key)
+    except Token.DoesNotExist:
+        return None
+    await cache.aset(cache_key, token.user)
+    return token.user
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    `TokenAuthentication` without the token and user query when the token is cached.
+    """
+
+    def authenticate_credentials(self, key):
+        user = check_user(token_user(key))
+        return user, Token(key=key, user=user)
@@ -1,3 +1,84 @@
-from django.test import TestCase
+from django.core.cache import caches
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
 
-# Create your tests here.
+from portfolio.testing import QueryCountTestCase
+from snippets.models import Snippet
+from . import authentication
+from .models import CustomUser
+from .urls import router
+
+
+class AccountsQueryCountTests(QueryCountTestCase):
+    query_budgets = {
+        '': 3,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('user@example.com', 'password')
+        cls.add_users(2)
+
+    @staticmethod
+    def add_users(count):
+        for i in range(count):
+            user = CustomUser.objects.create_user(f'user{CustomUser.objects.count()}@example.com', 'password')
+            Snippet.objects.create(title='Snippet', code='pass', owner=user)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def test_routes_have_a_budget(self):
+        self.assertRoutesCovered(router, self.query_budgets)
+
+    def test_list(self):
+        self.assertConstantQueries('/api/users/', self.query_budgets[''], lambda: self.add_users(6))
+
+    def test_detail(self):
+        self.assertQueryCount(f'/api/users/{self.user.pk}/', 2)
+
+
+class CachedTokenAuthenticationTests(APITestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('token@example.com', 'password')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get(self):
+        return self.client.get(f'/api/users/{self.user.pk}/')
+
+    def test_cached_token_skips_the_lookup(self):
+        before = authentication.stats()
+        with self.assertNumQueries(3):
+            self.assertEqual(self.get().status_code, 200)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.get().status_code, 200)
+
+        after = authentication.stats()
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+
+    def test_logout_forgets_the_token(self):
+        self.get()
+        self.assertEqual(self.client.post('/auth/token/logout/').status_code, 204)
+        self.assertEqual(self.get().status_code, 401)
+
+    def test_deactivation_forgets_the_user(self):
+        self.get()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get().status_code, 401)
+
+    def test_password_change_refreshes_the_user(self):
+        self.get()
+        self.user.set_password('new password')
+        self.user.save()
+        self.get()
+        cached = caches[authentication.CACHE_ALIAS].get(authentication.token_cache_key(self.token.key))
+        self.assertTrue(cached.check_password('new password'))
+
+    def test_unknown_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token unknown')
+        self.assertEqual(self.get().status_code, 401)
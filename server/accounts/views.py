@@ -8,7 +8,7 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
     """
     This viewset automatically provides `list` and `retrieve` actions.
     """
-    queryset = CustomUser.objects.all()
+    queryset = CustomUser.objects.prefetch_related('snippets')
     serializer_class = CustomUserSerializer
 
 
@@ -0,0 +1,175 @@
+"""
+Synthetic users, budgets, entries, recurring entries, allocations and snippets for the benchmarks.
+
+The data is reproducible for a given seed. Entries are bulk inserted and
+announced with `entries_changed`, like the imports, so the balances, rollups
+and search index are maintained as for API writes.
+"""
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+
+from accounts.models import CustomUser
+from budgets import recurring
+from budgets.models import Allocation, Budget, Category, Entry, RecurringEntry
+from budgets.signals import entries_changed
+from snippets.models import Snippet
+
+PASSWORD = 'benchmark'
+BATCH_SIZE = 1000
+
+# (title, weight, typical amount, income)
+CATEGORIES = [
+    ('Groceries', 30, 40, False),
+    ('Restaurants', 12, 25, False),
+    ('Transport', 12, 15, False),
+    ('Utilities', 5, 80, False),
+    ('Rent', 2, 900, False),
+    ('Health', 4, 60, False),
+    ('Leisure', 8, 35, False),
+    ('Gifts', 3, 50, False),
+    ('Salary', 2, 2500, True),
+    ('Refunds', 2, 30, True),
+]
+MERCHANTS = ['Corner shop', 'Supermarket', 'Bakery', 'Train station', 'Pharmacy', 'Cinema', 'Bookshop', 'Cafe',
+             'Electricity company', 'Landlord', 'Employer', 'Online store', 'Pizzeria', 'Fuel station']
+
+# (description, category title, amount, income, day of month) of the monthly rules of each budget
+RECURRING = [
+    ('Rent', 'Rent', Decimal('950.00'), False, 1),
+    ('Salary', 'Salary', Decimal('2600.00'), True, 25),
+    ('Streaming subscription', 'Leisure', Decimal('12.99'), False, 15),
+]
+
+# Language: line template, formatted with the line number
+SNIPPET_LINES = {
+    'python': 'def step_{0}(value):\n    return value * {0} + len(str(value))\n',
+    'javascript': 'const step{0} = (value) => value * {0} + String(value).length;\n',
+    'sql': "SELECT id, amount FROM entries WHERE budget_id = {0} AND description LIKE '%shop%';\n",
+    'go': 'func step{0}(value int) int {{ return value*{0} + len(fmt.Sprint(value)) }}\n',
+    'rust': 'fn step_{0}(value: i64) -> i64 {{ value * {0} + value.to_string().len() as i64 }}\n',
+    'html': '<li class="item-{0}"><a href="/entries/{0}/">Entry {0}</a></li>\n',
+}
+
+
+def benchmark_users(prefix):
+    return CustomUser.objects.filter(email__startswith=prefix, email__endswith='@example.com')
+
+
+def clear(prefix):
+    """
+    Delete the users of a previous run and everything they own.
+    """
+    benchmark_users(prefix).delete()
+
+
+def categories():
+    titles = [title for title, *_ in CATEGORIES]
+    existing = set(Category.objects.filter(title__in=titles).values_list('title', flat=True))
+    for title in titles:
+        if title not in existing:
+            Category.objects.create(title=title)
+    ids = dict(Category.objects.filter(title__in=titles).values_list('title', 'id'))
+    return [(ids[title], weight, amount, income) for title, weight, amount, income in CATEGORIES]
+
+
+def entry_date(rng, days, today):
+    # More entries in the recent past, the way the data of an active user accumulates
+    return today - timedelta(days=int(rng.triangular(0, days, 0)))
+
+
+def build_entries(rng, user, budget, count, days, category_specs, today):
+    weights = [weight for _, weight, _, _ in category_specs]
+    for _ in range(count):
+        category_id, _, typical, income = rng.choices(category_specs, weights)[0]
+        amount = Decimal(str(round(rng.lognormvariate(0, 0.6) * typical, 2))).quantize(Decimal('0.01'))
+        yield Entry(description=f'{rng.choice(MERCHANTS)} {rng.randint(1, 999)}'[:100],
+                    amount=max(amount, Decimal('0.01')), date=entry_date(rng, days, today), is_positive=income,
+                    budget=budget, category_id=category_id, owner=user)
+
+
+def snippet_code(rng, language):
+    # Log-normal sizes: mostly short snippets, a few thousand line ones
+    lines = min(max(int(rng.lognormvariate(3, 1.2)), 1), 5000)
+    return ''.join(SNIPPET_LINES[language].format(i) for i in range(lines))
+
+
+def recurring_rules(budgets, category_ids, start_date):
+    """
+    Monthly rules since `start_date`, not materialised: left for `materialise_recurring_entries`.
+    """
+    rules = [RecurringEntry(description=description, amount=amount, is_positive=income, day_of_month=day,
+                            start_date=start_date, budget=budget, category_id=category_ids[category],
+                            owner_id=budget.owner_id)
+             for budget in budgets for description, category, amount, income, day in RECURRING]
+    for rule in rules:
+        rule.next_date = recurring.first_occurrence(rule)
+    RecurringEntry.objects.bulk_create(rules)
+
+
+def allocations(budgets, category_specs):
+    """
+    A monthly allocation of about a month of typical spending per expense category.
+    """
+    Allocation.objects.bulk_create([
+        Allocation(amount=Decimal(typical * weight), budget=budget, category_id=category_id, owner_id=budget.owner_id)
+        for budget in budgets for category_id, weight, typical, income in category_specs if not income])
+
+
+def write_entries(entries):
+    Entry.objects.bulk_create(entries)
+    entries_changed.send(sender=Entry, added=[entry.tracked_state() for entry in entries], removed=[])
+
+
+def generate(users=10, budgets=2, entries=500, snippets=5, days=730, prefix='bench', seed=0):
+    """
+    Create `users` users, each with a token, `budgets` budgets of `entries` entries over the
+    last `days` days, of monthly recurring entries over the same period and of allocations
+    for the expense categories, and `snippets` snippets of various sizes and languages.
+    Returns the counts.
+    """
+    rng = random.Random(seed)
+    today = date.today()
+    password = make_password(PASSWORD)
+    category_specs = categories()
+    category_ids = dict(Category.objects.values_list('title', 'id'))
+    start = benchmark_users(prefix).count()
+
+    with transaction.atomic():
+        CustomUser.objects.bulk_create([CustomUser(email=f'{prefix}{start + i}@example.com', password=password)
+                                        for i in range(users)])
+        created = list(benchmark_users(prefix).order_by('id')[start:])
+        Token.objects.bulk_create([Token(key=Token.generate_key(), user=user) for user in created])
+
+        batch, all_budgets = [], []
+        for user in created:
+            for i in range(budgets):
+                budget = Budget.objects.create(title=f'Budget {i + 1}', description='Benchmark budget', owner=user)
+                all_budgets.append(budget)
+                for entry in build_entries(rng, user, budget, entries, days, category_specs, today):
+                    batch.append(entry)
+                    if len(batch) >= BATCH_SIZE:
+                        write_entries(batch)
+                        batch = []
+
+            for i in range(snippets):
+                language = rng.choice(list(SNIPPET_LINES))
+                Snippet.objects.create(title=f'{language} snippet {i + 1}', code=snippet_code(rng, language),
+                                       language=language, linenos=rng.random() < 0.3, owner=user)
+        if batch:
+            write_entries(batch)
+        recurring_rules(all_budgets, category_ids, today - timedelta(days=days))
+        allocations(all_budgets, category_specs)
+
+    return {
+        'users': users,
+        'budgets': users * budgets,
+        'entries': users * budgets * entries,
+        'snippets': users * snippets,
+        'recurring_entries': users * budgets * len(RECURRING),
+        'allocations': users * budgets * sum(not income for *_, income in CATEGORIES),
+    }
@@ -0,0 +1,103 @@
+"""
+Request drivers and latency summaries shared by the benchmark commands.
+"""
+import http.client
+import itertools
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summary(latencies, elapsed):
+    """
+    Throughput and latency percentiles of requests that took `elapsed` seconds in all.
+    """
+    ordered = sorted(latencies)
+    if not ordered:
+        return {'requests': 0}
+    return {
+        'requests': len(ordered),
+        'requests_per_second': round(len(ordered) / elapsed, 1),
+        'p50_ms': round(statistics.median(ordered) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 3),
+    }
+
+
+def in_process(client, path, requests):
+    """
+    Send `requests` GET requests one after the other through the test `client`, counting the queries.
+    """
+    response = read(client.get(path))
+    latencies, queries = [], []
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        with CaptureQueriesContext(connection) as context:
+            request_started = time.perf_counter()
+            response = read(client.get(path))
+            latencies.append(time.perf_counter() - request_started)
+        queries.append(len(context.captured_queries))
+    elapsed = time.perf_counter() - started
+
+    return {**summary(latencies, elapsed), 'status': response.status_code, 'queries': max(queries, default=0)}
+
+
+def read(response):
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def over_http(base_url, path, headers, requests, concurrency):
+    """
+    Send `requests` GET requests over `concurrency` keep-alive connections to the server at `base_url`.
+    """
+    url = urlsplit(base_url)
+    connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+    counter = itertools.count()
+    latencies, statuses = [], set()
+    lock = threading.Lock()
+
+    def get(connection):
+        connection.request('GET', path, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+
+    def worker():
+        connection = connection_class(url.hostname, url.port)
+        try:
+            while next(counter) < requests:
+                started = time.perf_counter()
+                status = get(connection)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    statuses.add(status)
+        finally:
+            connection.close()
+
+    warm_up = connection_class(url.hostname, url.port)
+    try:
+        status = get(warm_up)
+    finally:
+        warm_up.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {**summary(latencies, elapsed), 'status': status, 'statuses': sorted(statuses)}
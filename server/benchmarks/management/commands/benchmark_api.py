@@ -0,0 +1,70 @@
+import json
+import subprocess
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from benchmarks import data, drivers
+from benchmarks.routes import routes
+
+
+class Command(BaseCommand):
+    help = ('Request every GET endpoint of the API in process and optionally over HTTP, and report the '
+            'throughput, p50/p95/p99 latencies and query counts as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', help='User to request as, the first generated user by default')
+        parser.add_argument('--prefix', default='bench')
+        parser.add_argument('--requests', type=int, default=20, help='Requests per endpoint')
+        parser.add_argument('--http', metavar='BASE_URL', help='Also load a running server, e.g. http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=8, help='Connections of the HTTP load')
+        parser.add_argument('--host', default='localhost', help='Host header of the in process requests')
+        parser.add_argument('--only', nargs='+', metavar='NAME', help='Only these routes')
+        parser.add_argument('--output', help='Write the JSON to this file')
+
+    def handle(self, *args, **options):
+        users = data.benchmark_users(options['prefix'])
+        if options['email']:
+            users = users.model.objects.filter(email=options['email'])
+        user = users.order_by('id').first()
+        if user is None:
+            raise CommandError('No user to request as, run generate_benchmark_data first')
+
+        token, _ = Token.objects.get_or_create(user=user)
+        headers = {'Authorization': f'Token {token.key}'}
+        client = APIClient(SERVER_NAME=options['host'])
+        client.credentials(HTTP_AUTHORIZATION=headers['Authorization'])
+
+        results = {}
+        for name, path in routes(user):
+            if options['only'] and name not in options['only']:
+                continue
+            result = {'path': path, 'in_process': drivers.in_process(client, path, options['requests'])}
+            if options['http']:
+                result['http'] = drivers.over_http(options['http'], path, headers, options['requests'],
+                                                   options['concurrency'])
+            results[name] = result
+
+        report = {
+            'commit': self.commit(),
+            'user': user.email,
+            'requests': options['requests'],
+            'concurrency': options['concurrency'] if options['http'] else None,
+            'routes': results,
+        }
+        output = json.dumps(report, indent=2, sort_keys=True)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
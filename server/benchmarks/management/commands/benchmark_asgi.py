@@ -0,0 +1,77 @@
+import importlib.util
+import json
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from benchmarks import drivers
+
+# (name, application, uvicorn interface, URL prefix of the endpoints)
+SERVERS = [
+    ('wsgi', 'portfolio.wsgi:application', 'wsgi', '/api/budgets/'),
+    ('asgi_sync_views', 'portfolio.asgi:application', 'asgi3', '/api/budgets/'),
+    ('asgi_async_views', 'portfolio.asgi:application', 'asgi3', '/api/budgets/async/'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Load the budget read endpoints under a local uvicorn, through WSGI and ASGI, and compare the throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='User whose budgets and entries are requested')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint and server')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--port', type=int, default=8765)
+
+    def handle(self, *args, **options):
+        if importlib.util.find_spec('uvicorn') is None:
+            raise CommandError('The benchmark runs the application with uvicorn, install it first.')
+
+        try:
+            user = get_user_model().objects.get(email=options['email'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'No user {options["email"]}')
+
+        token, _ = Token.objects.get_or_create(user=user)
+        budget = user.budgets.order_by('created').first()
+        paths = ['entries/', 'budgets/'] + ([f'budgets/{budget.pk}/overview/'] if budget else [])
+
+        results = []
+        for name, application, interface, prefix in SERVERS:
+            server = self.start(application, interface, options['port'])
+            try:
+                for path in paths:
+                    stats = drivers.over_http(f'http://127.0.0.1:{options["port"]}', prefix + path,
+                                              {'Authorization': f'Token {token.key}'}, options['requests'],
+                                              options['concurrency'])
+                    results.append({'server': name, 'path': path, **stats})
+            finally:
+                server.terminate()
+                server.wait()
+
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def start(self, application, interface, port):
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', application, '--interface', interface, '--port', str(port),
+             '--log-level', 'warning'],
+            cwd=settings.BASE_DIR)
+
+        deadline = time.monotonic() + 20
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'uvicorn exited with {server.returncode}')
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+                return server
+            except OSError:
+                time.sleep(0.1)
+
+        server.terminate()
+        raise CommandError('uvicorn did not start')
@@ -0,0 +1,82 @@
+import json
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from benchmarks import drivers
+from budgets.models import Entry
+
+
+class Command(BaseCommand):
+    help = ('Run concurrent request cycles with a connection per request, then with the configured '
+            'persistent connections, and compare the throughput and the connections opened')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Request cycles per mode')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        # Shared by the connections of every thread, which read it when they connect
+        settings_dict = connections[alias].settings_dict
+        configured = settings_dict['CONN_MAX_AGE']
+
+        results = []
+        try:
+            for mode, max_age in [('connection_per_request', 0), ('configured', configured)]:
+                settings_dict['CONN_MAX_AGE'] = max_age
+                stats = self.load(alias, options['requests'], options['concurrency'])
+                results.append({'mode': mode, 'conn_max_age': max_age, **stats})
+        finally:
+            settings_dict['CONN_MAX_AGE'] = configured
+
+        self.stdout.write(json.dumps({'vendor': connections[alias].vendor, 'results': results}, indent=2))
+
+    def load(self, alias, requests, concurrency):
+        """
+        Request cycles as Django runs them: the connection is closed or kept by the request
+        signals, around a primary key lookup.
+        """
+        remaining = iter(range(requests))
+        latencies, opened = [], []
+        lock = threading.Lock()
+
+        def count_connection(sender, connection, **kwargs):
+            if connection.alias == alias:
+                with lock:
+                    opened.append(1)
+
+        def worker():
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        break
+                started = time.perf_counter()
+                request_started.send(sender=self.__class__)
+                try:
+                    Entry.objects.using(alias).filter(pk=1).exists()
+                finally:
+                    request_finished.send(sender=self.__class__)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+            connections[alias].close()
+
+        connection_created.connect(count_connection)
+        try:
+            threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            connection_created.disconnect(count_connection)
+
+        return {**drivers.summary(latencies, elapsed), 'connections_opened': len(opened)}
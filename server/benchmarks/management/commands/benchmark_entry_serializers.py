@@ -0,0 +1,69 @@
+import json
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from budgets.models import Entry
+from budgets.serializers import EntrySerializer, EntryValuesSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare the rows per second of EntrySerializer and the EntryValuesSerializer fast path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 10000])
+        parser.add_argument('--repeat', type=int, default=5, help='Best of this many runs')
+
+    def handle(self, *args, **options):
+        fast = EntryValuesSerializer()
+        results = []
+
+        for size in options['sizes']:
+            instances, rows = self.build(size)
+
+            if JSONRenderer().render(EntrySerializer(instances, many=True).data) != JSONRenderer().render(fast.many(rows)):
+                raise CommandError(f'The fast path output differs for {size} rows')
+
+            serializer = self.measure(lambda: EntrySerializer(instances, many=True).data, size, options['repeat'])
+            values = self.measure(lambda: fast.many(rows), size, options['repeat'])
+            results.append({
+                'rows': size,
+                'serializer_rows_per_second': round(serializer),
+                'values_rows_per_second': round(values),
+                'speedup': round(values / serializer, 1),
+            })
+
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def build(self, size):
+        """
+        Unsaved entries and the matching `.values()` rows, so nothing is measured but the serialization.
+        """
+        owner = get_user_model()(id=1, email='benchmark@example.com')
+        now = timezone.now()
+        instances, rows = [], []
+
+        for i in range(size):
+            entry = Entry(id=i + 1, description=f'Entry {i}', amount=Decimal(i % 997) + Decimal('0.25'),
+                          date=date(2022, 1, 1) + timedelta(days=i % 365), is_positive=i % 3 == 0,
+                          created=now, updated=now, budget_id=1 + i % 3, category_id=1 + i % 7, owner=owner)
+            instances.append(entry)
+            rows.append({'id': entry.id, 'description': entry.description, 'amount': entry.amount, 'date': entry.date,
+                         'is_positive': entry.is_positive, 'created': now, 'updated': now,
+                         'budget_id': entry.budget_id, 'category_id': entry.category_id, 'owner__email': owner.email})
+
+        return instances, rows
+
+    def measure(self, serialize, size, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            serialize()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return size / best
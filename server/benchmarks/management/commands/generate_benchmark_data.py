@@ -0,0 +1,31 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from benchmarks import data
+
+
+class Command(BaseCommand):
+    help = 'Create synthetic users, budgets, entries and snippets for the benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--budgets', type=int, default=2, help='Budgets per user')
+        parser.add_argument('--entries', type=int, default=500, help='Entries per budget')
+        parser.add_argument('--snippets', type=int, default=5, help='Snippets per user')
+        parser.add_argument('--days', type=int, default=730, help='Entries are dated within this many days')
+        parser.add_argument('--prefix', default='bench', help='Emails are <prefix><n>@example.com')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--clear', action='store_true', help='Delete the users of previous runs first')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            data.clear(options['prefix'])
+
+        started = time.perf_counter()
+        counts = data.generate(users=options['users'], budgets=options['budgets'], entries=options['entries'],
+                               snippets=options['snippets'], days=options['days'], prefix=options['prefix'],
+                               seed=options['seed'])
+        counts['seconds'] = round(time.perf_counter() - started, 2)
+        self.stdout.write(json.dumps(counts, indent=2))
@@ -0,0 +1,61 @@
+"""
+The GET endpoints of the API, with the objects of a user filled in their URLs.
+"""
+from django.urls import reverse
+
+from accounts.urls import router as accounts_router
+from budgets.models import Allocation, Budget, Category, Entry, RecurringEntry
+from budgets.urls import router as budgets_router
+from snippets.models import Snippet
+from snippets.urls import router as snippets_router
+
+ROUTERS = [accounts_router, snippets_router, budgets_router]
+
+# Function views of a budget
+BUDGET_VIEWS = ['budget_overview', 'budget_analytics', 'budget_balance', 'budget_allowances', 'async_budget_overview']
+LIST_VIEWS = ['async_entry_list', 'async_budget_list', 'changes']
+
+
+def model_of(viewset):
+    queryset = getattr(viewset, 'queryset', None)
+    return queryset.model if queryset is not None else viewset.serializer_class.Meta.model
+
+
+def routes(user):
+    """
+    Return (name, path) of the list, detail and GET action routes of the routers and of the
+    budget views, the detail routes for the first object of `user`, skipped when it has none.
+    """
+    budget = Budget.objects.filter(owner=user).order_by('id').first()
+    objects = {
+        type(user): user,
+        Budget: budget,
+        Category: Category.objects.order_by('id').first(),
+        Entry: Entry.objects.filter(owner=user).order_by('id').first(),
+        RecurringEntry: RecurringEntry.objects.filter(owner=user).order_by('id').first(),
+        Allocation: Allocation.objects.filter(owner=user).order_by('id').first(),
+        Snippet: Snippet.objects.filter(owner=user).order_by('id').first(),
+    }
+    found = []
+
+    for router in ROUTERS:
+        for prefix, viewset, basename in router.registry:
+            obj = objects.get(model_of(viewset))
+            found.append((f'{basename}-list', reverse(f'{basename}-list')))
+            if obj is not None:
+                found.append((f'{basename}-detail', reverse(f'{basename}-detail', kwargs={'pk': obj.pk})))
+
+            for action in viewset.get_extra_actions():
+                if 'get' not in action.mapping:
+                    continue
+                name = f'{basename}-{action.url_name}'
+                if not action.detail:
+                    found.append((name, reverse(name)))
+                elif obj is not None:
+                    found.append((name, reverse(name, kwargs={'pk': obj.pk})))
+
+    found += [(name, reverse(name)) for name in LIST_VIEWS]
+    if budget is not None:
+        found += [(name, reverse(name, kwargs={'budget_id': budget.pk})) for name in BUDGET_VIEWS]
+
+    return found
@@ -0,0 +1,50 @@
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from accounts.models import CustomUser
+from budgets.models import Budget, Entry
+from snippets.models import Snippet
+from . import data
+from .routes import ROUTERS
+
+
+class BenchmarkTests(TestCase):
+    def test_generate(self):
+        counts = data.generate(users=2, budgets=2, entries=30, snippets=2, days=90)
+
+        self.assertEqual(counts, {'users': 2, 'budgets': 4, 'entries': 120, 'snippets': 4, 'recurring_entries': 12,
+                                  'allocations': 32})
+        users = data.benchmark_users('bench')
+        self.assertEqual(users.count(), 2)
+        self.assertEqual(Entry.objects.filter(owner__in=users).count(), 120)
+        self.assertEqual(Snippet.objects.filter(owner__in=users).count(), 4)
+        # Derived data maintained as for the API writes
+        budget = Budget.objects.filter(owner__in=users).first()
+        self.assertEqual(budget.balance, budget.base + sum(
+            (entry.amount if entry.is_positive else -entry.amount) for entry in budget.entries.all()))
+
+        data.generate(users=1, budgets=1, entries=1, snippets=0)
+        self.assertEqual(users.count(), 3)
+        data.clear('bench')
+        self.assertFalse(CustomUser.objects.filter(email__startswith='bench').exists())
+
+    def test_benchmark_api(self):
+        data.generate(users=1, budgets=1, entries=20, snippets=1)
+        out = StringIO()
+        call_command('benchmark_api', requests=2, host='testserver', stdout=out)
+        report = json.loads(out.getvalue())
+
+        basenames = {basename for router in ROUTERS for _, _, basename in router.registry}
+        for basename in basenames:
+            self.assertIn(f'{basename}-list', report['routes'])
+            self.assertIn(f'{basename}-detail', report['routes'])
+        self.assertIn('budget_overview', report['routes'])
+
+        for name, result in report['routes'].items():
+            with self.subTest(route=name):
+                self.assertEqual(result['in_process']['status'], 200)
+                self.assertEqual(result['in_process']['requests'], 2)
+                self.assertIn('p99_ms', result['in_process'])
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Budget, Category, Entry
+from .models import Allocation, ArchivedEntry, Budget, Category, Entry, RecurringEntry, Tombstone
 
 admin.site.register(Category)
 
@@ -16,3 +16,28 @@ class BudgetAdmin(admin.ModelAdmin):
     list_display = ('description', 'budget', 'owner')
     list_filter = ('is_positive', 'date', 'owner')
     search_fields = ('description',)
+
+
+@admin.register(ArchivedEntry)
+class ArchivedEntryAdmin(admin.ModelAdmin):
+    list_display = ('description', 'date', 'budget', 'owner')
+    list_filter = ('is_positive', 'owner')
+    search_fields = ('description',)
+
+
+@admin.register(RecurringEntry)
+class RecurringEntryAdmin(admin.ModelAdmin):
+    list_display = ('description', 'frequency', 'next_date', 'budget', 'owner')
+    list_filter = ('frequency', 'owner')
+
+
+@admin.register(Allocation)
+class AllocationAdmin(admin.ModelAdmin):
+    list_display = ('budget', 'category', 'amount', 'owner')
+    list_filter = ('owner',)
+
+
+@admin.register(Tombstone)
+class TombstoneAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'object_id', 'scope', 'change_seq', 'deleted')
+    list_filter = ('kind',)
@@ -0,0 +1,129 @@
+"""
+Entry totals per period, aggregated by the database and returned as parallel arrays.
+"""
+import itertools
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Trunc
+
+RESOLUTIONS = ('day', 'week', 'month', 'quarter', 'year')
+# Months between two buckets, the others are stepped in days
+MONTH_STEPS = {'month': 1, 'quarter': 3, 'year': 12}
+DAY_STEPS = {'day': 1, 'week': 7}
+# The series is dense, so a fine resolution over a long range would return a huge response.
+MAX_PERIODS = 5000
+CENT = Decimal('0.01')
+
+
+class TooManyPeriods(ValueError):
+    pass
+
+
+def add_months(date, months):
+    month = date.month - 1 + months
+    return date.replace(year=date.year + month // 12, month=month % 12 + 1)
+
+
+def next_period(date, resolution):
+    if resolution in DAY_STEPS:
+        return date + timedelta(days=DAY_STEPS[resolution])
+    return add_months(date, MONTH_STEPS[resolution])
+
+
+def year_before(date, resolution):
+    """
+    The bucket a year before `date`, None when there is none (February 29).
+    """
+    if resolution == 'week':
+        return date - timedelta(weeks=52)
+    try:
+        return date.replace(year=date.year - 1)
+    except ValueError:
+        return None
+
+
+def periods(first, last, resolution):
+    """
+    All the bucket starts from `first` to `last` included.
+    """
+    result = []
+    current = first
+    while current <= last:
+        result.append(current)
+        if len(result) > MAX_PERIODS:
+            raise TooManyPeriods(f'More than {MAX_PERIODS} periods, use a coarser resolution or a shorter range.')
+        current = next_period(current, resolution)
+    return result
+
+
+def moving_average(values, window):
+    """
+    Trailing average over `window` values, None until there are enough of them.
+    """
+    result, total = [], Decimal(0)
+    for i, value in enumerate(values):
+        total += value
+        if i >= window:
+            total -= values[i - window]
+        result.append(total / window if i >= window - 1 else None)
+    return result
+
+
+def totals(queryset, resolution, by_category=False):
+    """
+    Sum the entries of `queryset` per bucket of `resolution`, in a single grouped query.
+    """
+    group = ['period', 'category__title'] if by_category else ['period']
+    return queryset.annotate(period=Trunc('date', resolution)).values(*group).annotate(
+        positive=Sum('amount', filter=Q(is_positive=True), default=0),
+        negative=Sum('amount', filter=Q(is_positive=False), default=0),
+        count=Count('id'),
+    ).order_by('period')
+
+
+def series(querysets, resolution, window=None, by_category=False):
+    """
+    Dense arrays of the totals per period of the entries of `querysets`, e.g. the entries
+    and the archived entries, with an optional moving average of the net amounts and the
+    net amounts of the same period a year before.
+    """
+    rows = defaultdict(lambda: [Decimal(0), Decimal(0), 0])
+    categories = defaultdict(lambda: defaultdict(Decimal))
+
+    for row in itertools.chain.from_iterable(totals(queryset, resolution, by_category) for queryset in querysets):
+        bucket = rows[row['period']]
+        bucket[0] += row['positive']
+        bucket[1] += row['negative']
+        bucket[2] += row['count']
+        if by_category:
+            categories[row['category__title']][row['period']] += row['positive'] - row['negative']
+
+    dates = periods(min(rows), max(rows), resolution) if rows else []
+    empty = [Decimal(0), Decimal(0), 0]
+    positive = [rows.get(date, empty)[0] for date in dates]
+    negative = [rows.get(date, empty)[1] for date in dates]
+    net = [p - n for p, n in zip(positive, negative)]
+    by_date = dict(zip(dates, net))
+
+    data = {
+        'resolution': resolution,
+        'periods': [date.isoformat() for date in dates],
+        'positive': [_amount(value) for value in positive],
+        'negative': [_amount(value) for value in negative],
+        'net': [_amount(value) for value in net],
+        'count': [rows.get(date, empty)[2] for date in dates],
+        'previous_year': [_amount(by_date.get(year_before(date, resolution))) for date in dates],
+    }
+    if window:
+        data['moving_average'] = [_amount(value) for value in moving_average(net, window)]
+    if by_category:
+        data['categories'] = {title: [_amount(values.get(date, Decimal(0))) for date in dates]
+                              for title, values in sorted(categories.items())}
+    return data
+
+
+def _amount(value):
+    return None if value is None else str(value.quantize(CENT))
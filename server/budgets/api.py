@@ -1,15 +1,29 @@
-from django.db.models import Count, Sum, Q
-from django.db.models.functions import TruncDay, TruncMonth
-from rest_framework import viewsets, permissions
-from rest_framework.decorators import api_view, permission_classes
+import itertools
+from datetime import date
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, OuterRef, ProtectedError, Subquery, Sum, Q
+from django.http import StreamingHttpResponse
+from django.db.models.functions import Coalesce, TruncDay, TruncMonth
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from django_filters.utils import translate_validation
 
-from .models import Budget, Category, Entry
-from .serializers import BudgetSerializer, CategorySerializer, EntrySerializer, \
-    BudgetOverviewSumSerializer, BudgetOverviewMonthlySumSerializer
+from .models import Allocation, ArchivedEntry, Budget, Category, Entry, MonthlyRollup, RecurringEntry
+from .serializers import BudgetSerializer, CategorySerializer, EntrySerializer, EntryValuesSerializer, \
+    BudgetOverviewSumSerializer, BudgetOverviewMonthlySumSerializer, BalanceQuerySerializer, BudgetBalanceSerializer, \
+    AnalyticsQuerySerializer, RecurringEntrySerializer, AllocationSerializer, AllowanceQuerySerializer, \
+    BudgetAllowancesSerializer, BudgetValuesSerializer
 from .filters import EntryFilter
+from .pagination import PageNumberOrKeysetPagination
 from .permissions import IsOwner, IsAdminUserOrReadOnly
+from .batch import EntryBatch
+from .exporters import EXPORTERS, parquet_available
+from .importers import EntryImporter, PARSERS, text_stream
+from . import analytics, archive, balances, caching, categories, rollups, sync
 
 
 class BudgetViewSet(viewsets.ModelViewSet):
@@ -20,15 +34,21 @@ class BudgetViewSet(viewsets.ModelViewSet):
     queryset = Budget.objects.all()
     serializer_class = BudgetSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwner]
+    pagination_class = PageNumberOrKeysetPagination
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
+    def list(self, request, *args, **kwargs):
+        return caching.cached_response(request, [f'user:{request.user.pk}'],
+                                       lambda: super(BudgetViewSet, self).list(request, *args, **kwargs))
+
     def get_queryset(self):
-        return Budget.objects.filter(owner=self.request.user).annotate(
+        return Budget.objects.filter(owner=self.request.user).select_related('owner').annotate(
             total_entries=Count('entries'),
-            total_amount=Sum('entries__amount'),
-        )
+            # Signed sum of the entries, from the maintained balance
+            total_amount=ExpressionWrapper(F('balance') - F('base'), output_field=DecimalField()),
+        ).order_by('created')
 
 
 class CategoryViewSet(viewsets.ModelViewSet):
@@ -41,6 +61,40 @@ class CategoryViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated, IsAdminUserOrReadOnly]
     pagination_class = None
 
+    def perform_destroy(self, instance):
+        try:
+            instance.delete()
+        except ProtectedError:
+            raise ValidationError({'category': 'The category has archived entries and can\'t be deleted.'})
+
+
+class RecurringEntryViewSet(viewsets.ModelViewSet):
+    """
+    Rules of the entries created by `manage.py materialise_recurring_entries`.
+    """
+    serializer_class = RecurringEntrySerializer
+    permission_classes = [permissions.IsAuthenticated, IsOwner]
+
+    def get_queryset(self):
+        return RecurringEntry.objects.filter(owner=self.request.user).select_related('owner')
+
+    def perform_create(self, serializer):
+        serializer.save(owner=self.request.user)
+
+
+class AllocationViewSet(viewsets.ModelViewSet):
+    """
+    Monthly amounts allowed per category of a budget, see `budget_allowances`.
+    """
+    serializer_class = AllocationSerializer
+    permission_classes = [permissions.IsAuthenticated, IsOwner]
+
+    def get_queryset(self):
+        return Allocation.objects.filter(owner=self.request.user).select_related('owner')
+
+    def perform_create(self, serializer):
+        serializer.save(owner=self.request.user)
+
 
 class EntryViewSet(viewsets.ModelViewSet):
     """
@@ -50,32 +104,335 @@ class EntryViewSet(viewsets.ModelViewSet):
     serializer_class = EntrySerializer
     permission_classes = [permissions.IsAuthenticated, IsOwner]
     filterset_class = EntryFilter
+    pagination_class = PageNumberOrKeysetPagination
+    values_serializer = EntryValuesSerializer()
 
     def get_queryset(self):
         user = self.request.user
-        return Entry.objects.filter(owner=user)
+        return Entry.objects.filter(owner=user).select_related('owner')
+
+    def list(self, request, *args, **kwargs):
+        # Reads skip the model instances and the per field serializer machinery, see EntryValuesSerializer.
+        queryset = self.values_serializer.values(filter_entries(request, self.get_queryset()))
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.values_serializer.many(page))
+
+        return Response(self.values_serializer.many(queryset))
+
+    def retrieve(self, request, *args, **kwargs):
+        # get_queryset only returns the entries of the user, which is what IsOwner checks.
+        row = get_object_or_404(self.values_serializer.values(self.get_queryset()), pk=kwargs[self.lookup_field])
+        return Response(self.values_serializer.to_representation(row))
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_entries(self, request):
+        """
+        Create entries from an uploaded CSV, QIF or OFX `file`.
+
+        `budget` and `category` give the defaults for rows without these columns.
+        Valid rows are created and the invalid ones are reported with their line number.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': 'No file was submitted.'})
+
+        file_format = (request.data.get('file_format') or upload.name.rsplit('.', 1)[-1]).lower()
+        if file_format not in PARSERS:
+            raise ValidationError({'file_format': f'Supported formats are {", ".join(PARSERS)}.'})
+
+        parse, date_format = PARSERS[file_format]
+        importer = EntryImporter(request.user, budget=request.data.get('budget'), category=request.data.get('category'),
+                                 date_format=request.data.get('date_format') or date_format)
+
+        stream = text_stream(upload)
+        try:
+            result = importer.run(parse(stream))
+        except UnicodeDecodeError:
+            raise ValidationError({'file': 'The file must be UTF-8 encoded.'})
+        finally:
+            stream.detach()
+
+        return Response(result, status=status.HTTP_201_CREATED if result['created'] else status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream the entries matching the filters as `file_format` csv (default), jsonl or parquet.
+        """
+        file_format = request.query_params.get('file_format', 'csv').lower()
+        if file_format not in EXPORTERS:
+            raise ValidationError({'file_format': f'Supported formats are {", ".join(EXPORTERS)}.'})
+        if file_format == 'parquet' and not parquet_available():
+            raise ValidationError({'file_format': 'Parquet export requires pyarrow.'})
+
+        export, content_type, extension = EXPORTERS[file_format]
+        entries = filter_entries(request, self.get_queryset())
+        response = StreamingHttpResponse(export(entries), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="entries.{extension}"'
+        return response
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Apply a list of create, update and delete operations in one transaction.
+        Nothing is written if one of them is invalid.
+        """
+        batch = EntryBatch(request.user, request.data)
+        if not batch.is_valid():
+            return Response({'errors': batch.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        created, updated, deleted = batch.save()
+        context = self.get_serializer_context()
+        return Response({
+            'created': EntrySerializer(created, many=True, context=context).data,
+            'updated': EntrySerializer(updated, many=True, context=context).data,
+            'deleted': deleted,
+        })
+
+
+def filter_entries(request, queryset):
+    """
+    `EntryFilter` applied to the entries of the user, with the matching archived
+    entries when the date filters reach into archived years, see `archive.with_archived`.
+    """
+    f = EntryFilter(request.GET, queryset=queryset, request=request)
+    if not f.is_valid():
+        raise translate_validation(f.errors)
+
+    archived = archived_matches(request, f, ArchivedEntry.objects.filter(owner=request.user),
+                                Budget.objects.filter(owner=request.user))
+    return f.qs if archived is None else archive.with_archived(f.qs, archived)
+
+
+def archived_matches(request, f, archived, budgets, undated=False):
+    """
+    The `archived` entries matching the `EntryFilter` `f`, None when its date filters
+    don't reach into the archived years of `budgets`, see `archive.reaches`.
+    """
+    if not archive.reaches(f.form.cleaned_data, budgets, undated):
+        return None
+    return EntryFilter(request.GET, queryset=archived, request=request).qs
+
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def budget_overview(request, budget_id):
+    return caching.cached_response(request, [f'budget:{budget_id}', 'categories'],
+                                   lambda: compute_budget_overview(request, budget_id))
+
+
+def compute_budget_overview(request, budget_id):
+    sums, rollover = overview_rows([list(queryset) for queryset in overview_querysets(request, budget_id)])
+    return Response(overview_data(sums, rollover, categories.titles(overview_category_ids(sums))))
+
+
+def overview_querysets(request, budget_id):
+    """
+    Return the per category and the per month and category sums of the overview, not evaluated,
+    followed by those of the archived entries when the filters match some. Like the rollups, the
+    overview includes the archived entries without date filters.
+    Rows are grouped by `category_id`, see `overview_rows` and `overview_data`.
+    """
     f = EntryFilter(request.GET, queryset=Entry.objects.filter(owner=request.user, budget=budget_id), request=request)
 
     if not f.is_valid():
         raise translate_validation(f.errors)
 
-    sums = f.qs.values('category__title').annotate(
+    if rollups.covers_filter(f.form.cleaned_data):
+        # Whole months only: answer from the maintained rollups instead of scanning the entries.
+        # They also summarise the archived entries.
+        queryset = rollups.filter_rollups(
+            f.form.cleaned_data, MonthlyRollup.objects.filter(budget=budget_id, budget__owner=request.user))
+
+        sums = queryset.values('category_id').annotate(
+            positive_sum=Sum('positive_total', filter=Q(positive_count__gt=0)),
+            negative_sum=Sum('negative_total', filter=Q(negative_count__gt=0)), ).order_by('category_id')
+
+        rollover = queryset.values('month', 'category_id').annotate(
+            positive_sum=Sum('positive_total', filter=Q(positive_count__gt=0)),
+            negative_sum=Sum('negative_total', filter=Q(negative_count__gt=0)), ).order_by('month', 'category_id')
+
+        return [sums, rollover]
+
+    querysets = entry_overview_querysets(f.qs)
+    archived = archived_matches(request, f, ArchivedEntry.objects.filter(owner=request.user, budget=budget_id),
+                                Budget.objects.filter(pk=budget_id, owner=request.user), undated=True)
+    if archived is not None:
+        querysets += entry_overview_querysets(archived)
+    return querysets
+
+
+def entry_overview_querysets(entries):
+    sums = entries.values('category_id').annotate(
         positive_sum=Sum('amount', filter=Q(is_positive=True)),
-        negative_sum=Sum('amount', filter=Q(is_positive=False)), )
+        negative_sum=Sum('amount', filter=Q(is_positive=False)), ).order_by('category_id')
 
-    rollover = f.qs.annotate(month=TruncMonth("date")).values("month", "category__title").annotate(
+    rollover = entries.annotate(month=TruncMonth("date")).values("month", "category_id").annotate(
         positive_sum=Sum('amount', filter=Q(is_positive=True)),
-        negative_sum=Sum('amount', filter=Q(is_positive=False)), ).order_by('month')
+        negative_sum=Sum('amount', filter=Q(is_positive=False)), ).order_by('month', 'category_id')
+
+    return [sums, rollover]
+
+
+def overview_rows(results):
+    """
+    The sums and the month sums of the evaluated `overview_querysets`, with the archived ones added in.
+    """
+    sums, rollover, *archived = results
+    if archived:
+        sums = archive.merge(sums, archived[0], ['category_id'])
+        rollover = archive.merge(rollover, archived[1], ['month', 'category_id'])
+    return sums, rollover
+
+
+def overview_category_ids(sums):
+    # The months have the same categories as the sums
+    return [row['category_id'] for row in sums]
+
+
+def overview_data(sums, rollover, titles):
+    """
+    The overview of the evaluated `overview_querysets`, with the category ids replaced by the `titles`.
+    """
+    for row in itertools.chain(sums, rollover):
+        row['category__title'] = titles[row.pop('category_id')]
 
     sum_serializer = BudgetOverviewSumSerializer(sums, many=True)
     month_serializer = BudgetOverviewMonthlySumSerializer(rollover, many=True)
 
-    return Response({'categories': sum_serializer.data, 'months': month_serializer.data})
+    return {'categories': sum_serializer.data, 'months': month_serializer.data}
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def budget_analytics(request, budget_id):
+    """
+    Totals of the entries matching `EntryFilter` per day, week, month, quarter or year,
+    as one array per measure aligned on `periods`.
+    """
+    return caching.cached_response(request, [f'budget:{budget_id}', 'categories'],
+                                   lambda: compute_budget_analytics(request, budget_id))
+
+
+def compute_budget_analytics(request, budget_id):
+    query = AnalyticsQuerySerializer(data=request.query_params)
+    query.is_valid(raise_exception=True)
+
+    f = EntryFilter(request.GET, queryset=Entry.objects.filter(owner=request.user, budget=budget_id), request=request)
+    if not f.is_valid():
+        raise translate_validation(f.errors)
+
+    querysets = [f.qs]
+    archived = archived_matches(request, f, ArchivedEntry.objects.filter(owner=request.user, budget=budget_id),
+                                Budget.objects.filter(pk=budget_id, owner=request.user))
+    if archived is not None:
+        querysets.append(archived)
+
+    try:
+        data = analytics.series(querysets, query.validated_data['resolution'],
+                                window=query.validated_data.get('window'),
+                                by_category=query.validated_data['by_category'])
+    except analytics.TooManyPeriods as e:
+        raise ValidationError({'resolution': str(e)})
+
+    return Response(data)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def budget_balance(request, budget_id):
+    """
+    Balance of the budget at the end of each day (or month) with entries, read from
+    the running balances maintained on the entries.
+    """
+    budget = get_object_or_404(Budget.objects.only('id', 'base', 'balance', 'archived_until'), pk=budget_id,
+                               owner=request.user)
+    return caching.cached_response(request, [f'budget:{budget.pk}'],
+                                   lambda: compute_budget_balance(request, budget))
+
+
+def compute_budget_balance(request, budget):
+    query = BalanceQuerySerializer(data=request.query_params)
+    query.is_valid(raise_exception=True)
+    start, end = query.validated_data.get('date__gte'), query.validated_data.get('date__lte')
+    monthly = query.validated_data['resolution'] == 'month'
+
+    querysets = [Entry.objects.filter(budget=budget)]
+    if budget.archived_until is not None and (start is None or start < budget.archived_until):
+        # They keep their running balances, and are all dated before the entries
+        querysets.insert(0, ArchivedEntry.objects.filter(budget=budget))
+
+    # Rows come ordered by (date, id), so the last balance of a period is the one kept.
+    points = {}
+    for entries in querysets:
+        if start:
+            entries = entries.filter(date__gte=start)
+        if end:
+            entries = entries.filter(date__lte=end)
+        for date, running in entries.order_by('date', 'id').values_list('date', 'running_balance').iterator():
+            points[date.replace(day=1) if monthly else date] = running
+
+    serializer = BudgetBalanceSerializer({
+        # Without a start the series begins with the first entry, archived or not
+        'opening': balances.opening_balance(budget.pk, start) if start is not None else budget.base,
+        'balance': budget.balance,
+        'series': [{'date': date, 'balance': value} for date, value in points.items()],
+    })
+    return Response(serializer.data)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def budget_allowances(request, budget_id):
+    """
+    Allocated, spent and remaining amounts of the allocated categories of the budget
+    for the current `month` (or the given one), read from the maintained rollups.
+    """
+    query = AllowanceQuerySerializer(data=request.query_params)
+    query.is_valid(raise_exception=True)
+    month = query.validated_data.get('month') or date.today().replace(day=1)
+
+    # One query: the rollup of each allocation is found through the (budget, category, month) constraint index.
+    spent = MonthlyRollup.objects.filter(budget=OuterRef('budget'), category=OuterRef('category'), month=month)
+    rows = list(Allocation.objects.filter(budget=budget_id, owner=request.user).annotate(
+        spent=Coalesce(Subquery(spent.values('negative_total')[:1]), 0, output_field=DecimalField()),
+    ).values('category_id', 'amount', 'spent').order_by('category_id'))
+
+    titles = categories.titles([row['category_id'] for row in rows])
+    for row in rows:
+        row['category__title'] = titles[row['category_id']]
+        row['remaining'] = row['amount'] - row['spent']
+        row['overspent'] = row['remaining'] < 0
+
+    return Response(BudgetAllowancesSerializer({'month': month, 'allowances': rows}).data)
+
+
+changes_entry_values = EntryValuesSerializer()
+changes_budget_values = BudgetValuesSerializer()
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def changes(request):
+    """
+    Budgets, entries and categories created or updated since the `cursor`
+    returned by the previous call, and the ids of the deleted ones, for
+    clients keeping a local copy. Without a cursor, everything but the
+    deletions. Call again with the returned cursor while `more` is true.
+    """
+    feed = sync.changes(request.user, sync.decode_cursor(request.query_params.get('cursor')),
+                        changes_entry_values.lookups)
+
+    return Response({
+        'cursor': feed['cursor'],
+        'more': feed['more'],
+        'budgets': changes_budget_values.many(changes_budget_values.values(feed['budgets'])),
+        'entries': changes_entry_values.many(feed['entries']),
+        'categories': CategorySerializer(feed['categories'], many=True, context={'request': request}).data,
+        'deleted': feed['deleted'],
+    })
@@ -0,0 +1,174 @@
+"""
+Archival of the entries of past years.
+
+`archive` moves the entries dated before the first day of a year to
+`ArchivedEntry`, partitioned by year on PostgreSQL and a plain table on the
+other databases. They keep their id and running balance, and the monthly
+rollups keep summarising them, so the balances and the overview from the
+rollups are unchanged. `Budget.archived_until` records the boundary: entries
+can't be written before it, and the entry list and the overview from the
+entries only read the archive when the date filters of `EntryFilter` reach
+before it.
+"""
+import time
+from datetime import date
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from .models import ArchivedEntry, Budget, Entry
+from .signals import bulk_write
+from . import caching, search, sync
+
+BATCH_SIZE = 1000
+FIELDS = [field.attname for field in ArchivedEntry._meta.concrete_fields]
+
+
+def cutoff(horizon=None, today=None):
+    """
+    First day of the oldest year kept in the entries table.
+    """
+    horizon = settings.ENTRY_ARCHIVE_HORIZON_YEARS if horizon is None else horizon
+    return date((today or date.today()).year - horizon, 1, 1)
+
+
+def is_archived(day, archived_until):
+    return archived_until is not None and day is not None and day < archived_until
+
+
+def archived_error(archived_until):
+    return f'Entries before {archived_until.isoformat()} are archived'
+
+
+def create_partitions(years, using='default'):
+    """
+    Create the missing yearly partitions of the archive, on PostgreSQL.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+
+    table = ArchivedEntry._meta.db_table
+    with connection.cursor() as cursor:
+        for year in sorted(years):
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {table}_{year} PARTITION OF {table} "
+                           f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')")
+
+
+def archive(before=None, batch_size=BATCH_SIZE):
+    """
+    Move the entries dated before `before`, `cutoff()` by default, to the archive. Returns the counts.
+    """
+    before = before or cutoff()
+    started = time.perf_counter()
+    budget_ids = list(Entry.objects.filter(date__lt=before).order_by('budget_id')
+                      .values_list('budget_id', flat=True).distinct())
+
+    moved = 0
+    years = set()
+    for budget_id in budget_ids:
+        budget_moved, budget_years = archive_budget(budget_id, before, batch_size)
+        moved += budget_moved
+        years |= budget_years
+
+    elapsed = time.perf_counter() - started
+    return {
+        'budgets': len(budget_ids),
+        'entries': moved,
+        'years': sorted(years),
+        'seconds': round(elapsed, 3),
+    }
+
+
+def archive_budget(budget_id, before, batch_size):
+    """
+    Move the entries of a budget in one transaction, so that its boundary is never half way.
+    """
+    moved, years = 0, set()
+
+    with transaction.atomic():
+        # Writes to the budget wait for the archival
+        budget = Budget.objects.select_for_update().only('id', 'owner_id', 'archived_until').get(pk=budget_id)
+        entries = Entry.objects.filter(budget_id=budget_id, date__lt=before).order_by('date', 'id')
+
+        while True:
+            rows = list(entries.values(*FIELDS)[:batch_size])
+            if not rows:
+                break
+
+            batch_years = {row['date'].year for row in rows} - years
+            create_partitions(batch_years)
+            years |= batch_years
+
+            ids = [row['id'] for row in rows]
+            ArchivedEntry.objects.bulk_create([ArchivedEntry(**row) for row in rows])
+            # Not a change of the entries: the balances and the rollups stay as they are
+            with bulk_write():
+                Entry.objects.filter(id__in=ids).delete()
+            search.entries.update(removed_ids=ids)
+            moved += len(rows)
+
+        if budget.archived_until is None or budget.archived_until < before:
+            Budget.objects.filter(pk=budget_id).update(archived_until=before)
+            sync.record_budget(budget)
+        caching.bump_on_commit(f'budget:{budget_id}', f'user:{budget.owner_id}')
+
+    return moved, years
+
+
+def lower_bound(data):
+    """
+    Earliest date the cleaned `EntryFilter` data can match: None without date
+    filters, `date.min` when the dates are only bounded above.
+    """
+    bounds = [data.get('date'), data.get('date__gte')]
+    if data.get('date__year') is not None:
+        bounds.append(date(int(data['date__year']), 1, 1))
+    bounds = [bound for bound in bounds if bound is not None]
+
+    if bounds:
+        return max(bounds)
+    if data.get('date__lte') is not None or data.get('date__month') is not None:
+        return date.min
+    return None
+
+
+def reaches(data, budgets, undated=False):
+    """
+    True if the cleaned `EntryFilter` data has date filters matching archived entries of the `budgets` queryset,
+    or has no date filters and `undated`. The full-text `search` only covers the entries table.
+    """
+    lower = lower_bound(data)
+    if lower is None and undated:
+        lower = date.min
+    if lower is None or data.get('search'):
+        return False
+    return budgets.filter(archived_until__gt=lower).exists()
+
+
+def with_archived(entries, archived):
+    """
+    The `entries` and `archived` querysets as one, in the ordering of `entries`.
+
+    Only slicing, counting, ordering and `values()` apply to the result, and
+    `pagination.filter_parts` for the keyset pagination.
+    """
+    ordering = entries.query.order_by or Entry._meta.ordering
+    return entries.order_by().union(archived.order_by(), all=True).order_by(*ordering)
+
+
+def merge(rows, archived_rows, keys):
+    """
+    Add up the `positive_sum` and `negative_sum` of overview rows with the same `keys`, ordered by them.
+    """
+    merged = {}
+    for row in [*rows, *archived_rows]:
+        key = tuple(row[name] for name in keys)
+        if key not in merged:
+            merged[key] = dict(row)
+            continue
+        for total in ('positive_sum', 'negative_sum'):
+            if row[total] is not None:
+                merged[key][total] = (merged[key][total] or 0) + row[total]
+
+    return [merged[key] for key in sorted(merged)]
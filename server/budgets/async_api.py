@@ -0,0 +1,177 @@
+"""
+Async versions of the hot read endpoints, for ASGI servers.
+
+DRF views are synchronous, so under ASGI each request is handed to a thread by
+`sync_to_async`. These views query with the async ORM instead and return the
+same JSON as their DRF counterparts in `budgets.api`. Tokens are resolved with
+the async token cache; the other DRF authentication classes run in a thread.
+"""
+import asyncio
+import math
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, connections
+from django.http import HttpResponse
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from accounts.authentication import atoken_user, check_user
+
+from .api import filter_entries, overview_category_ids, overview_querysets, overview_data, overview_rows
+from .models import Budget, Entry
+from .pagination import KeysetPagination
+from .serializers import BudgetValuesSerializer, EntryValuesSerializer
+from . import caching, categories
+
+entry_values = EntryValuesSerializer()
+budget_values = BudgetValuesSerializer()
+
+
+def render(data, status_code=status.HTTP_200_OK, headers=None):
+    response = HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status_code)
+    for header, value in (headers or {}).items():
+        response[header] = value
+    return response
+
+
+async def authenticate(request):
+    header = request.headers.get('Authorization', '').split()
+
+    if len(header) == 2 and header[0].lower() == 'token':
+        return check_user(await atoken_user(header[1]))
+
+    return await sync_to_async(authenticate_with_drf)(request)
+
+
+def authenticate_with_drf(request):
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    user = drf_request.user
+    return user if user.is_authenticated else None
+
+
+def async_api_view(view):
+    """
+    Authenticate a GET view like `IsAuthenticated` does and render the API exceptions like DRF.
+    The view is called with the user, also set on `request.user`.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            if request.method not in ('GET', 'HEAD'):
+                raise exceptions.MethodNotAllowed(request.method)
+
+            user = await authenticate(request)
+            if user is None:
+                raise exceptions.NotAuthenticated()
+
+            request.user = user
+            return await view(request, user, *args, **kwargs)
+        except exceptions.APIException as exc:
+            headers = {}
+            if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+                headers['WWW-Authenticate'] = 'Token'
+            data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            return render(data, exc.status_code, headers)
+
+    return wrapper
+
+
+async def fetch_all(*querysets):
+    """
+    Evaluate the querysets, concurrently each on its own connection when the database allows it.
+    """
+    if all(connections[queryset.db].vendor == 'sqlite' for queryset in querysets):
+        # A single writer and possibly an in-memory database: one connection, one after the other.
+        return [[row async for row in queryset] for queryset in querysets]
+    if await sync_to_async(in_transaction)(querysets):
+        # Other connections don't see the writes of the open transaction, and wait on its locks.
+        return [await sync_to_async(list)(queryset) for queryset in querysets]
+
+    return await asyncio.gather(*[sync_to_async(fetch_in_thread, thread_sensitive=False)(queryset)
+                                  for queryset in querysets])
+
+
+def in_transaction(querysets):
+    # Run in the thread of the sync code, whose connections hold the transaction.
+    return any(connections[queryset.db].in_atomic_block for queryset in querysets)
+
+
+def fetch_in_thread(queryset):
+    try:
+        return list(queryset)
+    finally:
+        # Worker threads are outside the request cycle that closes the connections.
+        close_old_connections()
+
+
+async def paginate(request, queryset, values_serializer):
+    """
+    The `PageNumberOrKeysetPagination` page of `queryset`, serialized with `values_serializer`.
+    """
+    if KeysetPagination.cursor_query_param in request.GET:
+        paginator = KeysetPagination()
+        drf_request = Request(request)
+        page = await sync_to_async(paginator.paginate_queryset)(values_serializer.values(queryset), drf_request)
+        return paginator.get_paginated_response(values_serializer.many(page)).data
+
+    page_size = api_settings.PAGE_SIZE
+    count = await queryset.acount()
+    pages = max(math.ceil(count / page_size), 1)
+
+    number = request.GET.get('page', 1)
+    if number == 'last':
+        number = pages
+    try:
+        number = int(number)
+    except (TypeError, ValueError):
+        raise exceptions.NotFound('Invalid page.')
+    if number < 1 or number > pages:
+        raise exceptions.NotFound('Invalid page.')
+
+    offset = (number - 1) * page_size
+    rows = [row async for row in values_serializer.values(queryset)[offset:offset + page_size]]
+    url = request.build_absolute_uri()
+
+    if number == 1:
+        previous = None
+    elif number == 2:
+        previous = remove_query_param(url, 'page')
+    else:
+        previous = replace_query_param(url, 'page', number - 1)
+
+    return {
+        'count': count,
+        'next': replace_query_param(url, 'page', number + 1) if number < pages else None,
+        'previous': previous,
+        'results': values_serializer.many(rows),
+    }
+
+
+@async_api_view
+async def entry_list(request, user):
+    # Checking whether the filters reach into archived years may query
+    queryset = await sync_to_async(filter_entries)(request, Entry.objects.filter(owner=user))
+    return render(await paginate(request, queryset, entry_values))
+
+
+@async_api_view
+async def budget_list(request, user):
+    async def compute():
+        return await paginate(request, Budget.objects.filter(owner=user).order_by('created'), budget_values)
+
+    return await caching.acached_json(request, user, [f'user:{user.pk}'], compute, render)
+
+
+@async_api_view
+async def budget_overview(request, user, budget_id):
+    async def compute():
+        querysets = await sync_to_async(overview_querysets)(request, budget_id)
+        sums, rollover = overview_rows(await fetch_all(*querysets))
+        titles = await sync_to_async(categories.titles)(overview_category_ids(sums))
+        return overview_data(sums, rollover, titles)
+
+    return await caching.acached_json(request, user, [f'budget:{budget_id}', 'categories'], compute, render)
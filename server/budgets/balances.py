@@ -0,0 +1,151 @@
+"""
+Maintenance of `Budget.balance` and `Entry.running_balance`.
+
+The running balance of an entry is the budget base plus the signed amounts of
+the entries up to it, ordered by (date, id). A single write shifts the balances
+of the entries after it with one UPDATE; larger writes recompute the budget
+from their earliest date, rewriting only the rows whose balance changed.
+Archived entries keep their running balance, the balance before the first
+entry of an archived budget is the one of its last archived entry.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import ArchivedEntry, Budget, Entry
+
+# Above this many changed entries in a budget, recomputing is cheaper than shifting per entry.
+SHIFT_LIMIT = 4
+
+
+def signed(amount, is_positive):
+    amount = Entry._meta.get_field('amount').to_python(amount)
+    return amount if is_positive else -amount
+
+
+def after(state):
+    """
+    The entries after the given `Entry.tracked_state()` in its budget.
+    """
+    date = Entry._meta.get_field('date').to_python(state['date'])
+    return Entry.objects.filter(budget_id=state['budget_id']).filter(
+        Q(date__gt=date) | Q(date=date, id__gt=state['id']))
+
+
+def opening_balance(budget_id, date=None, pk=None):
+    """
+    Balance of the budget before the entry at (date, pk), or before `date` when `pk` is None.
+    """
+    before = Q()
+    if date is not None:
+        before = Q(date__lt=date)
+        if pk is not None:
+            before |= Q(date=date, id__lt=pk)
+
+    def last(queryset):
+        queryset = queryset.filter(before, budget_id=budget_id).order_by('-date', '-id')
+        return Subquery(queryset.values('running_balance')[:1])
+
+    # The last entry before, else the last archived entry before, else the base, in one query
+    balances = ([last(Entry.objects)] if date is not None else []) + [last(ArchivedEntry.objects), F('base')]
+    opening = Budget.objects.filter(pk=budget_id).annotate(opening=Coalesce(*balances)).values_list(
+        'opening', flat=True).first()
+    return opening if opening is not None else Decimal(0)
+
+
+def shift(state, sign):
+    amount = sign * signed(state['amount'], state['is_positive'])
+    after(state).update(running_balance=F('running_balance') + amount)
+    Budget.objects.filter(pk=state['budget_id']).update(balance=F('balance') + amount)
+
+
+def insert(state):
+    shift(state, 1)
+    date = Entry._meta.get_field('date').to_python(state['date'])
+    before = Q(date__lt=date) | Q(date=date, id__lt=state['id'])
+    previous = Entry.objects.filter(budget_id=state['budget_id']).filter(before).order_by(
+        '-date', '-id').values('running_balance')[:1]
+    # Entries are not written before the archived ones
+    archived = ArchivedEntry.objects.filter(budget_id=state['budget_id']).order_by(
+        '-date', '-id').values('running_balance')[:1]
+    base = Budget.objects.filter(pk=state['budget_id']).values('base')
+    Entry.objects.filter(pk=state['id']).update(
+        running_balance=Coalesce(Subquery(previous), Subquery(archived), Subquery(base)) +
+        signed(state['amount'], state['is_positive']))
+
+
+def recompute(budget_id, since=None):
+    """
+    Recompute the running balances of the budget from the entries dated `since` (or all of them).
+    """
+    balance = opening_balance(budget_id, since)
+    entries = Entry.objects.filter(budget_id=budget_id).order_by('date', 'id')
+    if since is not None:
+        entries = entries.filter(date__gte=since)
+
+    changed = []
+    for pk, amount, is_positive, running in entries.values_list('id', 'amount', 'is_positive', 'running_balance'):
+        balance += amount if is_positive else -amount
+        if running != balance:
+            changed.append(Entry(id=pk, running_balance=balance))
+
+    Entry.objects.bulk_update(changed, ['running_balance'], batch_size=1000)
+    Budget.objects.filter(pk=budget_id).update(balance=balance)
+    return len(changed)
+
+
+def apply_changes(added, removed):
+    """
+    Update the balances after a write, from the states sent with `entries_changed`.
+    Runs in the transaction of the write.
+    """
+    by_budget = defaultdict(lambda: ([], []))
+    for state in removed:
+        by_budget[state['budget_id']][0].append(state)
+    for state in added:
+        by_budget[state['budget_id']][1].append(state)
+    if not by_budget:
+        return
+
+    # Concurrent writes to a budget would chain their balances off the same previous entry,
+    # lock the budgets, in a stable order, until the end of the transaction.
+    list(Budget.objects.select_for_update().filter(pk__in=by_budget).order_by('pk').values_list('pk', flat=True))
+
+    for budget_id, (budget_removed, budget_added) in by_budget.items():
+        if len(budget_removed) + len(budget_added) > SHIFT_LIMIT:
+            since = min(Entry._meta.get_field('date').to_python(state['date'])
+                        for state in budget_removed + budget_added)
+            recompute(budget_id, since)
+            continue
+
+        for state in budget_removed:
+            shift(state, -1)
+        for state in budget_added:
+            insert(state)
+
+
+def rebase(budget_id, delta):
+    """
+    Apply a change of the budget base to all its balances.
+    """
+    Entry.objects.filter(budget_id=budget_id).update(running_balance=F('running_balance') + delta)
+    ArchivedEntry.objects.filter(budget_id=budget_id).update(running_balance=F('running_balance') + delta)
+    Budget.objects.filter(pk=budget_id).update(balance=F('balance') + delta)
+
+
+def rebuild(budget_ids=None):
+    """
+    Recompute the balances of the given budgets, or of all of them. Returns the number of entries fixed.
+    """
+    budgets = Budget.objects.order_by('id')
+    if budget_ids is not None:
+        budgets = budgets.filter(id__in=budget_ids)
+
+    fixed = 0
+    for budget_id in budgets.values_list('id', flat=True):
+        with transaction.atomic():
+            fixed += recompute(budget_id)
+    return fixed
@@ -0,0 +1,167 @@
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from .models import Budget, Entry
+from .signals import bulk_write, entries_changed
+from . import archive, categories, recurring
+
+# Operations in one batch, they are validated and written in a single transaction
+MAX_OPERATIONS = 1000
+
+
+def is_id(value):
+    # JSON true and false are ints to Python, they are not valid ids
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class EntryBatchDataSerializer(serializers.Serializer):
+    """
+    Field validation of a batch operation. Relations are checked against
+    maps loaded once per batch instead of a query per row.
+    """
+    description = serializers.CharField(max_length=100)
+    amount = serializers.DecimalField(max_digits=19, decimal_places=2)
+    date = serializers.DateField(required=False)
+    is_positive = serializers.BooleanField(required=False)
+    budget = serializers.IntegerField()
+    category = serializers.IntegerField()
+
+
+class EntryBatch:
+    """
+    Validate and apply a list of `create`, `update` and `delete` operations on
+    the entries of a user, all or nothing.
+
+    Operations look like `{"op": "create", "data": {...}}`, `{"op": "update", "id": 1, "data": {...}}`
+    and `{"op": "delete", "id": 1}`.
+    """
+    operations = ('create', 'update', 'delete')
+
+    def __init__(self, user, operations):
+        self.user = user
+        self.raw_operations = operations
+        self.errors = []
+        self.creates, self.updates, self.deletes = [], [], []
+
+    def is_valid(self):
+        if not isinstance(self.raw_operations, list):
+            self.errors = {'non_field_errors': ['Expected a list of operations.']}
+            return False
+        if len(self.raw_operations) > MAX_OPERATIONS:
+            self.errors = {'non_field_errors': [f'Expected at most {MAX_OPERATIONS} operations.']}
+            return False
+
+        ids = [op.get('id') for op in self.raw_operations if isinstance(op, dict) and op.get('op') != 'create']
+        entries = Entry.objects.filter(owner=self.user, id__in=[pk for pk in ids if is_id(pk)]).in_bulk()
+        budgets = dict(Budget.objects.filter(owner=self.user).values_list('id', 'archived_until'))
+        data = [op.get('data') for op in self.raw_operations if isinstance(op, dict)]
+        category_ids = categories.categories(
+            [item['category'] for item in data if isinstance(item, dict) and is_id(item.get('category'))])
+        seen = set()
+
+        for operation in self.raw_operations:
+            error = self.validate_operation(operation, entries, budgets, category_ids, seen)
+            self.errors.append(error)
+
+        if any(self.errors):
+            return False
+
+        self.validate_occurrences()
+        if any(self.errors):
+            return False
+
+        self.errors = []
+        return True
+
+    def validate_operation(self, operation, entries, budgets, category_ids, seen):
+        if not isinstance(operation, dict) or operation.get('op') not in self.operations:
+            return {'op': [f'Expected one of {", ".join(self.operations)}.']}
+
+        kind = operation['op']
+        entry = None
+
+        if kind != 'create':
+            if not is_id(operation.get('id')):
+                return {'id': ['A valid integer is required.']}
+            entry = entries.get(operation['id'])
+            if entry is None:
+                return {'id': ['Not found.']}
+            if entry.pk in seen:
+                return {'id': ['Only one operation per entry.']}
+            seen.add(entry.pk)
+
+        if kind == 'delete':
+            self.deletes.append(entry)
+            return None
+
+        serializer = EntryBatchDataSerializer(data=operation.get('data'), partial=kind == 'update')
+        if not serializer.is_valid():
+            return serializer.errors
+
+        data = dict(serializer.validated_data)
+        errors = {}
+        if 'budget' in data:
+            if data['budget'] not in budgets:
+                errors['budget'] = ['Budget must belong to the user']
+            data['budget_id'] = data.pop('budget')
+        if 'category' in data:
+            if data['category'] not in category_ids:
+                errors['category'] = ['Invalid pk "{}" - object does not exist.'.format(data['category'])]
+            data['category_id'] = data.pop('category')
+        if errors:
+            return errors
+
+        budget_id = data.get('budget_id', getattr(entry, 'budget_id', None))
+        day = data.get('date', entry.date if entry else Entry._meta.get_field('date').get_default())
+        if archive.is_archived(day, budgets[budget_id]):
+            return {'date': [archive.archived_error(budgets[budget_id])]}
+
+        if kind == 'create':
+            self.creates.append(Entry(owner=self.user, **data))
+        else:
+            self.updates.append((entry, data))
+        return None
+
+    def validate_occurrences(self):
+        """
+        Reject the updates moving an entry of a recurring rule onto a date the rule already has an entry
+        for, in the database or from another operation of the batch.
+        """
+        indexes = [index for index, operation in enumerate(self.raw_operations) if operation['op'] == 'update']
+        moves = {index: (entry.recurring_id, data['date']) for index, (entry, data) in zip(indexes, self.updates)
+                 if entry.recurring_id is not None and data.get('date', entry.date) != entry.date}
+        occurrences = recurring.taken(list(moves.values()))
+
+        for index, occurrence in moves.items():
+            if occurrence in occurrences:
+                self.errors[index] = {'date': [recurring.OCCURRENCE_TAKEN]}
+            occurrences.add(occurrence)
+
+    def save(self):
+        added, removed = [], []
+        now = timezone.now()
+        fields = {'updated'}
+
+        for entry, data in self.updates:
+            removed.append(entry.tracked_state())
+            for field, value in data.items():
+                setattr(entry, field, value)
+                fields.add(field)
+            entry.updated = now
+            added.append(entry.tracked_state())
+
+        with transaction.atomic(), bulk_write():
+            created = Entry.objects.bulk_create(self.creates)
+            added.extend(entry.tracked_state() for entry in created)
+
+            if self.updates:
+                Entry.objects.bulk_update([entry for entry, data in self.updates], sorted(fields))
+
+            if self.deletes:
+                removed.extend(entry.tracked_state() for entry in self.deletes)
+                Entry.objects.filter(id__in=[entry.pk for entry in self.deletes]).delete()
+
+            entries_changed.send(sender=Entry, added=added, removed=removed)
+
+        return created, [entry for entry, data in self.updates], [entry.pk for entry in self.deletes]
@@ -0,0 +1,142 @@
+"""
+Response cache of the budget list and overview.
+
+Cached responses are keyed by user, URL and the versions of the scopes they
+depend on: `user:<id>` (the budgets of a user), `budget:<id>` (a budget and
+its entries) and `categories`. A write bumps the versions of the scopes it
+affects once committed (see `budgets.signals`), so stale responses are never
+looked up again and simply expire. This holds for the workers sharing the
+cache: with the per-process locmem backend, only for a single worker (see
+BUDGETS_CACHE_BACKEND in the settings).
+"""
+import hashlib
+import time
+from functools import partial
+
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+CACHE_ALIAS = 'budgets'
+
+
+def version_key(scope):
+    return f'budgets:version:{scope}'
+
+
+def get_versions(scopes):
+    """
+    Return the current version of each scope, a nanosecond timestamp of its last change.
+    """
+    cache = caches[CACHE_ALIAS]
+    keys = [version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+
+    for key in keys:
+        if key not in versions:
+            # Unknown or evicted: start a new version, previous responses can't be trusted.
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+
+    return [versions[key] for key in keys]
+
+
+async def aget_versions(scopes):
+    """
+    `get_versions` for async views.
+    """
+    cache = caches[CACHE_ALIAS]
+    keys = [version_key(scope) for scope in scopes]
+    versions = await cache.aget_many(keys)
+
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, time.time_ns(), timeout=None)
+            versions[key] = await cache.aget(key)
+
+    return [versions[key] for key in keys]
+
+
+def bump(*scopes):
+    now = time.time_ns()
+    caches[CACHE_ALIAS].set_many({version_key(scope): now for scope in scopes}, timeout=None)
+
+
+def bump_on_commit(*scopes):
+    """
+    Invalidate the scopes once the current transaction is committed, so that
+    a response computed before the commit is not cached under the new version.
+    """
+    transaction.on_commit(partial(bump, *scopes))
+
+
+def signature(user, request, versions):
+    """
+    Return the cache key digest, the ETag and the Last-Modified timestamp of a response.
+    """
+    key = '|'.join([str(user.pk), request.build_absolute_uri()] + [str(version) for version in versions])
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return digest, quote_etag(digest[:32]), max(versions) // 10 ** 9
+
+
+def response_key(digest):
+    return f'budgets:response:{digest}'
+
+
+def add_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Authorization', 'Cookie'))
+    return response
+
+
+def cached_response(request, scopes, compute):
+    """
+    Return the cached response for the request, or `compute()` and cache it.
+
+    Responses carry an ETag and a Last-Modified date derived from the scope versions,
+    so clients revalidating an unchanged resource get a 304 without any query.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return compute()
+
+    digest, etag, last_modified = signature(request.user, request, get_versions(scopes))
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        cache = caches[CACHE_ALIAS]
+        data = cache.get(response_key(digest))
+
+        if data is None:
+            response = compute()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            cache.set(response_key(digest), response.data)
+        else:
+            response = Response(data)
+
+    return add_validators(response, etag, last_modified)
+
+
+async def acached_json(request, user, scopes, compute, render):
+    """
+    `cached_response` for async views: `compute()` is awaited for the response data,
+    `render(data)` makes the response.
+    """
+    digest, etag, last_modified = signature(user, request, await aget_versions(scopes))
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        cache = caches[CACHE_ALIAS]
+        data = await cache.aget(response_key(digest))
+
+        if data is None:
+            data = await compute()
+            await cache.aset(response_key(digest), data)
+        response = render(data)
+
+    return add_validators(response, etag, last_modified)
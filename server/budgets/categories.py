@@ -0,0 +1,53 @@
+"""
+Process-local cache of the categories, a small table written from the admin.
+
+The categories are loaded at once and kept until the version of the
+`categories` scope of `budgets.caching` changes, which the Category signals
+bump on every write. A lookup of an id the cache doesn't know reloads it, so
+a category created in another process is found before its version is seen.
+"""
+import copy
+import threading
+
+from . import caching
+from .models import Category
+
+_lock = threading.Lock()
+_state = {'version': None, 'categories': {}}
+
+
+def forget():
+    with _lock:
+        _state['version'] = None
+
+
+def load(version):
+    categories = {category.pk: category for category in Category.objects.only('id', 'title')}
+    with _lock:
+        _state.update(version=version, categories=categories)
+    return categories
+
+
+def categories(required=()):
+    """
+    The categories by id, reloaded when they changed or any of the `required` ids is missing.
+    """
+    version, = caching.get_versions(['categories'])
+    with _lock:
+        current, cached = _state['version'], _state['categories']
+
+    if current != version or any(pk not in cached for pk in required):
+        return load(version)
+    return cached
+
+
+def titles(required=()):
+    return {pk: category.title for pk, category in categories(required).items()}
+
+
+def get(pk):
+    """
+    A copy of the category `pk`, None if there is no such category.
+    """
+    category = categories([pk]).get(pk)
+    return copy.copy(category) if category is not None else None
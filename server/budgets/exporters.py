@@ -0,0 +1,144 @@
+import csv
+import io
+import json
+
+# Same columns as the CSV import, so an export can be imported back
+COLUMNS = ('id', 'date', 'description', 'amount', 'is_positive', 'category', 'budget')
+FIELDS = ('id', 'date', 'description', 'amount', 'is_positive', 'category__title', 'budget_id')
+CHUNK_SIZE = 2000
+
+
+def rows(queryset, chunk_size=CHUNK_SIZE):
+    """
+    Iterate the exported columns with a server-side cursor, `chunk_size` rows at a time.
+    """
+    # By name: a union with the archived entries also selects its ordering columns
+    return (tuple(row[field] for field in FIELDS) for row in queryset.values(*FIELDS).iterator(chunk_size=chunk_size))
+
+
+def export_csv(queryset):
+    """
+    Yield the CSV text a chunk of rows at a time.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+
+    for count, row in enumerate(rows(queryset), 1):
+        writer.writerow(row)
+        if count % CHUNK_SIZE == 0:
+            yield _drain(buffer)
+    yield _drain(buffer)
+
+
+def export_jsonl(queryset):
+    """
+    Yield one JSON object per line, a chunk of rows at a time.
+    """
+    lines = []
+    for entry_id, date, description, amount, is_positive, category, budget in rows(queryset):
+        lines.append(json.dumps({
+            'id': entry_id,
+            'date': date.isoformat(),
+            'description': description,
+            'amount': str(amount),
+            'is_positive': is_positive,
+            'category': category,
+            'budget': budget,
+        }))
+        if len(lines) >= CHUNK_SIZE:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def _drain(buffer):
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+class ParquetSink:
+    """
+    Write-only file collecting the bytes pyarrow writes, drained after each row group.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def export_parquet(queryset, chunk_size=CHUNK_SIZE):
+    """
+    Write one row group per `chunk_size` rows and yield the bytes as they are produced. Requires pyarrow.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('id', pa.int64()),
+        ('date', pa.date32()),
+        ('description', pa.string()),
+        ('amount', pa.decimal128(19, 2)),
+        ('is_positive', pa.bool_()),
+        ('category', pa.string()),
+        ('budget', pa.int64()),
+    ])
+    sink = ParquetSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema)
+    batch = []
+
+    for row in rows(queryset, chunk_size):
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            writer.write_table(_table(pa, batch, schema))
+            batch = []
+            yield sink.drain()
+
+    if batch:
+        writer.write_table(_table(pa, batch, schema))
+    writer.close()
+    yield sink.drain()
+
+
+def _table(pa, batch, schema):
+    columns = zip(*batch)
+    return pa.Table.from_arrays([pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                                schema=schema)
+
+
+# file_format: (generator, content type, extension)
+EXPORTERS = {
+    'csv': (export_csv, 'text/csv', 'csv'),
+    'jsonl': (export_jsonl, 'application/x-ndjson', 'jsonl'),
+    'parquet': (export_parquet, 'application/vnd.apache.parquet', 'parquet'),
+}
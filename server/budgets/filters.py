@@ -1,9 +1,12 @@
 from django_filters import rest_framework as filters
 from .models import Entry
+from . import search
 
 
 class EntryFilter(filters.FilterSet):
     description = filters.CharFilter(lookup_expr='icontains')
+    # Full-text on the indexed descriptions, best matches first unless `order` is given
+    search = filters.CharFilter(method='filter_search')
     # date = filters.IsoDateTimeFilter(field_name='date', lookup_expr='iexact')
     # date__gte = filters.IsoDateTimeFilter(field_name='date', lookup_expr='gte')
     # date__lte = filters.IsoDateTimeFilter(field_name='date', lookup_expr='lte')
@@ -25,6 +28,12 @@ class EntryFilter(filters.FilterSet):
             'date': ['exact', 'lte', 'gte', 'year', 'month'],
         }
 
+    def filter_search(self, queryset, name, value):
+        queryset = search.entries.filter(queryset, value)
+        if not self.data.get('order'):
+            queryset = queryset.order_by('-search_rank', 'id')
+        return queryset
+
     @property
     def qs(self):
         parent = super().qs
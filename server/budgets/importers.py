@@ -0,0 +1,246 @@
+import csv
+import io
+import re
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from .models import Budget, Entry
+from .signals import entries_changed
+from . import archive, categories
+
+DESCRIPTION_MAX_LENGTH = Entry._meta.get_field('description').max_length
+AMOUNT_LIMIT = Decimal(10) ** (Entry._meta.get_field('amount').max_digits - Entry._meta.get_field('amount').decimal_places)
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'x', '+'}
+
+
+def text_stream(upload):
+    """
+    Wrap an uploaded file in a text stream read line by line.
+    """
+    return io.TextIOWrapper(upload, encoding='utf-8-sig', newline='')
+
+
+def parse_csv(stream):
+    """
+    Yield `(line, row)` for a CSV file with a header containing `date`, `description`,
+    `amount` and `category`, and optionally `is_positive` and `budget`.
+    """
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, {key.strip().lower(): (value or '').strip() for key, value in row.items() if key}
+
+
+def parse_qif(stream):
+    """
+    Yield `(line, row)` for each transaction of a QIF file.
+    """
+    fields = {'D': 'date', 'T': 'amount', 'U': 'amount', 'P': 'description', 'M': 'memo', 'L': 'category'}
+    row, start = {}, None
+
+    for line_num, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line or line.startswith('!'):
+            continue
+
+        if line == '^':
+            if row:
+                yield start, _with_description(row)
+            row, start = {}, None
+            continue
+
+        start = start or line_num
+        field = fields.get(line[0])
+        if field and field not in row:
+            row[field] = line[1:].strip()
+
+    if row:
+        yield start, _with_description(row)
+
+
+OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+
+def parse_ofx(stream):
+    """
+    Yield `(line, row)` for each `STMTTRN` of an OFX file, SGML (v1) or XML (v2).
+    """
+    fields = {'DTPOSTED': 'date', 'TRNAMT': 'amount', 'NAME': 'description', 'MEMO': 'memo'}
+    row, start = None, None
+
+    for line_num, line in enumerate(stream, 1):
+        for closing, tag, value in OFX_TAG.findall(line):
+            tag = tag.upper()
+
+            if tag == 'STMTTRN':
+                if closing and row is not None:
+                    yield start, _with_description(row)
+                    row = None
+                elif not closing:
+                    row, start = {}, line_num
+            elif row is not None and not closing and tag in fields:
+                value = value.strip()
+                row[fields[tag]] = value[:8] if tag == 'DTPOSTED' else value
+
+    if row:
+        yield start, _with_description(row)
+
+
+# An integer part grouped by thousands, or not, and a decimal part after the other separator
+AMOUNT = re.compile(r'[+-]?(?:(?P<grouped>\d{1,3}(?:(?P<group>[,.])\d{3})+)|\d*)(?:(?P<point>[,.])\d+)?')
+
+
+class AmbiguousAmount(ValueError):
+    pass
+
+
+def parse_amount(value):
+    """
+    Parse `1234.5`, `1,234.50`, `1.234,50` or `1234,50`.
+
+    A single separator followed by three digits, as in `1,234`, can be a thousands or a
+    decimal separator, and raises `AmbiguousAmount`.
+    """
+    value = value.replace(' ', '')
+    match = AMOUNT.fullmatch(value)
+    if match is None or (match['group'] and match['group'] == match['point']):
+        raise InvalidOperation
+    if match['group'] and not match['point'] and match['grouped'].count(match['group']) == 1:
+        raise AmbiguousAmount('Ambiguous thousands or decimal separator, write the decimals.')
+
+    if match['group']:
+        value = value.replace(match['group'], '')
+    return Decimal(value.replace(',', '.'))
+
+
+def _with_description(row):
+    memo = row.pop('memo', '')
+    if not row.get('description'):
+        row['description'] = memo
+    return row
+
+
+PARSERS = {
+    'csv': (parse_csv, '%Y-%m-%d'),
+    'qif': (parse_qif, '%m/%d/%Y'),
+    'ofx': (parse_ofx, '%Y%m%d'),
+}
+
+
+class EntryImporter:
+    """
+    Validate parsed rows and insert them with batched `bulk_create` in one transaction.
+
+    The budgets of the user and the categories are loaded once, so validating a row
+    does not hit the database.
+    """
+    batch_size = 500
+
+    def __init__(self, user, budget=None, category=None, date_format=None):
+        self.user = user
+        self.date_format = date_format
+        # Archive boundary of each budget of the user
+        self.budgets = dict(Budget.objects.filter(owner=user).values_list('id', 'archived_until'))
+        self.categories = {}
+        for pk, title in categories.titles().items():
+            self.categories[str(pk)] = pk
+            self.categories[title.lower()] = pk
+        self.default_budget = budget
+        self.default_category = category
+
+    def run(self, rows):
+        started = time.perf_counter()
+        created, errors, total, batch = 0, [], 0, []
+
+        with transaction.atomic():
+            for line, row in rows:
+                total += 1
+                entry, row_errors = self.build_entry(row)
+
+                if row_errors:
+                    errors.append({'row': line, 'errors': row_errors})
+                    continue
+
+                batch.append(entry)
+                if len(batch) >= self.batch_size:
+                    created += self.write(batch)
+                    batch = []
+
+            if batch:
+                created += self.write(batch)
+
+        elapsed = time.perf_counter() - started
+        return {
+            'rows': total,
+            'created': created,
+            'errors': errors,
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(total / elapsed, 1) if elapsed else None,
+        }
+
+    def write(self, entries):
+        Entry.objects.bulk_create(entries)
+        entries_changed.send(sender=Entry, added=[entry.tracked_state() for entry in entries], removed=[])
+        return len(entries)
+
+    def build_entry(self, row):
+        errors = {}
+
+        budget = row.get('budget') or self.default_budget
+        try:
+            budget = int(budget)
+        except (TypeError, ValueError):
+            budget = None
+        if budget not in self.budgets:
+            errors['budget'] = 'Budget must belong to the user'
+
+        category = self.categories.get(str(row.get('category') or self.default_category or '').strip().lower())
+        if category is None:
+            errors['category'] = 'Unknown category'
+
+        description = row.get('description', '')
+        if not description:
+            errors['description'] = 'This field is required.'
+        elif len(description) > DESCRIPTION_MAX_LENGTH:
+            errors['description'] = f'Ensure this field has no more than {DESCRIPTION_MAX_LENGTH} characters.'
+
+        try:
+            amount = parse_amount(row.get('amount', ''))
+            if not amount.is_finite() or abs(amount) >= AMOUNT_LIMIT:
+                raise InvalidOperation
+        except InvalidOperation:
+            errors['amount'] = 'A valid number is required.'
+            amount = None
+        except AmbiguousAmount as e:
+            errors['amount'] = str(e)
+            amount = None
+
+        try:
+            date = self.parse_date(row.get('date', ''))
+        except ValueError:
+            errors['date'] = 'Date has wrong format.'
+            date = None
+        if budget in self.budgets and archive.is_archived(date, self.budgets[budget]):
+            errors['date'] = archive.archived_error(self.budgets[budget])
+
+        if errors:
+            return None, errors
+
+        if row.get('is_positive'):
+            is_positive = row['is_positive'].lower() in TRUE_VALUES
+        else:
+            is_positive = amount > 0
+
+        return Entry(description=description, amount=abs(amount).quantize(Decimal('0.01')), date=date,
+                     is_positive=is_positive, budget_id=budget, category_id=category, owner=self.user), None
+
+    def parse_date(self, value):
+        value = value.strip()
+        if self.date_format == '%m/%d/%Y':
+            # QIF writes two digit years as MM/DD'YY
+            value = value.replace("'", '/').replace(' ', '')
+            if len(value.rsplit('/', 1)[-1]) == 2:
+                return datetime.strptime(value, '%m/%d/%y').date()
+        return datetime.strptime(value, self.date_format).date()
@@ -0,0 +1,21 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from budgets import archive
+
+
+class Command(BaseCommand):
+    help = 'Move the entries of the years before the archive horizon to the archive, a budget per transaction.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horizon', type=int, help='Years kept before the current one, '
+                                                        'ENTRY_ARCHIVE_HORIZON_YEARS by default')
+        parser.add_argument('--batch-size', type=int, default=archive.BATCH_SIZE, help='Entries moved per statement')
+
+    def handle(self, *args, **options):
+        if options['horizon'] is not None and options['horizon'] < 0:
+            raise CommandError('--horizon must not be negative')
+
+        counts = archive.archive(archive.cutoff(options['horizon']), options['batch_size'])
+        self.stdout.write(json.dumps(counts, indent=2))
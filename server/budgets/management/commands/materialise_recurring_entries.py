@@ -0,0 +1,19 @@
+import json
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from budgets import recurring
+
+
+class Command(BaseCommand):
+    help = 'Create the entries of the recurring entries due up to a date. Several workers can run at once.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--until', type=date.fromisoformat, help='Last date to create entries for, YYYY-MM-DD, '
+                                                                    'today by default')
+        parser.add_argument('--batch-size', type=int, default=recurring.BATCH_SIZE, help='Rules per transaction')
+
+    def handle(self, *args, **options):
+        counts = recurring.materialise(options['until'], options['batch_size'])
+        self.stdout.write(json.dumps(counts, indent=2))
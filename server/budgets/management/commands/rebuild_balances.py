@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from budgets import balances
+
+
+class Command(BaseCommand):
+    help = 'Recompute the budget balances and the running balances of the entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('budget_ids', nargs='*', type=int, help='Only rebuild these budgets')
+
+    def handle(self, *args, **options):
+        budget_ids = options['budget_ids'] or None
+        count = balances.rebuild(budget_ids)
+        self.stdout.write(self.style.SUCCESS(f'Fixed the running balance of {count} entries'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from budgets import rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the monthly per category rollups used by the budget overview'
+
+    def add_arguments(self, parser):
+        parser.add_argument('budget_ids', nargs='*', type=int, help='Only rebuild these budgets')
+
+    def handle(self, *args, **options):
+        budget_ids = options['budget_ids'] or None
+        count = rollups.rebuild(budget_ids)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} rollup rows'))
@@ -0,0 +1,47 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:25
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+import django.db.models.deletion
+
+
+def populate_rollups(apps, schema_editor):
+    Entry = apps.get_model('budgets', 'Entry')
+    MonthlyRollup = apps.get_model('budgets', 'MonthlyRollup')
+
+    rows = Entry.objects.annotate(month=TruncMonth('date')).values('budget_id', 'category_id', 'month').annotate(
+        positive_total=Sum('amount', filter=Q(is_positive=True), default=0),
+        negative_total=Sum('amount', filter=Q(is_positive=False), default=0),
+        positive_count=Count('id', filter=Q(is_positive=True)),
+        negative_count=Count('id', filter=Q(is_positive=False)),
+    ).order_by()
+    MonthlyRollup.objects.bulk_create([MonthlyRollup(**row) for row in rows], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgets', '0002_budget_base'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('positive_total', models.DecimalField(decimal_places=2, default=0, max_digits=19)),
+                ('negative_total', models.DecimalField(decimal_places=2, default=0, max_digits=19)),
+                ('positive_count', models.IntegerField(default=0)),
+                ('negative_count', models.IntegerField(default=0)),
+                ('budget', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='budgets.budget')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='budgets.category')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='monthlyrollup',
+            constraint=models.UniqueConstraint(fields=('budget', 'category', 'month'), name='unique_budget_category_month'),
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
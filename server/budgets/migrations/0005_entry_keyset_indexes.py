@@ -0,0 +1,45 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgets', '0004_entry_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='entry',
+            name='entry_owner_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='entry',
+            name='entry_owner_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='entry',
+            name='entry_owner_amount_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='entry',
+            name='entry_owner_description_idx',
+        ),
+        migrations.AddIndex(
+            model_name='entry',
+            index=models.Index(fields=['owner', 'created', 'id'], name='entry_owner_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='entry',
+            index=models.Index(fields=['owner', 'date', 'id'], name='entry_owner_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='entry',
+            index=models.Index(fields=['owner', 'amount', 'id'], name='entry_owner_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='entry',
+            index=models.Index(fields=['owner', 'description', 'id'], name='entry_owner_description_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:36
+
+from django.db import migrations, models
+
+
+def populate_balances(apps, schema_editor):
+    Budget = apps.get_model('budgets', 'Budget')
+    Entry = apps.get_model('budgets', 'Entry')
+
+    for budget in Budget.objects.all():
+        balance, changed = budget.base, []
+        for entry in Entry.objects.filter(budget=budget).order_by('date', 'id').only('id', 'amount', 'is_positive'):
+            balance += entry.amount if entry.is_positive else -entry.amount
+            entry.running_balance = balance
+            changed.append(entry)
+        Entry.objects.bulk_update(changed, ['running_balance'], batch_size=1000)
+        Budget.objects.filter(pk=budget.pk).update(balance=balance)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgets', '0005_entry_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='budget',
+            name='balance',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=19),
+        ),
+        migrations.AddField(
+            model_name='entry',
+            name='running_balance',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=19),
+        ),
+        migrations.AddIndex(
+            model_name='entry',
+            index=models.Index(fields=['budget', 'date', 'id'], name='entry_budget_date_id_idx'),
+        ),
+        migrations.RunPython(populate_balances, migrations.RunPython.noop),
+    ]
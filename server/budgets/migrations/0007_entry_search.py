@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from portfolio import search
+
+
+def create_index(apps, schema_editor):
+    search.create_index(schema_editor, 'budgets_entry', ['description'])
+
+
+def drop_index(apps, schema_editor):
+    search.drop_index(schema_editor, 'budgets_entry', ['description'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgets', '0006_balances'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
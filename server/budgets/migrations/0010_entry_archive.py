@@ -0,0 +1,90 @@
+# Generated by Django 4.1.13 on 2026-10-18 13:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# On PostgreSQL the archive is partitioned by year, the partitions are created by budgets.archive
+# when years are archived. The primary key of a partitioned table has to include the partition key.
+PARTITIONED_TABLE = """
+CREATE TABLE {table} (
+    id bigint NOT NULL,
+    description varchar(100) NOT NULL,
+    amount numeric(19, 2) NOT NULL,
+    date date NOT NULL,
+    is_positive boolean NOT NULL,
+    running_balance numeric(19, 2) NOT NULL,
+    created timestamp with time zone NOT NULL,
+    updated timestamp with time zone NOT NULL,
+    budget_id bigint NOT NULL REFERENCES {budget} (id) DEFERRABLE INITIALLY DEFERRED,
+    category_id bigint NOT NULL REFERENCES {category} (id) DEFERRABLE INITIALLY DEFERRED,
+    owner_id bigint NOT NULL REFERENCES {owner} (id) DEFERRABLE INITIALLY DEFERRED,
+    recurring_id bigint NULL REFERENCES {recurring} (id) DEFERRABLE INITIALLY DEFERRED,
+    PRIMARY KEY (id, date)
+) PARTITION BY RANGE (date)
+"""
+
+
+def create_archive_table(apps, schema_editor):
+    model = apps.get_model('budgets', 'ArchivedEntry')
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.create_model(model)
+        return
+
+    def table(model_name):
+        return schema_editor.quote_name(apps.get_model(model_name)._meta.db_table)
+
+    schema_editor.execute(PARTITIONED_TABLE.format(
+        table=table('budgets.ArchivedEntry'), budget=table('budgets.Budget'), category=table('budgets.Category'),
+        owner=table(settings.AUTH_USER_MODEL), recurring=table('budgets.RecurringEntry')))
+    for index in model._meta.indexes:
+        schema_editor.add_index(model, index)
+
+
+def drop_archive_table(apps, schema_editor):
+    # Drops the partitions with the table on PostgreSQL
+    schema_editor.delete_model(apps.get_model('budgets', 'ArchivedEntry'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('budgets', '0009_allocations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='budget',
+            name='archived_until',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        # The table is created by create_archive_table
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.CreateModel(
+                name='ArchivedEntry',
+                fields=[
+                    ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                    ('description', models.CharField(max_length=100)),
+                    ('amount', models.DecimalField(decimal_places=2, max_digits=19)),
+                    ('date', models.DateField()),
+                    ('is_positive', models.BooleanField(default=False)),
+                    ('running_balance', models.DecimalField(decimal_places=2, default=0, max_digits=19)),
+                    ('created', models.DateTimeField()),
+                    ('updated', models.DateTimeField()),
+                    ('budget', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_entries', to='budgets.budget')),
+                    ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_entries', to='budgets.category')),
+                    ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_entries', to=settings.AUTH_USER_MODEL)),
+                    ('recurring', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_entries', to='budgets.recurringentry')),
+                ],
+                options={
+                    'ordering': ['created'],
+                    'indexes': [
+                        models.Index(fields=['owner', 'date', 'id'], name='archived_owner_date_idx'),
+                        models.Index(fields=['budget', 'date', 'id'], name='archived_budget_date_id_idx'),
+                    ],
+                },
+            ),
+        ]),
+        migrations.RunPython(create_archive_table, drop_archive_table),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.1.13 on 2026-10-18 14:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgets', '0011_change_feed'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='archivedentry',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_entries', to='budgets.category'),
+        ),
+    ]
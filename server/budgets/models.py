@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from datetime import date
 
@@ -7,21 +7,48 @@ class Budget(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField(max_length=500, blank=True, null=True)
     base = models.DecimalField(max_digits=19, decimal_places=2, blank=True, default=0)
+    # Base plus the signed amounts of the entries, maintained by budgets.balances
+    balance = models.DecimalField(max_digits=19, decimal_places=2, default=0, editable=False)
+    # The entries dated before are in ArchivedEntry, maintained by budgets.archive
+    archived_until = models.DateField(blank=True, null=True, editable=False)
+    # Change sequence of the owner when the budget or its balance last changed, see budgets.sync
+    change_seq = models.BigIntegerField(default=0, editable=False)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='budgets', on_delete=models.CASCADE)
 
+    # Fields written in place by the derived data maintenance, not by `save()`.
+    DERIVED_FIELDS = ('balance', 'archived_until', 'change_seq')
+
     class Meta:
         ordering = ['created']
+        indexes = [
+            models.Index(fields=['owner', 'created'], name='budget_owner_created_idx'),
+            models.Index(fields=['owner', 'change_seq'], name='budget_owner_change_seq_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.balance = self.base
+        elif kwargs.get('update_fields') is None:
+            # The balance is updated in place by the entry writes, the archive boundary by the archival
+            # and the change sequence by budgets.sync, don't overwrite them with the loaded values.
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.DERIVED_FIELDS]
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 
 class Category(models.Model):
     title = models.CharField(max_length=255, unique=True)
     description = models.TextField(max_length=1000, blank=True, null=True)
+    # Change sequence of the categories when the category last changed, see budgets.sync
+    change_seq = models.BigIntegerField(default=0, editable=False)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
@@ -31,21 +58,272 @@ class Category(models.Model):
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # The change sequence is taken by a signal handler, keep it in the same transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class Allocation(models.Model):
+    """
+    Amount a budget allows to spend on a category each month. The spending is
+    read from the `MonthlyRollup` of the month, see `api.budget_allowances`.
+    """
+    amount = models.DecimalField(max_digits=19, decimal_places=2)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    budget = models.ForeignKey(Budget, related_name='allocations', on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, related_name='allocations', on_delete=models.CASCADE)
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='allocations', on_delete=models.CASCADE)
+
+    class Meta:
+        ordering = ['created']
+        constraints = [
+            models.UniqueConstraint(fields=['budget', 'category'], name='unique_budget_category_allocation'),
+        ]
+
+    def __str__(self):
+        return f'{self.budget_id}/{self.category_id}: {self.amount}'
+
+
+class RecurringEntry(models.Model):
+    """
+    Rule creating an entry every `interval` days, weeks, months or years from `start_date`,
+    on `day_of_month` for the monthly and yearly rules when given, until `end_date`.
+    The entries are created by `budgets.recurring.materialise`.
+    """
+    DAILY = 'daily'
+    WEEKLY = 'weekly'
+    MONTHLY = 'monthly'
+    YEARLY = 'yearly'
+    FREQUENCY_CHOICES = [(DAILY, 'Daily'), (WEEKLY, 'Weekly'), (MONTHLY, 'Monthly'), (YEARLY, 'Yearly')]
+
+    description = models.CharField(max_length=100)
+    amount = models.DecimalField(max_digits=19, decimal_places=2)
+    is_positive = models.BooleanField(default=False)
+    frequency = models.CharField(choices=FREQUENCY_CHOICES, default=MONTHLY, max_length=10)
+    interval = models.PositiveSmallIntegerField(default=1)
+    day_of_month = models.PositiveSmallIntegerField(blank=True, null=True)
+    start_date = models.DateField(default=date.today)
+    end_date = models.DateField(blank=True, null=True)
+    # Date of the next entry to create, None once past the end date
+    next_date = models.DateField(blank=True, null=True, editable=False)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    budget = models.ForeignKey(Budget, related_name='recurring_entries', on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, related_name='recurring_entries', on_delete=models.CASCADE)
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='recurring_entries', on_delete=models.CASCADE)
+
+    class Meta:
+        ordering = ['created']
+        indexes = [
+            # Due rules of the scheduler
+            models.Index(fields=['next_date', 'id'], name='recurring_next_date_idx'),
+        ]
+
+    def __str__(self):
+        return self.description
+
+    def save(self, *args, **kwargs):
+        from . import recurring
+
+        # The rule may have changed: continue after the entries it already created
+        recurring.reschedule(self)
+        super().save(*args, **kwargs)
+
+
+class EntryQuerySet(models.QuerySet):
+    def delete(self):
+        """
+        Delete in bulk and send one `entries_changed` for the deleted entries, unless the caller
+        is a `bulk_write()` which sends it itself.
+        """
+        from .signals import bulk_write, entries_changed, in_bulk_write
+
+        if in_bulk_write():
+            return super().delete()
+
+        with transaction.atomic():
+            states = list(self.values(*Entry.TRACKED_FIELDS))
+            with bulk_write():
+                result = super().delete()
+            if states:
+                entries_changed.send(sender=Entry, added=[], removed=states)
+            return result
+
 
 class Entry(models.Model):
     description = models.CharField(max_length=100)
     amount = models.DecimalField(max_digits=19, decimal_places=2)
     date = models.DateField(default=date.today)
     is_positive = models.BooleanField(default=False)
+    # Budget balance after this entry, entries being ordered by (date, id), maintained by budgets.balances
+    running_balance = models.DecimalField(max_digits=19, decimal_places=2, default=0, editable=False)
+    # Change sequence of the owner when the entry last changed, see budgets.sync
+    change_seq = models.BigIntegerField(default=0, editable=False)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
     budget = models.ForeignKey(Budget, related_name='entries', on_delete=models.CASCADE)
     category = models.ForeignKey(Category, related_name='entries', on_delete=models.CASCADE)
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='entries', on_delete=models.CASCADE)
+    # Rule that created the entry, with `date` the occurrence it was created for
+    recurring = models.ForeignKey(RecurringEntry, related_name='entries', on_delete=models.SET_NULL, blank=True,
+                                  null=True, editable=False)
+
+    objects = EntryQuerySet.as_manager()
+
+    # Fields the derived tables depend on.
+    TRACKED_FIELDS = ('id', 'budget_id', 'category_id', 'date', 'amount', 'is_positive', 'owner_id', 'description')
+
+    class Meta:
+        ordering = ['created']
+        indexes = [
+            # Entry list, default ordering and `EntryFilter.order` choices, with the keyset tie-breaker
+            models.Index(fields=['owner', 'created', 'id'], name='entry_owner_created_idx'),
+            models.Index(fields=['owner', 'date', 'id'], name='entry_owner_date_idx'),
+            models.Index(fields=['owner', 'amount', 'id'], name='entry_owner_amount_idx'),
+            models.Index(fields=['owner', 'description', 'id'], name='entry_owner_description_idx'),
+            # Budget overview, per budget date ranges and running balances
+            models.Index(fields=['owner', 'budget', 'date'], name='entry_owner_budget_date_idx'),
+            models.Index(fields=['budget', 'date', 'id'], name='entry_budget_date_id_idx'),
+            models.Index(fields=['budget', 'category', 'date'], name='entry_budget_category_date_idx'),
+            # Change feed
+            models.Index(fields=['owner', 'change_seq', 'id'], name='entry_owner_change_seq_idx'),
+        ]
+        constraints = [
+            # One entry per occurrence of a rule, even when schedulers race
+            models.UniqueConstraint(fields=['recurring', 'date'], condition=models.Q(recurring__isnull=False),
+                                    name='unique_recurring_occurrence'),
+        ]
+
+    def __str__(self):
+        return self.description
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the persisted values so that derived tables (see budgets.signals)
+        # can be adjusted without fetching the row again on update.
+        instance._loaded_state = instance.tracked_state()
+        return instance
+
+    def tracked_state(self):
+        """
+        Return the values the rollups, balances and search index derive from, or `None` if some of them are deferred.
+        """
+        deferred = self.get_deferred_fields()
+        if any(field in deferred for field in self.TRACKED_FIELDS):
+            return None
+        return {field: getattr(self, field) for field in self.TRACKED_FIELDS}
+
+    def save(self, *args, **kwargs):
+        # The derived data is updated by signal handlers, keep it in the same transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        from .signals import entry_deleted
+
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            # Not a post_delete receiver: it would make the budget and category deletes cascade entry by entry
+            entry_deleted(self)
+            return result
+
+
+class ArchivedEntry(models.Model):
+    """
+    Entry moved out of the entries table by `budgets.archive`, with its id and running balance.
+    On PostgreSQL the table is partitioned by year of `date`, see migration 0010.
+    """
+    # The id of the entry, a BigAutoField
+    id = models.BigIntegerField(primary_key=True)
+    description = models.CharField(max_length=100)
+    amount = models.DecimalField(max_digits=19, decimal_places=2)
+    date = models.DateField()
+    is_positive = models.BooleanField(default=False)
+    running_balance = models.DecimalField(max_digits=19, decimal_places=2, default=0)
+    # Kept from the entry, archived entries are not part of the change feed
+    change_seq = models.BigIntegerField(default=0)
+    created = models.DateTimeField()
+    updated = models.DateTimeField()
+
+    budget = models.ForeignKey(Budget, related_name='archived_entries', on_delete=models.CASCADE)
+    # Deleting them would shift the archived running balances, see `budgets.signals.delete_category_entries`
+    category = models.ForeignKey(Category, related_name='archived_entries', on_delete=models.PROTECT)
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='archived_entries', on_delete=models.CASCADE)
+    recurring = models.ForeignKey(RecurringEntry, related_name='archived_entries', on_delete=models.SET_NULL,
+                                  blank=True, null=True)
 
     class Meta:
         ordering = ['created']
+        indexes = [
+            # Entry list and budget overview reaching into the archived years, running balances
+            models.Index(fields=['owner', 'date', 'id'], name='archived_owner_date_idx'),
+            models.Index(fields=['budget', 'date', 'id'], name='archived_budget_date_id_idx'),
+        ]
 
     def __str__(self):
         return self.description
+
+
+class MonthlyRollup(models.Model):
+    """
+    Sums and counts of the entries of a budget, per category and per month.
+    Maintained incrementally from Entry writes, see `budgets.rollups`.
+    """
+    month = models.DateField()
+    positive_total = models.DecimalField(max_digits=19, decimal_places=2, default=0)
+    negative_total = models.DecimalField(max_digits=19, decimal_places=2, default=0)
+    positive_count = models.IntegerField(default=0)
+    negative_count = models.IntegerField(default=0)
+
+    budget = models.ForeignKey(Budget, related_name='rollups', on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, related_name='rollups', on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['budget', 'category', 'month'], name='unique_budget_category_month'),
+        ]
+
+    def __str__(self):
+        return f'{self.budget_id}/{self.category_id}/{self.month:%Y-%m}'
+
+
+class ChangeSequence(models.Model):
+    """
+    Last change sequence number of a scope: `user:<id>` for the budgets and entries of a user,
+    `categories` for the categories. See `budgets.sync`.
+    """
+    scope = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.scope}: {self.value}'
+
+
+class Tombstone(models.Model):
+    """
+    Deletion of a budget, entry or category, for the change feed of `budgets.sync`.
+    """
+    BUDGET = 'budget'
+    ENTRY = 'entry'
+    CATEGORY = 'category'
+    KIND_CHOICES = [(BUDGET, 'Budget'), (ENTRY, 'Entry'), (CATEGORY, 'Category')]
+
+    scope = models.CharField(max_length=50)
+    kind = models.CharField(choices=KIND_CHOICES, max_length=10)
+    object_id = models.BigIntegerField()
+    change_seq = models.BigIntegerField()
+    deleted = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['scope', 'change_seq'], name='tombstone_scope_change_seq_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.object_id}'
@@ -0,0 +1,171 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def filter_parts(queryset, condition):
+    """
+    `queryset.filter(condition)`, applied to each part of a union, which can't be filtered as a whole.
+    """
+    if not queryset.query.combinator:
+        return queryset.filter(condition)
+
+    queryset = queryset.all()
+    parts = []
+    for query in queryset.query.combined_queries:
+        query = query.chain()
+        query.add_q(condition)
+        parts.append(query)
+    queryset.query.combined_queries = tuple(parts)
+    return queryset
+
+
+class KeysetPagination(pagination.BasePagination):
+    """
+    Paginate on the (ordering field, id) values of the last row seen instead of an offset.
+
+    The ordering is the one already applied to the queryset (e.g. by `EntryFilter.order`),
+    falling back to the model default. Only the first ordering term is used, with `id`
+    in the same direction as tie-breaker, so each page is a single indexed range query
+    and cursors stay valid when rows are inserted.
+    """
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.field, self.descending = self.get_ordering(queryset)
+        position = self.decode_cursor(request)
+        self.reverse = bool(position and position['reverse'])
+
+        # Walking backwards is walking forwards on the reversed ordering.
+        descending = self.descending != self.reverse
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(prefix + self.field, prefix + 'id')
+
+        if position is not None:
+            lookup = 'lt' if descending else 'gt'
+            queryset = filter_parts(queryset, (
+                Q(**{f'{self.field}__{lookup}': position['value']}) |
+                Q(**{self.field: position['value'], f'id__{lookup}': position['id']})
+            ))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_ordering(self, queryset):
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        term = ordering[0] if ordering else 'id'
+
+        if not isinstance(term, str):
+            raise ValidationError({self.cursor_query_param: 'Cursor pagination is not available for this ordering'})
+
+        descending = term.startswith('-')
+        name = term.lstrip('-')
+
+        try:
+            field = queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            field = None
+
+        if field is None or not field.concrete or field.null or field.is_relation:
+            raise ValidationError({self.cursor_query_param: 'Cursor pagination is not available for this ordering'})
+
+        self.model_field = field
+        return field.attname, descending
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            # No row to go back from, the first page, still with keyset pagination
+            return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, '')
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            data = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            return {
+                'value': self.model_field.to_python(data['v']),
+                'id': int(data['id']),
+                'reverse': bool(data.get('r')),
+            }
+        except (TypeError, ValueError, KeyError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, item, reverse):
+        value = item[self.field] if isinstance(item, dict) else getattr(item, self.field)
+        pk = item['id'] if isinstance(item, dict) else item.pk
+        data = {'v': value.isoformat() if hasattr(value, 'isoformat') else str(value), 'id': pk}
+        if reverse:
+            data['r'] = 1
+
+        encoded = urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+
+class PageNumberOrKeysetPagination(pagination.PageNumberPagination):
+    """
+    Page number pagination, unless the request asks for keyset pagination with a
+    `cursor` parameter (left empty for the first page).
+    """
+    keyset_class = KeysetPagination
+    keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.keyset_class.cursor_query_param in request.query_params:
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+
+        return super().get_paginated_response(data)
@@ -0,0 +1,155 @@
+"""
+Entries created from the recurring entry rules.
+
+`materialise` creates the entries of the rules due up to a date, a batch of
+rules at a time. Each batch locks its rules, skipping the ones locked by other
+workers, bulk inserts their entries and moves their `next_date` past the date
+in one transaction. (recurring, date) is the idempotency key: occurrences
+already created are skipped, and a batch racing another worker on a database
+without row locks fails on its unique constraint and is read again.
+"""
+import calendar
+import time
+from datetime import date, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max
+
+from .models import Entry, RecurringEntry
+from .signals import entries_changed
+from . import archive
+
+BATCH_SIZE = 500
+MAX_CONFLICTS = 10
+
+MONTHS = {RecurringEntry.MONTHLY: 1, RecurringEntry.YEARLY: 12}
+DAYS = {RecurringEntry.DAILY: 1, RecurringEntry.WEEKLY: 7}
+
+OCCURRENCE_TAKEN = 'The recurring entry already has an entry on this date'
+
+
+def add_months(day, months, day_of_month):
+    """
+    The `day_of_month` of `months` months after the month of `day`, the last day of shorter months.
+    """
+    year, month = divmod(day.year * 12 + day.month - 1 + months, 12)
+    return date(year, month + 1, min(day_of_month, calendar.monthrange(year, month + 1)[1]))
+
+
+def anchor_day(rule):
+    return rule.day_of_month or rule.start_date.day
+
+
+def first_occurrence(rule):
+    if rule.frequency in DAYS:
+        return rule.start_date
+
+    day = add_months(rule.start_date, 0, anchor_day(rule))
+    if day < rule.start_date:
+        day = add_months(rule.start_date, MONTHS[rule.frequency], anchor_day(rule))
+    return day
+
+
+def following(rule, day):
+    if rule.frequency in DAYS:
+        return day + timedelta(days=DAYS[rule.frequency] * rule.interval)
+    # From the anchor day each time, so that a 31st clamped to the 30th comes back to the 31st
+    return add_months(day, MONTHS[rule.frequency] * rule.interval, anchor_day(rule))
+
+
+def ended(rule, day):
+    return day is None or (rule.end_date is not None and day > rule.end_date)
+
+
+def reschedule(rule):
+    """
+    Set `next_date` to the first occurrence after the entries already created by the rule.
+    """
+    last = rule.entries.aggregate(last=Max('date'))['last'] if rule.pk else None
+    day = first_occurrence(rule)
+    while last is not None and day <= last and not ended(rule, day):
+        day = following(rule, day)
+    rule.next_date = None if ended(rule, day) else day
+
+
+def occurrences(rule, until):
+    """
+    The dates of the entries to create up to `until`, and the `next_date` after them.
+    """
+    dates, day = [], rule.next_date
+    while not ended(rule, day) and day <= until:
+        dates.append(day)
+        day = following(rule, day)
+    return dates, None if ended(rule, day) else day
+
+
+def taken(occurrences):
+    """
+    The (recurring, date) pairs of `occurrences` which already have an entry, in one query.
+    """
+    if not occurrences:
+        return set()
+    rules, days = zip(*occurrences)
+    return set(Entry.objects.filter(recurring_id__in=set(rules), date__in=set(days))
+               .values_list('recurring_id', 'date')) & set(occurrences)
+
+
+def materialise(until=None, batch_size=BATCH_SIZE):
+    """
+    Create the entries of all the rules due up to `until`, today by default. Returns the counts.
+    """
+    until = until or date.today()
+    started = time.perf_counter()
+    rules = created = conflicts = 0
+
+    while True:
+        try:
+            batch_rules, batch_entries = materialise_batch(until, batch_size)
+        except IntegrityError:
+            # Another worker created some of these occurrences first, the rules have moved on since.
+            conflicts += 1
+            if conflicts > MAX_CONFLICTS:
+                raise
+            continue
+
+        if not batch_rules:
+            break
+        rules += batch_rules
+        created += batch_entries
+
+    elapsed = time.perf_counter() - started
+    return {
+        'rules': rules,
+        'entries': created,
+        'conflicts': conflicts,
+        'seconds': round(elapsed, 3),
+        'entries_per_second': round(created / elapsed, 1) if elapsed else None,
+    }
+
+
+def materialise_batch(until, batch_size):
+    with transaction.atomic():
+        rules = list(RecurringEntry.objects.select_for_update(skip_locked=True, of=('self',))
+                     .filter(next_date__lte=until).annotate(archived_until=F('budget__archived_until'))
+                     .order_by('next_date', 'id')[:batch_size])
+        if not rules:
+            return 0, 0
+
+        # Occurrences created before, e.g. by a run interrupted after its commit or a rule moved back
+        existing = set(Entry.objects.filter(recurring__in=rules, date__gte=min(rule.next_date for rule in rules))
+                       .values_list('recurring_id', 'date'))
+        entries = []
+
+        for rule in rules:
+            dates, rule.next_date = occurrences(rule, until)
+            entries += [Entry(description=rule.description, amount=rule.amount, date=day, is_positive=rule.is_positive,
+                              budget_id=rule.budget_id, category_id=rule.category_id, owner_id=rule.owner_id,
+                              recurring=rule) for day in dates
+                        # Archived years are closed, their occurrences are skipped
+                        if (rule.pk, day) not in existing and not archive.is_archived(day, rule.archived_until)]
+
+        Entry.objects.bulk_create(entries, batch_size=1000)
+        RecurringEntry.objects.bulk_update(rules, ['next_date'])
+        entries_changed.send(sender=Entry, added=[entry.tracked_state() for entry in entries], removed=[])
+
+    return len(rules), len(entries)
@@ -0,0 +1,187 @@
+from calendar import monthrange
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncMonth
+
+from .models import ArchivedEntry, Entry, MonthlyRollup
+
+DATE_FIELD = Entry._meta.get_field('date')
+AMOUNT_FIELD = Entry._meta.get_field('amount')
+# Above this many touched rows, read them at once and write them in bulk instead of one UPDATE each.
+BULK_LIMIT = 20
+
+
+class RollupDelta:
+    """
+    Accumulate entry changes per (budget, category, month) and write them
+    with a single UPDATE per touched rollup row, or in bulk for large writes.
+    """
+
+    def __init__(self):
+        self.changes = defaultdict(lambda: [Decimal(0), Decimal(0), 0, 0])
+
+    def add(self, budget_id, category_id, date, amount, is_positive, sign=1):
+        date = DATE_FIELD.to_python(date)
+        amount = AMOUNT_FIELD.to_python(amount)
+        change = self.changes[(budget_id, category_id, date.replace(day=1))]
+
+        if is_positive:
+            change[0] += sign * amount
+            change[2] += sign
+        else:
+            change[1] += sign * amount
+            change[3] += sign
+
+    def add_state(self, state, sign=1):
+        """
+        Add a `Entry.tracked_state()` dict, or remove it when `sign` is -1.
+        """
+        self.add(state['budget_id'], state['category_id'], state['date'], state['amount'], state['is_positive'], sign)
+
+    def apply(self):
+        changes = {key: change for key, change in self.changes.items() if any(change)}
+
+        with transaction.atomic():
+            if len(changes) > BULK_LIMIT:
+                self.apply_in_bulk(changes)
+            else:
+                for key, change in changes.items():
+                    self.apply_one(key, change)
+
+        self.changes.clear()
+
+    def apply_one(self, key, change):
+        budget_id, category_id, month = key
+        positive_total, negative_total, positive_count, negative_count = change
+
+        updated = MonthlyRollup.objects.filter(budget_id=budget_id, category_id=category_id, month=month).update(
+            positive_total=F('positive_total') + positive_total,
+            negative_total=F('negative_total') + negative_total,
+            positive_count=F('positive_count') + positive_count,
+            negative_count=F('negative_count') + negative_count,
+        )
+
+        # Removals never create rows: the rollup may already be gone with a deleted budget or category.
+        if not updated and (positive_count > 0 or negative_count > 0):
+            try:
+                with transaction.atomic():
+                    MonthlyRollup.objects.create(
+                        budget_id=budget_id, category_id=category_id, month=month,
+                        positive_total=positive_total, negative_total=negative_total,
+                        positive_count=positive_count, negative_count=negative_count,
+                    )
+            except IntegrityError:
+                # Created by a concurrent write since the update, which now finds it
+                self.apply_one(key, change)
+
+    def apply_in_bulk(self, changes):
+        """
+        Read the touched rows locked, then write them with one bulk update and one bulk insert.
+        """
+        budget_ids, category_ids, months = (set(values) for values in zip(*changes))
+        rows = MonthlyRollup.objects.select_for_update().filter(
+            budget_id__in=budget_ids, category_id__in=category_ids, month__in=months)
+        existing = {(row.budget_id, row.category_id, row.month): row for row in rows}
+        updated, created = [], []
+
+        for key, (positive_total, negative_total, positive_count, negative_count) in changes.items():
+            row = existing.get(key)
+            if row is None:
+                if positive_count > 0 or negative_count > 0:
+                    created.append(MonthlyRollup(
+                        budget_id=key[0], category_id=key[1], month=key[2],
+                        positive_total=positive_total, negative_total=negative_total,
+                        positive_count=positive_count, negative_count=negative_count,
+                    ))
+                continue
+
+            row.positive_total += positive_total
+            row.negative_total += negative_total
+            row.positive_count += positive_count
+            row.negative_count += negative_count
+            updated.append(row)
+
+        MonthlyRollup.objects.bulk_update(
+            updated, ['positive_total', 'negative_total', 'positive_count', 'negative_count'], batch_size=500)
+        if not created:
+            return
+        try:
+            with transaction.atomic():
+                MonthlyRollup.objects.bulk_create(created, batch_size=1000)
+        except IntegrityError:
+            # Some were created by a concurrent write since they were read, add to them one by one
+            for row in created:
+                self.apply_one((row.budget_id, row.category_id, row.month), [
+                    row.positive_total, row.negative_total, row.positive_count, row.negative_count])
+
+
+def rebuild(budget_ids=None):
+    """
+    Recompute the rollups from the entries and the archived entries, for every budget or for the given ones.
+    """
+    rollups = MonthlyRollup.objects.all()
+    querysets = [Entry.objects.all(), ArchivedEntry.objects.all()]
+
+    if budget_ids is not None:
+        rollups = rollups.filter(budget_id__in=budget_ids)
+        querysets = [queryset.filter(budget_id__in=budget_ids) for queryset in querysets]
+
+    # The archived months are before the months of the entries of their budget, the rows don't overlap.
+    rows = [row for queryset in querysets for row in monthly_sums(queryset)]
+
+    with transaction.atomic():
+        rollups.delete()
+        created = MonthlyRollup.objects.bulk_create([MonthlyRollup(**row) for row in rows], batch_size=1000)
+
+    return len(created)
+
+
+def monthly_sums(entries):
+    return entries.annotate(month=TruncMonth('date')).values('budget_id', 'category_id', 'month').annotate(
+        positive_total=Sum('amount', filter=Q(is_positive=True), default=0),
+        negative_total=Sum('amount', filter=Q(is_positive=False), default=0),
+        positive_count=Count('id', filter=Q(is_positive=True)),
+        negative_count=Count('id', filter=Q(is_positive=False)),
+    ).order_by()
+
+
+def covers_filter(data):
+    """
+    Return True if the cleaned `EntryFilter` data can be answered from the rollups,
+    that is if it only restricts the entries on whole months.
+    """
+    if data.get('description') or data.get('search') or data.get('date') is not None:
+        return False
+
+    if data.get('amount__lte') is not None or data.get('amount__gte') is not None:
+        return False
+
+    start, end = data.get('date__gte'), data.get('date__lte')
+
+    if start is not None and start.day != 1:
+        return False
+
+    if end is not None and end.day != monthrange(end.year, end.month)[1]:
+        return False
+
+    return True
+
+
+def filter_rollups(data, queryset):
+    """
+    Apply the date restrictions of the cleaned `EntryFilter` data to a rollup queryset.
+    """
+    if data.get('date__gte') is not None:
+        queryset = queryset.filter(month__gte=data['date__gte'])
+    if data.get('date__lte') is not None:
+        queryset = queryset.filter(month__lte=data['date__lte'])
+    if data.get('date__year') is not None:
+        queryset = queryset.filter(month__year=data['date__year'])
+    if data.get('date__month') is not None:
+        queryset = queryset.filter(month__month=data['date__month'])
+
+    # Rows whose entries were all removed are kept with zero counts.
+    return queryset.exclude(positive_count=0, negative_count=0)
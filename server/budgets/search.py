@@ -0,0 +1,5 @@
+from portfolio.search import SearchIndex
+
+from .models import Entry
+
+entries = SearchIndex(Entry, ['description'])
@@ -1,12 +1,39 @@
-from rest_framework import serializers, pagination
-from rest_framework.exceptions import ValidationError
+import decimal
 
-from .models import Budget, Category, Entry
+from django.db.models import F, Prefetch, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+from rest_framework import ISO_8601, serializers, pagination
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.settings import api_settings
+
+from portfolio import instrumentation
+from . import analytics, archive, categories, recurring
+from .models import Allocation, Budget, Category, Entry, RecurringEntry
+
+
+class CategoryField(serializers.PrimaryKeyRelatedField):
+    """
+    `PrimaryKeyRelatedField` looking the category up in `budgets.categories` instead of the database.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+        category = categories.get(pk)
+        if category is None:
+            self.fail('does_not_exist', pk_value=data)
+        return category
 
 
 class EntrySerializer(serializers.HyperlinkedModelSerializer):
     budget = serializers.PrimaryKeyRelatedField(queryset=Budget.objects.all(), read_only=False)
-    category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), read_only=False)
+    category = CategoryField(queryset=Category.objects.all(), read_only=False)
     owner = serializers.ReadOnlyField(source='owner.email')
 
     class Meta:
@@ -15,14 +42,158 @@ class EntrySerializer(serializers.HyperlinkedModelSerializer):
                   'owner']
 
     def validate_budget(self, value):
-        print(self.context['request'].user)
-        print(value.owner)
         user_id = self.context['request'].user.id
 
-        if value.owner.id != user_id:
+        if value.owner_id != user_id:
+            raise ValidationError({'budget': 'Budget must belong to the user'})
+        return value
+
+    def validate(self, attrs):
+        if 'budget' in attrs or 'date' in attrs:
+            budget = attrs.get('budget') or self.instance.budget
+            day = attrs.get('date', getattr(self.instance, 'date', None) or Entry._meta.get_field('date').get_default())
+            if archive.is_archived(day, budget.archived_until):
+                raise ValidationError({'date': archive.archived_error(budget.archived_until)})
+        # Moving an entry of a recurring rule onto another of its occurrences breaks `unique_recurring_occurrence`
+        instance = self.instance
+        if getattr(instance, 'recurring_id', None) and attrs.get('date', instance.date) != instance.date:
+            if recurring.taken([(instance.recurring_id, attrs['date'])]):
+                raise ValidationError({'date': recurring.OCCURRENCE_TAKEN})
+        return attrs
+
+
+def fast_representation(field):
+    """
+    `field.to_representation` for a batch of values read from the database, with the
+    settings, decimal context and timezone looked up once instead of for each value.
+    Fields not using the default formats keep their own `to_representation`.
+    """
+    if isinstance(field, serializers.DecimalField):
+        coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+        if coerce_to_string and not field.localize and not field.normalize_output and field.decimal_places is not None:
+            exponent = decimal.Decimal('.1') ** field.decimal_places
+            context = decimal.getcontext().copy()
+            if field.max_digits is not None:
+                context.prec = field.max_digits
+            return lambda value: '{:f}'.format(value.quantize(exponent, rounding=field.rounding, context=context))
+
+    elif isinstance(field, serializers.DateTimeField):
+        field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+        if field_timezone is not None and getattr(field, 'format', api_settings.DATETIME_FORMAT).lower() == ISO_8601:
+            def convert(value):
+                if value.tzinfo is None:
+                    return field.to_representation(value)
+                value = value.astimezone(field_timezone).isoformat()
+                return value[:-6] + 'Z' if value.endswith('+00:00') else value
+            return convert
+
+    elif isinstance(field, serializers.DateField):
+        if getattr(field, 'format', api_settings.DATE_FORMAT).lower() == ISO_8601:
+            return lambda value: value.isoformat()
+
+    return field.to_representation
+
+
+class ValuesSerializer:
+    """
+    Read-only fast path of `serializer_class` for `.values()` rows.
+
+    The field list comes from `serializer_class`: fields whose database value is
+    already the output are copied as is, the others are converted with
+    `fast_representation`, so the JSON is the same. `sources` maps the fields
+    not named after their `.values()` lookup.
+    """
+    serializer_class = None
+    sources = {}
+    passthrough = (serializers.IntegerField, serializers.CharField, serializers.BooleanField,
+                   serializers.ReadOnlyField, serializers.PrimaryKeyRelatedField)
+
+    def __init__(self):
+        self.fields = []
+        for name, field in self.serializer_class().fields.items():
+            converted = None if isinstance(field, self.passthrough) else field
+            self.fields.append((name, self.sources.get(name, name), converted))
+        self.lookups = [lookup for name, lookup, field in self.fields]
+
+    def values(self, queryset):
+        return queryset.values(*self.lookups)
+
+    def mapping(self):
+        return [(name, lookup, field and fast_representation(field)) for name, lookup, field in self.fields]
+
+    def to_representation(self, row, mapping=None):
+        data = {}
+        for name, lookup, convert in mapping or self.mapping():
+            value = row[lookup]
+            data[name] = value if convert is None or value is None else convert(value)
+        return data
+
+    def many(self, rows):
+        mapping = self.mapping()
+        with instrumentation.serializing():
+            return [self.to_representation(row, mapping) for row in rows]
+
+
+class EntryValuesSerializer(ValuesSerializer):
+    serializer_class = EntrySerializer
+    sources = {'budget': 'budget_id', 'category': 'category_id', 'owner': 'owner__email'}
+
+
+class RecurringEntrySerializer(serializers.HyperlinkedModelSerializer):
+    budget = serializers.PrimaryKeyRelatedField(queryset=Budget.objects.all(), read_only=False)
+    category = CategoryField(queryset=Category.objects.all(), read_only=False)
+    owner = serializers.ReadOnlyField(source='owner.email')
+    interval = serializers.IntegerField(min_value=1, max_value=366, default=1)
+    day_of_month = serializers.IntegerField(min_value=1, max_value=31, required=False, allow_null=True)
+
+    class Meta:
+        model = RecurringEntry
+        fields = ['id', 'description', 'amount', 'is_positive', 'frequency', 'interval', 'day_of_month', 'start_date',
+                  'end_date', 'next_date', 'created', 'updated', 'budget', 'category', 'owner']
+
+    def validate_budget(self, value):
+        if value.owner_id != self.context['request'].user.id:
+            raise ValidationError({'budget': 'Budget must belong to the user'})
+        return value
+
+    def validate(self, attrs):
+        frequency = attrs.get('frequency', getattr(self.instance, 'frequency', RecurringEntry.MONTHLY))
+        start_date = attrs.get('start_date', getattr(self.instance, 'start_date', None))
+        end_date = attrs.get('end_date', getattr(self.instance, 'end_date', None))
+        day_of_month = attrs.get('day_of_month', getattr(self.instance, 'day_of_month', None))
+
+        if day_of_month and frequency not in (RecurringEntry.MONTHLY, RecurringEntry.YEARLY):
+            raise ValidationError({'day_of_month': 'Only for monthly and yearly entries'})
+        if start_date and end_date and end_date < start_date:
+            raise ValidationError({'end_date': 'Must not be before the start date'})
+        return attrs
+
+
+class AllocationSerializer(serializers.HyperlinkedModelSerializer):
+    budget = serializers.PrimaryKeyRelatedField(queryset=Budget.objects.all(), read_only=False)
+    category = CategoryField(queryset=Category.objects.all(), read_only=False)
+    owner = serializers.ReadOnlyField(source='owner.email')
+    amount = serializers.DecimalField(max_digits=19, decimal_places=2, min_value=decimal.Decimal(0))
+
+    class Meta:
+        model = Allocation
+        fields = ['id', 'amount', 'created', 'updated', 'budget', 'category', 'owner']
+
+    def validate_budget(self, value):
+        if value.owner_id != self.context['request'].user.id:
             raise ValidationError({'budget': 'Budget must belong to the user'})
         return value
 
+    def validate(self, attrs):
+        budget = attrs.get('budget', getattr(self.instance, 'budget', None))
+        category = attrs.get('category', getattr(self.instance, 'category', None))
+        others = Allocation.objects.filter(budget=budget, category=category)
+        if self.instance is not None:
+            others = others.exclude(pk=self.instance.pk)
+        if others.exists():
+            raise ValidationError({'category': 'The budget already has an allocation for this category'})
+        return attrs
+
 
 class CategorySerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
@@ -35,25 +206,55 @@ class BudgetSerializer(serializers.HyperlinkedModelSerializer):
 
     class Meta:
         model = Budget
-        fields = ['id', 'title', 'description', 'base', 'created', 'updated', 'owner']
+        fields = ['id', 'title', 'description', 'base', 'balance', 'archived_until', 'created', 'updated', 'owner']
+
+
+class BudgetValuesSerializer(ValuesSerializer):
+    serializer_class = BudgetSerializer
+    sources = {'owner': 'owner__email'}
 
 
 class BudgetWithEntriesSerializer(serializers.HyperlinkedModelSerializer):
     owner = serializers.ReadOnlyField(source='owner.email')
     entries = serializers.SerializerMethodField('paginated_entries')
     total_entries = serializers.IntegerField()
-    total_amount = serializers.IntegerField()
+    total_amount = serializers.DecimalField(max_digits=19, decimal_places=2)
 
     class Meta:
         model = Budget
-        fields = ['id', 'title', 'description', 'base', 'created', 'updated', 'owner', 'total_entries', 'total_amount',
-                  'entries']
+        fields = ['id', 'title', 'description', 'base', 'balance', 'created', 'updated', 'owner', 'total_entries',
+                  'total_amount', 'entries']
 
-    def paginated_entries(self, obj):
-        entries = Entry.objects.filter(budget=obj)
+    @staticmethod
+    def setup_eager_loading(queryset, request):
+        """
+        Load the owners and the page of entries of each budget asked by `request`, with a constant
+        number of queries and without reading the entries of the other pages.
+        """
         paginator = pagination.PageNumberPagination()
-        page = paginator.paginate_queryset(entries, self.context['request'])
-        serializer = EntrySerializer(page, many=True, context={'request': self.context['request']})
+        try:
+            number = int(request.query_params.get(paginator.page_query_param, 1))
+            if number < 1:
+                raise ValueError
+        except ValueError:
+            raise NotFound(paginator.invalid_page_message)
+        size = paginator.get_page_size(request)
+
+        # Position of each entry in its budget, in the entries default ordering
+        ranked = Entry.objects.filter(budget__in=queryset.order_by().values('pk')).annotate(
+            position=Window(RowNumber(), partition_by=[F('budget_id')], order_by=[F('created').asc(), F('id').asc()])
+        ).values('id', 'position')
+        sql, params = ranked.query.sql_with_params()
+        page = RawSQL(f'SELECT id FROM ({sql}) ranked WHERE position > %s AND position <= %s',
+                      (*params, (number - 1) * size, number * size))
+
+        return queryset.select_related('owner').prefetch_related(Prefetch(
+            'entries', queryset=Entry.objects.filter(pk__in=page).select_related('owner').order_by('created', 'id'),
+            to_attr='page_entries'))
+
+    def paginated_entries(self, obj):
+        # The page of entries loaded by `setup_eager_loading`
+        serializer = EntrySerializer(obj.page_entries, many=True, context={'request': self.context['request']})
         return serializer.data
 
 
@@ -69,3 +270,46 @@ class BudgetOverviewMonthlySumSerializer(serializers.Serializer):
     positive_sum = serializers.DecimalField(max_digits=19, decimal_places=2)
     negative_sum = serializers.DecimalField(max_digits=19, decimal_places=2)
 
+
+class AllowanceQuerySerializer(serializers.Serializer):
+    month = serializers.DateField(required=False, input_formats=['%Y-%m', ISO_8601])
+
+    def validate_month(self, value):
+        return value.replace(day=1)
+
+
+class AllowanceSerializer(serializers.Serializer):
+    category = serializers.IntegerField(source='category_id')
+    category__title = serializers.CharField()
+    allocated = serializers.DecimalField(max_digits=19, decimal_places=2, source='amount')
+    spent = serializers.DecimalField(max_digits=19, decimal_places=2)
+    remaining = serializers.DecimalField(max_digits=19, decimal_places=2)
+    overspent = serializers.BooleanField()
+
+
+class BudgetAllowancesSerializer(serializers.Serializer):
+    month = serializers.DateField()
+    allowances = AllowanceSerializer(many=True)
+
+
+class BalanceQuerySerializer(serializers.Serializer):
+    date__gte = serializers.DateField(required=False)
+    date__lte = serializers.DateField(required=False)
+    resolution = serializers.ChoiceField(choices=['day', 'month'], default='day')
+
+
+class AnalyticsQuerySerializer(serializers.Serializer):
+    resolution = serializers.ChoiceField(choices=analytics.RESOLUTIONS, default='month')
+    window = serializers.IntegerField(min_value=1, max_value=366, required=False)
+    by_category = serializers.BooleanField(default=False)
+
+
+class BalancePointSerializer(serializers.Serializer):
+    date = serializers.DateField()
+    balance = serializers.DecimalField(max_digits=19, decimal_places=2)
+
+
+class BudgetBalanceSerializer(serializers.Serializer):
+    opening = serializers.DecimalField(max_digits=19, decimal_places=2)
+    balance = serializers.DecimalField(max_digits=19, decimal_places=2)
+    series = BalancePointSerializer(many=True)
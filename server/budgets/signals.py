@@ -0,0 +1,183 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+
+from . import balances, caching, categories, search, sync
+from .models import Budget, Category, Entry, Tombstone
+from .rollups import RollupDelta
+
+# Sent with the `Entry.tracked_state()` of the entries `added` and `removed` by a write,
+# including the bulk writes that bypass `Entry.save()` and `Entry.delete()`.
+# An update is the removal of the previous state and the addition of the new one.
+entries_changed = Signal()
+
+_bulk_write = ContextVar('bulk_write', default=False)
+
+
+@contextmanager
+def bulk_write():
+    """
+    Silence the per entry handlers, the caller sends one `entries_changed` for the whole write.
+    """
+    token = _bulk_write.set(True)
+    try:
+        yield
+    finally:
+        _bulk_write.reset(token)
+
+
+def in_bulk_write():
+    return _bulk_write.get()
+
+
+@receiver(pre_save, sender=Entry)
+def remember_entry_state(sender, instance, raw, **kwargs):
+    if raw or instance._state.adding or _bulk_write.get():
+        instance._previous_state = None
+        return
+
+    state = getattr(instance, '_loaded_state', None)
+    if state is None:
+        state = Entry.objects.filter(pk=instance.pk).values(*Entry.TRACKED_FIELDS).first()
+    instance._previous_state = state
+
+
+@receiver(post_save, sender=Entry)
+def entry_saved(sender, instance, raw, **kwargs):
+    if raw or _bulk_write.get():
+        return
+
+    previous = getattr(instance, '_previous_state', None)
+    instance._loaded_state = instance.tracked_state()
+    entries_changed.send(sender=Entry, added=[instance._loaded_state], removed=[previous] if previous else [])
+
+
+def entry_deleted(instance):
+    """
+    Called by `Entry.delete()`. Queryset deletes go through `EntryQuerySet.delete`, and the cascades through
+    `delete_entries`.
+    """
+    if _bulk_write.get():
+        return
+
+    state = getattr(instance, '_loaded_state', None) or instance.tracked_state()
+    entries_changed.send(sender=Entry, added=[], removed=[state])
+
+
+@receiver(entries_changed)
+def update_rollups(sender, added, removed, **kwargs):
+    delta = RollupDelta()
+    for state in removed:
+        delta.add_state(state, sign=-1)
+    for state in added:
+        delta.add_state(state)
+    delta.apply()
+
+
+@receiver(entries_changed)
+def update_balances(sender, added, removed, **kwargs):
+    balances.apply_changes(added, removed)
+
+
+@receiver(entries_changed)
+def update_search_index(sender, added, removed, **kwargs):
+    search.entries.update(removed_ids=[state['id'] for state in removed], added=added)
+
+
+@receiver(entries_changed)
+def record_entry_changes(sender, added, removed, **kwargs):
+    sync.record_entries(added, removed)
+
+
+def delete_entries(entries, rebalance):
+    """
+    Delete `entries` in bulk ahead of the cascade of their budget or category, and update the balances
+    of their budgets when `rebalance`, the search index, the change feed and the cached responses.
+    Their rollups go with the budget or the category.
+    """
+    states = list(entries.values(*Entry.TRACKED_FIELDS))
+    if not states:
+        return
+
+    with bulk_write():
+        entries.delete()
+    if rebalance:
+        balances.apply_changes([], states)
+    search.entries.update(removed_ids=[state['id'] for state in states])
+    sync.record_entries([], states)
+    invalidate_entry_responses(Entry, [], states)
+
+
+@receiver(pre_delete, sender=Budget)
+def delete_budget_entries(sender, instance, **kwargs):
+    # The balances go with the budget
+    delete_entries(Entry.objects.filter(budget=instance), rebalance=False)
+
+
+@receiver(pre_delete, sender=Category)
+def delete_category_entries(sender, instance, **kwargs):
+    # Categories with archived entries are protected, only the entries table has some
+    delete_entries(Entry.objects.filter(category=instance), rebalance=True)
+
+
+@receiver(pre_save, sender=Budget)
+def remember_budget_base(sender, instance, raw, **kwargs):
+    instance._previous_base = None
+    if not raw and not instance._state.adding:
+        instance._previous_base = Budget.objects.filter(pk=instance.pk).values_list('base', flat=True).first()
+
+
+@receiver(post_save, sender=Budget)
+def rebase_balances(sender, instance, raw, **kwargs):
+    previous = getattr(instance, '_previous_base', None)
+    base = Budget._meta.get_field('base').to_python(instance.base)
+    if previous is not None and base != previous:
+        balances.rebase(instance.pk, base - previous)
+        instance.balance += base - previous
+
+
+@receiver(post_save, sender=Budget)
+def record_budget_change(sender, instance, raw, **kwargs):
+    if not raw:
+        sync.record_budget(instance)
+
+
+@receiver(post_delete, sender=Budget)
+def record_budget_deletion(sender, instance, **kwargs):
+    sync.record_deletion(sync.user_scope(instance.owner_id), Tombstone.BUDGET, instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def record_category_change(sender, instance, raw, **kwargs):
+    if not raw:
+        sync.record_category(instance)
+
+
+@receiver(post_delete, sender=Category)
+def record_category_deletion(sender, instance, **kwargs):
+    sync.record_deletion(sync.CATEGORIES, Tombstone.CATEGORY, instance.pk)
+
+
+@receiver(entries_changed)
+def invalidate_entry_responses(sender, added, removed, **kwargs):
+    scopes = set()
+    for state in added + removed:
+        scopes.add(f'budget:{state["budget_id"]}')
+        scopes.add(f'user:{state["owner_id"]}')
+    if scopes:
+        caching.bump_on_commit(*scopes)
+
+
+@receiver(post_save, sender=Budget)
+@receiver(post_delete, sender=Budget)
+def invalidate_budget_responses(sender, instance, **kwargs):
+    caching.bump_on_commit(f'budget:{instance.pk}', f'user:{instance.owner_id}')
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_responses(sender, instance, **kwargs):
+    categories.forget()
+    caching.bump_on_commit('categories')
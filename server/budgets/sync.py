@@ -0,0 +1,148 @@
+"""
+Change feed of the budgets, entries and categories, served by `api.changes`.
+
+Each write takes the next number of a `ChangeSequence`, `user:<id>` for the
+budgets and entries of a user and `categories` for the categories, and stamps
+it as `change_seq` on the rows it creates or updates, or on a `Tombstone` for
+the rows it deletes. The increment keeps the sequence row locked until the
+write commits, so the changes of a scope commit in sequence order: a client
+asking for the changes after the last number it has seen, up to the last
+number committed, never misses one.
+"""
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import defaultdict
+
+from django.db.models import F, Q
+from rest_framework.exceptions import ValidationError
+
+from .models import Budget, Category, ChangeSequence, Entry, Tombstone
+
+CATEGORIES = 'categories'
+# Entries per response, the next ones are read with the returned cursor
+PAGE_SIZE = 1000
+
+
+def user_scope(user_id):
+    return f'user:{user_id}'
+
+
+def next_seq(scope):
+    """
+    Increment the sequence of `scope` and return its new value. Runs in the transaction of the write.
+    """
+    if not ChangeSequence.objects.filter(scope=scope).update(value=F('value') + 1):
+        sequence, created = ChangeSequence.objects.get_or_create(scope=scope, defaults={'value': 1})
+        if created:
+            return sequence.value
+        ChangeSequence.objects.filter(scope=scope).update(value=F('value') + 1)
+
+    return ChangeSequence.objects.filter(scope=scope).values_list('value', flat=True).get()
+
+
+def record_entries(added, removed):
+    """
+    Stamp the entries `added` and their budgets, and leave tombstones for the entries `removed`,
+    from the states sent with `entries_changed`.
+    """
+    by_owner = defaultdict(lambda: ([], []))
+    for state in removed:
+        by_owner[state['owner_id']][0].append(state)
+    for state in added:
+        by_owner[state['owner_id']][1].append(state)
+
+    for owner_id, (owner_removed, owner_added) in by_owner.items():
+        scope = user_scope(owner_id)
+        seq = next_seq(scope)
+        added_ids = {state['id'] for state in owner_added}
+
+        if added_ids:
+            Entry.objects.filter(id__in=added_ids).update(change_seq=seq)
+        # Their balance changed
+        Budget.objects.filter(id__in={state['budget_id'] for state in owner_removed + owner_added}).update(
+            change_seq=seq)
+        # An update is a removal and an addition of the same entry
+        Tombstone.objects.bulk_create([
+            Tombstone(scope=scope, kind=Tombstone.ENTRY, object_id=pk, change_seq=seq)
+            for pk in {state['id'] for state in owner_removed} - added_ids])
+
+
+def record_budget(budget):
+    budget.change_seq = next_seq(user_scope(budget.owner_id))
+    Budget.objects.filter(pk=budget.pk).update(change_seq=budget.change_seq)
+
+
+def record_category(category):
+    category.change_seq = next_seq(CATEGORIES)
+    Category.objects.filter(pk=category.pk).update(change_seq=category.change_seq)
+
+
+def record_deletion(scope, kind, pk):
+    Tombstone.objects.create(scope=scope, kind=kind, object_id=pk, change_seq=next_seq(scope))
+
+
+def encode_cursor(position):
+    return urlsafe_b64encode(json.dumps(position, separators=(',', ':')).encode()).decode('ascii')
+
+
+def decode_cursor(encoded):
+    """
+    The position of a cursor returned by `changes`, None for an empty cursor (a full snapshot).
+    """
+    if not encoded:
+        return None
+
+    try:
+        data = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+        return {'s': int(data['s']), 'e': int(data['e']) if data.get('e') is not None else None, 'c': int(data['c'])}
+    except (TypeError, ValueError, KeyError, AttributeError):
+        raise ValidationError({'cursor': 'Invalid cursor'})
+
+
+def changes(user, position, entry_lookups):
+    """
+    The budgets, entries and categories changed after `position`, a `decode_cursor` result,
+    or all of them for None, the deleted ids and the cursor of the next call.
+
+    Entries are read by pages of `PAGE_SIZE`, as `.values(*entry_lookups)` rows: `more` is set
+    when the cursor continues within the changes already committed. Budgets and categories
+    are returned as querysets. Archived entries are not part of the feed.
+    """
+    scope = user_scope(user.pk)
+    snapshot = position is None
+    position = position or {'s': -1, 'e': None, 'c': -1}
+    current = dict(ChangeSequence.objects.filter(scope__in=[scope, CATEGORIES]).values_list('scope', 'value'))
+    upto, categories_upto = current.get(scope, 0), current.get(CATEGORIES, 0)
+    since, categories_since = position['s'], position['c']
+
+    # The entries after the last one of the previous page, of its sequence number included
+    after = Q(change_seq__gt=since)
+    if position['e'] is not None:
+        after |= Q(change_seq=since, id__gt=position['e'])
+    entries = list(Entry.objects.filter(after, owner=user, change_seq__lte=upto).order_by('change_seq', 'id')
+                   .values(*entry_lookups, 'change_seq')[:PAGE_SIZE + 1])
+
+    more = len(entries) > PAGE_SIZE
+    last_entry = None
+    if more:
+        entries = entries[:PAGE_SIZE]
+        upto, last_entry = entries[-1]['change_seq'], entries[-1]['id']
+
+    deleted = {Tombstone.BUDGET: [], Tombstone.ENTRY: [], Tombstone.CATEGORY: []}
+    if not snapshot:
+        tombstones = Tombstone.objects.filter(
+            Q(scope=scope, change_seq__gt=since, change_seq__lte=upto) |
+            Q(scope=CATEGORIES, change_seq__gt=categories_since, change_seq__lte=categories_upto))
+        for kind, pk in tombstones.order_by('change_seq', 'id').values_list('kind', 'object_id'):
+            deleted[kind].append(pk)
+
+    return {
+        'cursor': encode_cursor({'s': upto, 'e': last_entry, 'c': categories_upto}),
+        'more': more,
+        'budgets': Budget.objects.filter(owner=user, change_seq__gt=since, change_seq__lte=upto).order_by('id'),
+        'entries': entries,
+        'categories': (Category.objects.filter(change_seq__gt=categories_since, change_seq__lte=categories_upto)
+                       .order_by('id') if categories_upto > categories_since else Category.objects.none()),
+        'deleted': {'budgets': deleted[Tombstone.BUDGET], 'entries': deleted[Tombstone.ENTRY],
+                    'categories': deleted[Tombstone.CATEGORY]},
+    }
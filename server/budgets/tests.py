@@ -1,3 +1,1287 @@
+import json
+from io import BytesIO, StringIO
+from unittest import mock
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncMonth
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from accounts.models import CustomUser
+from portfolio.testing import QueryCountTestCase
+from . import archive, balances, batch, categories, importers, recurring, rollups, sync
+from .models import Allocation, ArchivedEntry, Budget, Category, Entry, MonthlyRollup, RecurringEntry
+from .serializers import BudgetWithEntriesSerializer, EntrySerializer
+from .urls import router
+
+
+class EntryQueryPlanTests(TestCase):
+    """
+    Check with EXPLAIN that the Entry access paths of the API are served by indexes.
+    """
+    users = 10
+    budgets_per_user = 3
+    entries_per_budget = 200
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = Category.objects.bulk_create([Category(title=f'Category {i}') for i in range(8)])
+        owners = [CustomUser.objects.create_user(f'user{i}@example.com', 'password') for i in range(cls.users)]
+        budgets = Budget.objects.bulk_create([
+            Budget(title=f'Budget {i}', owner=owner) for owner in owners for i in range(cls.budgets_per_user)
+        ])
+
+        start = date(2018, 1, 1)
+        Entry.objects.bulk_create([
+            Entry(description=f'Entry {i}', amount=Decimal(i % 97) + Decimal('0.25'), date=start + timedelta(days=i * 7),
+                  is_positive=i % 4 == 0, budget=budget, category=categories[i % len(categories)], owner=budget.owner)
+            for budget in budgets for i in range(cls.entries_per_budget)
+        ], batch_size=1000)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        cls.owner = owners[0]
+        cls.budget = budgets[0]
+
+    def assertUsesIndex(self, queryset):
+        if connection.vendor == 'sqlite':
+            plan = queryset.explain()
+            self.assertNotRegex(plan, r'SCAN budgets_entry\b(?! USING)', plan)
+            self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan, plan)
+        else:
+            # At this size a sort is cheaper than an index scan, only check that an index can give the order
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_sort = off')
+                plan = queryset.explain()
+                cursor.execute('RESET enable_sort')
+            self.assertNotIn('Seq Scan on budgets_entry', plan, plan)
+            self.assertNotRegex(plan, r'(?m)^\s*(->\s+)?Sort\b', plan)
+
+    def assertSearchesIndex(self, queryset):
+        plan = queryset.explain()
+
+        if connection.vendor == 'sqlite':
+            self.assertNotRegex(plan, r'SCAN budgets_entry\b(?! USING)', plan)
+        else:
+            self.assertNotIn('Seq Scan on budgets_entry', plan, plan)
+
+    def test_list_default_ordering(self):
+        self.assertUsesIndex(Entry.objects.filter(owner=self.owner))
+
+    def test_list_ordered_by_filter_fields(self):
+        for field in ('date', '-date', 'amount', '-amount', 'description', '-description'):
+            with self.subTest(order=field):
+                self.assertUsesIndex(Entry.objects.filter(owner=self.owner).order_by(field))
+
+    def test_budget_date_range(self):
+        queryset = Entry.objects.filter(owner=self.owner, budget=self.budget,
+                                        date__gte=date(2019, 1, 1), date__lte=date(2019, 12, 31))
+        self.assertUsesIndex(queryset.order_by('date'))
+
+    def test_overview_aggregations(self):
+        entries = Entry.objects.filter(owner=self.owner, budget=self.budget)
+
+        self.assertSearchesIndex(entries.values('category__title').annotate(
+            positive_sum=Sum('amount', filter=Q(is_positive=True)),
+            negative_sum=Sum('amount', filter=Q(is_positive=False)), ))
+
+        self.assertSearchesIndex(entries.annotate(month=TruncMonth('date')).values('month', 'category__title').annotate(
+            positive_sum=Sum('amount', filter=Q(is_positive=True)),
+            negative_sum=Sum('amount', filter=Q(is_positive=False)), ).order_by('month'))
+
+    def test_budget_category_history(self):
+        queryset = Entry.objects.filter(budget=self.budget, category__title='Category 1')
+        self.assertSearchesIndex(queryset.order_by('date'))
+
+
+class BudgetsQueryCountTests(QueryCountTestCase):
+    """
+    The budget endpoints run a constant number of queries, whatever the page size.
+    """
+    # Queries per request, authentication excluded since the client is force authenticated.
+    query_budgets = {
+        'budgets': 3,
+        'categories': 1,
+        'entries': 3,
+        'recurring': 2,
+        'allocations': 2,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner@example.com', 'password')
+        cls.budget = Budget.objects.create(title='Budget', owner=cls.owner)
+        cls.categories = [Category.objects.create(title=f'Category {i}') for i in range(3)]
+        cls.add_entries(3)
+
+    @classmethod
+    def add_entries(cls, count):
+        for i in range(count):
+            Entry.objects.create(description=f'Entry {i}', amount=i + 1, date=date(2022, 1 + i % 12, 1),
+                                 is_positive=i % 2 == 0, budget=cls.budget,
+                                 category=cls.categories[i % len(cls.categories)], owner=cls.owner)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.owner)
+
+    def grow(self):
+        Budget.objects.create(title='Other budget', owner=self.owner)
+        Category.objects.create(title=f'Category {Category.objects.count()}')
+        self.add_entries(7)
+
+    def test_routes_have_a_budget(self):
+        self.assertRoutesCovered(router, self.query_budgets)
+
+    def test_list_endpoints(self):
+        for prefix, max_queries in self.query_budgets.items():
+            with self.subTest(prefix=prefix):
+                self.assertConstantQueries(f'/api/budgets/{prefix}/', max_queries, self.grow)
+
+    def test_cursor_pagination(self):
+        self.assertConstantQueries('/api/budgets/entries/?cursor=&order=-date', 2, self.grow)
+
+    def test_keyset_paging(self):
+        self.add_entries(22)
+        newest_first = list(Entry.objects.order_by('-date', '-id').values_list('id', flat=True))
+
+        pages, url, params = [], '/api/budgets/entries/', {'cursor': '', 'order': '-date'}
+        while url:
+            page = self.client.get(url, params).json()
+            pages.append(page)
+            url, params = page['next'], None
+        self.assertEqual([[entry['id'] for entry in page['results']] for page in pages],
+                         [newest_first[:10], newest_first[10:20], newest_first[20:]])
+        self.assertIsNone(pages[0]['previous'])
+
+        # Backwards from the last page gives the same pages
+        backwards, url = [], pages[-1]['previous']
+        while url:
+            page = self.client.get(url).json()
+            backwards.insert(0, [entry['id'] for entry in page['results']])
+            url = page['previous']
+        self.assertEqual(backwards, [newest_first[:10], newest_first[10:20]])
+
+        # An empty page goes back to the first page, still paginated by keyset
+        Entry.objects.filter(id__in=newest_first[20:]).delete()
+        page = self.client.get(pages[1]['next']).json()
+        self.assertEqual((page['results'], page['next']), ([], None))
+        self.assertIn('cursor=&', page['previous'])
+        page = self.client.get(page['previous']).json()
+        self.assertEqual([entry['id'] for entry in page['results']], newest_first[:10])
+        self.assertNotIn('count', page)
+
+    def test_detail_endpoints(self):
+        entry = Entry.objects.first()
+        self.assertQueryCount(f'/api/budgets/budgets/{self.budget.pk}/', 2)
+        self.assertQueryCount(f'/api/budgets/categories/{self.categories[0].pk}/', 1)
+        self.assertQueryCount(f'/api/budgets/entries/{entry.pk}/', 2)
+
+    def test_overview(self):
+        # Without category writes, which reload the categories on the next request
+        def grow():
+            self.add_entries(7)
+
+        url = f'/api/budgets/budgets/{self.budget.pk}/overview/'
+        categories.categories()
+        self.assertConstantQueries(url, 2, grow)
+        # And whether the budget has archived entries the filters match
+        self.assertConstantQueries(url, 3, grow, data={'description': 'Entry'})
+
+    def test_analytics(self):
+        url = f'/api/budgets/budgets/{self.budget.pk}/analytics/'
+        self.assertConstantQueries(url, 1, self.grow, data={'resolution': 'quarter', 'window': 2, 'by_category': True})
+
+    def test_balance(self):
+        url = f'/api/budgets/budgets/{self.budget.pk}/balance/'
+        self.assertConstantQueries(url, 3, self.grow)
+        self.assertConstantQueries(url, 3, self.grow, data={'resolution': 'month', 'date__gte': '2022-03-01'})
+
+    def test_allowances(self):
+        for category in self.categories:
+            Allocation.objects.create(amount=10, budget=self.budget, category=category, owner=self.owner)
+        categories.categories()
+        url = f'/api/budgets/budgets/{self.budget.pk}/allowances/'
+        self.assertConstantQueries(url, 1, lambda: self.add_entries(12), data={'month': '2022-01'})
+
+    def test_changes(self):
+        self.assertConstantQueries('/api/budgets/changes/', 4, self.grow)
+        cursor = self.client.get('/api/budgets/changes/').json()['cursor']
+        self.grow()
+        self.assertConstantQueries('/api/budgets/changes/', 5, self.grow, data={'cursor': cursor})
+
+    def test_cascading_deletes(self):
+        # The entries of a deleted budget or category are deleted in bulk, not one at a time
+        def budget_with_entries(count):
+            budget = Budget.objects.create(title='Deleted', owner=self.owner)
+            category = Category.objects.create(title=f'Deleted {count}')
+            for i in range(count):
+                Entry.objects.create(description=f'Entry {i}', amount=1, date=date(2022, 1, 1 + i % 28), budget=budget,
+                                     category=category if i % 2 else self.categories[0], owner=self.owner)
+            return budget, category
+
+        counts = []
+        for count in (10, 100):
+            budget, category = budget_with_entries(count)
+            with CaptureQueriesContext(connection) as category_queries:
+                category.delete()
+            counts.append((self.count_queries(f'/api/budgets/budgets/{budget.pk}/', 'delete', status=204)[0],
+                           len(category_queries)))
+        self.assertEqual(counts[0], counts[1])
+        self.assertLessEqual(max(counts[1]), 21)
+
+        # The derived data is kept up to date
+        self.assertEqual(balances.rebuild(), 0)
+        self.assertEqual(self.client.get('/api/budgets/entries/', {'search': 'Entry'}).json()['count'], 3)
+        self.assertFalse(MonthlyRollup.objects.exclude(budget=self.budget).exists())
+
+    def test_entry_writes(self):
+        data = {'description': 'New', 'amount': '1.00', 'budget': self.budget.pk, 'category': self.categories[0].pk}
+        # The first entry of the month creates its rollup in a savepoint
+        self.assertQueryCount('/api/budgets/entries/', 20, method='post', data=data, status=201)
+
+    def test_batch(self):
+        operations = [{'op': 'create', 'data': {'description': f'New {i}', 'amount': '1.00', 'date': '2022-01-01',
+                                                'budget': self.budget.pk, 'category': self.categories[0].pk}}
+                      for i in range(20)]
+        operations += [{'op': 'delete', 'id': pk} for pk in Entry.objects.values_list('pk', flat=True)]
+        self.assertQueryCount('/api/budgets/entries/batch/', 24, method='post', data=operations)
+
+    def test_detail_not_found(self):
+        for pk in ['abc', Entry.objects.order_by('pk').last().pk + 1]:
+            with self.subTest(pk=pk):
+                self.assertEqual(self.client.get(f'/api/budgets/entries/{pk}/').status_code, 404)
+
+    def test_budget_with_entries_serializer(self):
+        self.grow()
+        request = Request(APIRequestFactory().get('/'))
+        request.user = self.owner
+        budgets = BudgetWithEntriesSerializer.setup_eager_loading(self.view_queryset(), request)
+
+        with self.assertNumQueries(2):
+            BudgetWithEntriesSerializer(budgets, many=True, context={'request': request}).data
+
+    def test_budget_with_entries_pages(self):
+        self.add_entries(12)
+        expected = list(self.budget.entries.order_by('created', 'id').values_list('id', flat=True))
+
+        for page, ids in [('1', expected[:10]), ('2', expected[10:]), ('3', [])]:
+            with self.subTest(page=page):
+                request = Request(APIRequestFactory().get('/', {'page': page}))
+                request.user = self.owner
+                budgets = BudgetWithEntriesSerializer.setup_eager_loading(self.view_queryset(), request)
+                data = BudgetWithEntriesSerializer(budgets, many=True, context={'request': request}).data
+                self.assertEqual([entry['id'] for entry in data[0]['entries']], ids)
+
+    def view_queryset(self):
+        return Budget.objects.filter(owner=self.owner).annotate(total_entries=Count('entries'),
+                                                                total_amount=F('balance') - F('base'))
+
+
+class BudgetResponseCacheTests(QueryCountTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner@example.com', 'password')
+        cls.budget = Budget.objects.create(title='Budget', owner=cls.owner)
+        cls.category = Category.objects.create(title='Category')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.owner)
+        self.url = f'/api/budgets/budgets/{self.budget.pk}/overview/'
+
+    def test_revalidation_without_queries(self):
+        response = self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).json(), response.json())
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_invalidated_by_writes(self):
+        etag = self.client.get(self.url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Entry.objects.create(description='Entry', amount=3, budget=self.budget, category=self.category,
+                                 owner=self.owner)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['categories'][0]['negative_sum'], '3.00')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.title = 'Renamed'
+            self.category.save()
+
+        self.assertEqual(self.client.get(self.url).json()['categories'][0]['category__title'], 'Renamed')
+
+
+class RollupTests(QueryCountTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner@example.com', 'password')
+        cls.budget = Budget.objects.create(title='Budget', owner=cls.owner)
+        cls.categories = [Category.objects.create(title=f'Category {i}') for i in range(2)]
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.owner)
+
+    def add_entry(self, amount, day, is_positive=False, category=0):
+        return Entry.objects.create(description='Entry', amount=amount, date=day, is_positive=is_positive,
+                                    budget=self.budget, category=self.categories[category], owner=self.owner)
+
+    def assertRollupsMatchEntries(self):
+        fields = ('budget_id', 'category_id', 'month', 'positive_total', 'negative_total', 'positive_count',
+                  'negative_count')
+        maintained = MonthlyRollup.objects.exclude(positive_count=0, negative_count=0).order_by(*fields[:3])
+        self.assertEqual(list(maintained.values_list(*fields)),
+                         [tuple(row[field] for field in fields)
+                          for row in rollups.monthly_sums(Entry.objects.all()).order_by(*fields[:3])])
+
+    def test_maintenance(self):
+        entry = self.add_entry(5, date(2022, 1, 10))
+        self.add_entry(7, date(2022, 1, 20), is_positive=True)
+        self.assertRollupsMatchEntries()
+
+        entry.amount = 6
+        entry.save()
+        self.assertRollupsMatchEntries()
+
+        # Moved to another month and category, the old row is kept with zero counts
+        entry.date, entry.category = date(2022, 2, 1), self.categories[1]
+        entry.save()
+        self.assertRollupsMatchEntries()
+        self.assertTrue(MonthlyRollup.objects.filter(category=self.categories[0], negative_count=0).exists())
+
+        entry.delete()
+        self.assertRollupsMatchEntries()
+        self.assertEqual(MonthlyRollup.objects.filter(category=self.categories[1]).get().negative_count, 0)
+
+    def test_overview_from_rollups_and_entries(self):
+        for i in range(6):
+            self.add_entry(i + 1, date(2022, 1 + i % 3, 1 + i), is_positive=i % 2 == 0, category=i % 2)
+        Entry.objects.filter(amount=3).delete()
+
+        url = f'/api/budgets/budgets/{self.budget.pk}/overview/'
+        from_rollups = self.client.get(url).json()
+        self.assertEqual(len(from_rollups['months']), 5)
+        for params in [{'amount__gte': '0'}, {'date__lte': '2022-12-15'}]:
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).json(), from_rollups)
+
+    def test_concurrent_first_write(self):
+        self.add_entry(5, date(2022, 1, 10))
+        manager_filter, calls = MonthlyRollup.objects.filter, []
+
+        def filter_before_the_other_write(*args, **kwargs):
+            # The first update runs before the row of the other write is committed
+            calls.append(kwargs)
+            return MonthlyRollup.objects.none() if len(calls) == 1 else manager_filter(*args, **kwargs)
+
+        with mock.patch.object(MonthlyRollup.objects, 'filter', side_effect=filter_before_the_other_write):
+            self.add_entry(7, date(2022, 1, 20))
+        self.assertEqual(len(calls), 2)
+        self.assertRollupsMatchEntries()
+
+        # In bulk, the rows created meanwhile are added to one by one
+        delta = rollups.RollupDelta()
+        delta.add(self.budget.pk, self.categories[0].pk, date(2022, 3, 1), 1, False)
+        with mock.patch.object(MonthlyRollup.objects, 'bulk_create', side_effect=IntegrityError) as bulk_create:
+            delta.apply_in_bulk(dict(delta.changes))
+        bulk_create.assert_called_once()
+        self.assertEqual(MonthlyRollup.objects.get(month=date(2022, 3, 1)).negative_count, 1)
+
+
+class BudgetBalanceTests(QueryCountTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner@example.com', 'password')
+        cls.budget = Budget.objects.create(title='Budget', base=100, owner=cls.owner)
+        cls.other = Budget.objects.create(title='Other', owner=cls.owner)
+        cls.category = Category.objects.create(title='Category')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.owner)
+
+    def add_entry(self, amount, day, is_positive=False, budget=None):
+        return Entry.objects.create(description='Entry', amount=amount, date=date(2022, 1, day),
+                                    is_positive=is_positive, budget=budget or self.budget, category=self.category,
+                                    owner=self.owner)
+
+    def assertBalancesConsistent(self):
+        for budget in Budget.objects.all():
+            balance = budget.base
+            for entry in budget.entries.order_by('date', 'id'):
+                balance += entry.amount if entry.is_positive else -entry.amount
+                self.assertEqual(entry.running_balance, balance, f'{entry.date} in {budget}')
+            self.assertEqual(budget.balance, balance, budget)
+
+    def test_single_writes(self):
+        entries = [self.add_entry(10, 5), self.add_entry(20, 1, is_positive=True), self.add_entry(5, 5)]
+        self.assertBalancesConsistent()
+
+        entries[0].date = date(2022, 1, 9)
+        entries[0].save()
+        entries[1].budget = self.other
+        entries[1].save()
+        entries[2].delete()
+        self.assertBalancesConsistent()
+
+        self.budget.refresh_from_db()
+        self.budget.base = 50
+        self.budget.save()
+        self.assertEqual(self.budget.balance, 40)
+        self.assertBalancesConsistent()
+
+    def test_batch(self):
+        entries = [self.add_entry(i + 1, i + 1) for i in range(4)]
+        operations = [{'op': 'create', 'data': {'description': 'New', 'amount': '7.00', 'date': '2022-01-02',
+                                                'budget': self.budget.pk, 'category': self.category.pk}}
+                      for i in range(5)]
+        operations += [{'op': 'update', 'id': entries[0].pk, 'data': {'date': '2022-01-20', 'is_positive': True}},
+                       {'op': 'delete', 'id': entries[1].pk}]
+
+        self.assertEqual(self.client.post('/api/budgets/entries/batch/', operations, format='json').status_code, 200)
+        self.assertBalancesConsistent()
+
+    def test_writes_lock_the_budget(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.add_entry(5, 1)
+        locks = [query['sql'] for query in queries if 'FOR UPDATE' in query['sql']]
+        self.assertEqual(len(locks), 1 if connection.features.has_select_for_update else 0)
+
+    def test_queryset_delete(self):
+        entries = [self.add_entry(5, 1), self.add_entry(7, 2), self.add_entry(3, 3, is_positive=True)]
+        cursor = self.client.get('/api/budgets/changes/').json()['cursor']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Entry.objects.filter(pk__in=[entries[0].pk, entries[1].pk]).delete()
+
+        self.assertBalancesConsistent()
+        self.assertEqual(Budget.objects.get(pk=self.budget.pk).balance, 103)
+        rollup = MonthlyRollup.objects.get(budget=self.budget)
+        self.assertEqual((rollup.negative_count, rollup.negative_total, rollup.positive_count), (0, 0, 1))
+        changes = self.client.get('/api/budgets/changes/', {'cursor': cursor}).json()
+        self.assertEqual(sorted(changes['deleted']['entries']), [entries[0].pk, entries[1].pk])
+        self.assertEqual(self.client.get('/api/budgets/entries/', {'search': 'Entry'}).json()['count'], 1)
+
+    def test_batch_invalid_ids(self):
+        entry = self.add_entry(1, 1)
+        operations = [{'op': 'update', 'id': [entry.pk], 'data': {'amount': '2.00'}},
+                      {'op': 'delete', 'id': {'a': 1}},
+                      {'op': 'delete', 'id': True},
+                      {'op': 'delete', 'id': entry.pk}]
+
+        response = self.client.post('/api/budgets/entries/batch/', operations, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'errors': [{'id': ['A valid integer is required.']},
+                                                      {'id': ['A valid integer is required.']},
+                                                      {'id': ['A valid integer is required.']}, None]})
+        self.assertTrue(Entry.objects.filter(pk=entry.pk).exists())
+
+    def test_batch_too_many_operations(self):
+        entry = self.add_entry(1, 1)
+        operations = [{'op': 'delete', 'id': entry.pk}] * (batch.MAX_OPERATIONS + 1)
+
+        response = self.client.post('/api/budgets/entries/batch/', operations, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'errors': {
+            'non_field_errors': [f'Expected at most {batch.MAX_OPERATIONS} operations.']}})
+        self.assertTrue(Entry.objects.filter(pk=entry.pk).exists())
+
+    def test_series(self):
+        self.add_entry(10, 1)
+        self.add_entry(5, 1, is_positive=True)
+        self.add_entry(30, 15)
+
+        response = self.client.get(f'/api/budgets/budgets/{self.budget.pk}/balance/', {'date__gte': '2022-01-02'})
+        self.assertEqual(response.json(), {
+            'opening': '95.00',
+            'balance': '65.00',
+            'series': [{'date': '2022-01-15', 'balance': '65.00'}],
+        })
+
+        response = self.client.get(f'/api/budgets/budgets/{self.budget.pk}/balance/', {'resolution': 'month'})
+        self.assertEqual(response.json()['series'], [{'date': '2022-01-01', 'balance': '65.00'}])
+        self.assertEqual(self.client.get('/api/budgets/budgets/').json()['results'][0]['balance'], '65.00')
+
+
+class BudgetAnalyticsTests(QueryCountTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner@example.com', 'password')
+        cls.budget = Budget.objects.create(title='Budget', owner=cls.owner)
+        categories = [Category.objects.create(title='Food'), Category.objects.create(title='Rent')]
+        for i, (day, amount, is_positive) in enumerate([(date(2021, 2, 3), 10, False), (date(2021, 4, 1), 40, True),
+                                                         (date(2022, 2, 1), 5, False), (date(2022, 2, 20), 7, False)]):
+            Entry.objects.create(description='Entry', amount=amount, date=day, is_positive=is_positive,
+                                 budget=cls.budget, category=categories[i % 2], owner=cls.owner)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.owner)
+        self.url = f'/api/budgets/budgets/{self.budget.pk}/analytics/'
+
+    def test_quarters(self):
+        data = self.client.get(self.url, {'resolution': 'quarter', 'window': 2, 'by_category': True}).json()
+
+        self.assertEqual(data['periods'], ['2021-01-01', '2021-04-01', '2021-07-01', '2021-10-01', '2022-01-01'])
+        self.assertEqual(data['net'], ['-10.00', '40.00', '0.00', '0.00', '-12.00'])
+        self.assertEqual(data['count'], [1, 1, 0, 0, 2])
+        self.assertEqual(data['moving_average'], [None, '15.00', '20.00', '0.00', '-6.00'])
+        self.assertEqual(data['previous_year'], [None, None, None, None, '-10.00'])
+        self.assertEqual(data['categories'], {'Food': ['-10.00', '0.00', '0.00', '0.00', '-5.00'],
+                                              'Rent': ['0.00', '40.00', '0.00', '0.00', '-7.00']})
+
+    def test_filtered(self):
+        data = self.client.get(self.url, {'resolution': 'week', 'date__gte': '2022-01-01'}).json()
+
+        self.assertEqual(data['periods'], ['2022-01-31', '2022-02-07', '2022-02-14'])
+        self.assertEqual(data['negative'], ['5.00', '0.00', '7.00'])
+        self.assertEqual(self.client.get(self.url, {'resolution': 'hour'}).status_code, 400)
+
+
+class EntryExportTests(QueryCountTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner@example.com', 'password')
+        cls.budget = Budget.objects.create(title='Budget', owner=cls.owner)
+        category = Category.objects.create(title='Food, drinks')
+        Entry.objects.bulk_create([
+            Entry(description=f'Entry {i}', amount=i + 1, date=date(2022, 1, 1) + timedelta(days=i), is_positive=i == 0,
+                  budget=cls.budget, category=category, owner=cls.owner) for i in range(3)])
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.owner)
+
+    def export(self, **params):
+        response = self.client.get('/api/budgets/entries/export/', params)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(1):
+            return response['Content-Type'], b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        content_type, content = self.export(date__gte='2022-01-02', order='-date')
+
+        self.assertEqual(content_type, 'text/csv')
+        self.assertEqual([line.split(',', 2)[1] for line in content.splitlines()], ['date', '2022-01-03', '2022-01-02'])
+        self.assertIn('Entry 1,2.00,False,"Food, drinks"', content)
+
+    def test_jsonl(self):
+        content_type, content = self.export(file_format='jsonl')
+
+        self.assertEqual(content_type, 'application/x-ndjson')
+        self.assertEqual([json.loads(line)['amount'] for line in content.splitlines()], ['1.00', '2.00', '3.00'])
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get('/api/budgets/entries/export/', {'file_format': 'xml'}).status_code, 400)
+
+
+class EntryImportTests(QueryCountTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner@example.com', 'password')
+        cls.budget = Budget.objects.create(title='Budget', base=100, owner=cls.owner)
+        cls.category = Category.objects.create(title='Food')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.owner)
+
+    def upload(self, name, content, **data):
+        upload = BytesIO(content.encode())
+        upload.name = name
+        return self.client.post('/api/budgets/entries/import/', {'file': upload, 'budget': self.budget.pk, **data})
+
+    def test_parse_amount(self):
+        for value, amount in [('1234.5', '1234.5'), ('-1,234.50', '-1234.50'), ('1.234,50', '1234.50'),
+                              ('1234,50', '1234.50'), ('1,5', '1.5'), ('1,234,567', '1234567'),
+                              ('1 234,00', '1234.00')]:
+            with self.subTest(value=value):
+                self.assertEqual(importers.parse_amount(value), Decimal(amount))
+
+        for value in ['1,234', '-12.345']:
+            with self.subTest(value=value):
+                self.assertRaises(importers.AmbiguousAmount, importers.parse_amount, value)
+        for value in ['', 'abc', '1,234,56', '1,23,4', '1e5']:
+            with self.subTest(value=value):
+                self.assertRaises(importers.InvalidOperation, importers.parse_amount, value)
+
+    def test_parsers(self):
+        csv = 'Date,Description,Amount,Category\n2022-01-02,Lunch,-12.50,food\n'
+        self.assertEqual(list(importers.parse_csv(StringIO(csv))),
+                         [(2, {'date': '2022-01-02', 'description': 'Lunch', 'amount': '-12.50', 'category': 'food'})])
+
+        qif = '!Type:Bank\nD01/02/2022\nT-12.50\nMLunch\n^\nD01/03\'22\nT100.00\nPSalary\n'
+        self.assertEqual(list(importers.parse_qif(StringIO(qif))),
+                         [(2, {'date': '01/02/2022', 'amount': '-12.50', 'description': 'Lunch'}),
+                          (6, {'date': "01/03'22", 'amount': '100.00', 'description': 'Salary'})])
+
+        ofx = ('<OFX><BANKTRANLIST>\n<STMTTRN><DTPOSTED>20220102120000<TRNAMT>-12.50<NAME>Lunch\n</STMTTRN>\n'
+               '<STMTTRN>\n<DTPOSTED>20220103</DTPOSTED>\n<TRNAMT>100.00</TRNAMT>\n<MEMO>Salary</MEMO>\n</STMTTRN>\n')
+        self.assertEqual(list(importers.parse_ofx(StringIO(ofx))),
+                         [(2, {'date': '20220102', 'amount': '-12.50', 'description': 'Lunch'}),
+                          (4, {'date': '20220103', 'amount': '100.00', 'description': 'Salary'})])
+
+    def test_import_formats(self):
+        files = {
+            'entries.csv': 'date,description,amount,category\n2022-01-02,Lunch,"-1,234.50",Food\n',
+            'entries.qif': '!Type:Bank\nD01/02/2022\nT-1,234.50\nPLunch\n^\n',
+            'entries.ofx': '<STMTTRN><DTPOSTED>20220102<TRNAMT>-1234.50<NAME>Lunch</STMTTRN>',
+        }
+        for name, content in files.items():
+            with self.subTest(name=name):
+                response = self.upload(name, content, category=self.category.pk)
+                self.assertEqual(response.status_code, 201, response.content)
+                self.assertEqual((response.json()['rows'], response.json()['created']), (1, 1))
+
+        amounts = Entry.objects.order_by().values_list('date', 'amount', 'is_positive').distinct()
+        self.assertEqual(list(amounts), [(date(2022, 1, 2), Decimal('1234.50'), False)])
+        self.budget.refresh_from_db()
+        self.assertEqual(self.budget.balance, 100 - 3 * Decimal('1234.50'))
+
+    def test_bad_rows(self):
+        csv = ('date,description,amount,category\n'
+               '2022-01-02,Lunch,12.50,Food\n'
+               '2022-01-03,Dinner,"1,234",Food\n'
+               '02/01/2022,,abc,Unknown\n')
+        response = self.upload('entries.csv', csv)
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual(response.json()['errors'], [
+            {'row': 3, 'errors': {'amount': 'Ambiguous thousands or decimal separator, write the decimals.'}},
+            {'row': 4, 'errors': {'category': 'Unknown category', 'description': 'This field is required.',
+                                  'amount': 'A valid number is required.', 'date': 'Date has wrong format.'}},
+        ])
+
+        response = self.upload('entries.csv', csv.replace('Lunch,12.50', 'Lunch,1.234'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Entry.objects.count(), 1)
+
+    def test_invalid_upload(self):
+        self.assertEqual(self.upload('entries.txt', '').json(), {'file_format': 'Supported formats are csv, qif, ofx.'})
+        response = self.client.post('/api/budgets/entries/import/', {'budget': self.budget.pk})
+        self.assertEqual(response.json(), {'file': 'No file was submitted.'})
+
+
+class EntryValuesSerializerTests(QueryCountTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner@example.com', 'password')
+        budget = Budget.objects.create(title='Budget', owner=cls.owner)
+        category = Category.objects.create(title='Category')
+        for i, amount in enumerate(['1', '2.5', '1234567.89', '0.01']):
+            Entry.objects.create(description=f'Entry "{i}" é', amount=amount, date=date(2022, 1, 1 + i),
+                                 is_positive=i % 2 == 0, budget=budget, category=category, owner=cls.owner)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.owner)
+
+    def expected(self, entries):
+        return JSONRenderer().render(EntrySerializer(entries, many=True).data)
+
+    def test_same_json_as_entry_serializer(self):
+        response = self.client.get('/api/budgets/entries/', {'order': '-amount'})
+        entries = Entry.objects.select_related('owner').order_by('-amount', 'id')
+        self.assertEqual(JSONRenderer().render(response.data['results']), self.expected(entries))
+
+        entry = entries[1]
+        response = self.client.get(f'/api/budgets/entries/{entry.pk}/')
+        self.assertEqual(response.content, JSONRenderer().render(EntrySerializer(entry).data))
+
+
+class EntrySearchTests(QueryCountTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner@example.com', 'password')
+        cls.budget = Budget.objects.create(title='Budget', owner=cls.owner)
+        cls.category = Category.objects.create(title='Category')
+        for description in ['Grocery store', 'Rent', 'Grocery grocery delivery', 'Cinema']:
+            Entry.objects.create(description=description, amount=1, budget=cls.budget, category=cls.category,
+                                 owner=cls.owner)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.owner)
+
+    def search(self, text, **params):
+        response = self.client.get('/api/budgets/entries/', {'search': text, **params})
+        return [row['description'] for row in response.data['results']]
+
+    def test_ranked(self):
+        self.assertEqual(self.search('grocery'), ['Grocery grocery delivery', 'Grocery store'])
+        self.assertEqual(self.search('grocery store'), ['Grocery store'])
+        self.assertEqual(self.search('grocery', order='description'), ['Grocery grocery delivery', 'Grocery store'])
+        self.assertEqual(self.search('"'), [])
+
+    def test_kept_in_sync(self):
+        entry = Entry.objects.get(description='Cinema')
+        entry.description = 'Cinema with grocery'
+        entry.save()
+        Entry.objects.get(description='Grocery store').delete()
+        operations = [{'op': 'create', 'data': {'description': 'Batch grocery', 'amount': '1.00',
+                                                'budget': self.budget.pk, 'category': self.category.pk}}]
+        self.client.post('/api/budgets/entries/batch/', operations, format='json')
+
+        self.assertEqual(sorted(self.search('grocery')),
+                         ['Batch grocery', 'Cinema with grocery', 'Grocery grocery delivery'])
+        self.assertEqual(self.search('cinema'), ['Cinema with grocery'])
+
+    def test_overview(self):
+        # The rollups can't answer a search
+        for url in [f'/api/budgets/budgets/{self.budget.pk}/overview/',
+                    f'/api/budgets/async/budgets/{self.budget.pk}/overview/']:
+            with self.subTest(url=url):
+                overview = self.client.get(url, {'search': 'grocery'}).json()
+                self.assertEqual([row['negative_sum'] for row in overview['categories']], ['2.00'])
+
+
+class AsyncApiTests(QueryCountTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner@example.com', 'password')
+        cls.budget = Budget.objects.create(title='Budget', owner=cls.owner)
+        categories = [Category.objects.create(title=f'Category {i}') for i in range(2)]
+        for i in range(15):
+            Entry.objects.create(description=f'Entry {i}', amount=i + 1, date=date(2022, 1 + i % 4, 1 + i),
+                                 is_positive=i % 3 == 0, budget=cls.budget, category=categories[i % 2],
+                                 owner=cls.owner)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.owner)
+
+    def assertSameResponse(self, path, params=None):
+        expected = self.client.get(f'/api/budgets/{path}', params)
+        response = self.client.get(f'/api/budgets/async/{path}', params)
+
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content.replace(b'/async/', b'/'), expected.content)
+
+    def test_same_responses(self):
+        self.assertSameResponse('entries/')
+        self.assertSameResponse('entries/', {'page': 2, 'order': '-amount'})
+        self.assertSameResponse('entries/', {'page': 3})
+        self.assertSameResponse('entries/', {'cursor': '', 'order': 'date'})
+        self.assertSameResponse('entries/', {'amount__gte': 'x'})
+        self.assertSameResponse('budgets/')
+        self.assertSameResponse(f'budgets/{self.budget.pk}/overview/')
+        self.assertSameResponse(f'budgets/{self.budget.pk}/overview/', {'date__gte': '2022-02-10'})
+
+    def test_token_authentication(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/budgets/async/entries/').status_code, 401)
+
+        token = Token.objects.create(user=self.owner)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get('/api/budgets/async/entries/').json()['count'], 15)
+        # The token is cached now
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get('/api/budgets/async/entries/').json()['count'], 15)
+
+
+class CategoryCacheTests(QueryCountTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner@example.com', 'password')
+        cls.budget = Budget.objects.create(title='Budget', owner=cls.owner)
+        cls.category = Category.objects.create(title='Category')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.owner)
+
+    def post_entry(self, category):
+        return self.client.post('/api/budgets/entries/', {
+            'description': 'Entry', 'amount': '1.00', 'budget': self.budget.pk, 'category': category})
+
+    def test_validation_without_query(self):
+        categories.categories()
+        with self.assertNumQueries(0):
+            self.assertEqual(categories.get(self.category.pk).title, 'Category')
+        # Unknown ids are looked up again, in case the category was just created
+        with self.assertNumQueries(1):
+            self.assertIsNone(categories.get(0))
+
+        self.assertEqual(self.post_entry(self.category.pk).status_code, 201)
+        self.assertEqual(self.post_entry(0).json()['category'], ['Invalid pk "0" - object does not exist.'])
+        self.assertEqual(self.post_entry('x').json()['category'],
+                         ['Incorrect type. Expected pk value, received str.'])
+
+    def test_writes_reload(self):
+        categories.categories()
+        other = Category.objects.create(title='Other')
+        self.assertEqual(self.post_entry(other.pk).status_code, 201)
+
+        other.title = 'Renamed'
+        other.save()
+        self.assertEqual(categories.titles()[other.pk], 'Renamed')
+
+        pk = other.pk
+        other.delete()
+        self.assertEqual(self.post_entry(pk).status_code, 400)
+
+    def test_batch_reloads_for_new_categories(self):
+        categories.categories()
+        # Created without the signals, as by another process before the version bump is seen
+        Category.objects.bulk_create([Category(title='Other')])
+        other = Category.objects.get(title='Other')
+        response = self.client.post('/api/budgets/entries/batch/', [{'op': 'create', 'data': {
+            'description': 'Entry', 'amount': '1.00', 'budget': self.budget.pk, 'category': other.pk}}], format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+
+class RecurringEntryTests(QueryCountTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner@example.com', 'password')
+        cls.budget = Budget.objects.create(title='Budget', base=100, owner=cls.owner)
+        cls.category = Category.objects.create(title='Rent')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.owner)
+
+    def rule(self, **kwargs):
+        return RecurringEntry.objects.create(**{'description': 'Rent', 'amount': 10, 'budget': self.budget,
+                                                'category': self.category, 'owner': self.owner, **kwargs})
+
+    def test_schedule(self):
+        rule = self.rule(start_date=date(2022, 1, 10), day_of_month=31)
+        self.assertEqual(rule.next_date, date(2022, 1, 31))
+        self.assertEqual(recurring.occurrences(rule, date(2022, 5, 1))[0],
+                         [date(2022, 1, 31), date(2022, 2, 28), date(2022, 3, 31), date(2022, 4, 30)])
+
+        rule = self.rule(start_date=date(2022, 1, 10), frequency='weekly', interval=2, end_date=date(2022, 2, 10))
+        self.assertEqual(recurring.occurrences(rule, date(2023, 1, 1)),
+                         ([date(2022, 1, 10), date(2022, 1, 24), date(2022, 2, 7)], None))
+
+        rule = self.rule(start_date=date(2020, 2, 29), frequency='yearly')
+        self.assertEqual(recurring.occurrences(rule, date(2024, 3, 1))[0],
+                         [date(2020, 2, 29), date(2021, 2, 28), date(2022, 2, 28), date(2023, 2, 28), date(2024, 2, 29)])
+
+    def test_materialise(self):
+        monthly = self.rule(start_date=date(2022, 1, 1))
+        income = self.rule(start_date=date(2022, 1, 15), frequency='weekly', is_positive=True, amount=5)
+        finished = self.rule(start_date=date(2021, 1, 1), end_date=date(2021, 2, 1))
+
+        counts = recurring.materialise(date(2022, 3, 31), batch_size=2)
+        self.assertEqual((counts['rules'], counts['entries']), (3, 3 + 11 + 2))
+
+        monthly.refresh_from_db()
+        finished.refresh_from_db()
+        self.assertEqual(monthly.next_date, date(2022, 4, 1))
+        self.assertIsNone(finished.next_date)
+        self.assertEqual(list(income.entries.values_list('date', flat=True)[:2]), [date(2022, 1, 15), date(2022, 1, 22)])
+
+        # Idempotent, and the derived data is maintained
+        self.assertEqual(recurring.materialise(date(2022, 3, 31))['entries'], 0)
+        self.budget.refresh_from_db()
+        self.assertEqual(self.budget.balance, Decimal(100 - 50 + 55))
+        last = Entry.objects.filter(budget=self.budget).order_by('date', 'id').last()
+        self.assertEqual(last.running_balance, self.budget.balance)
+
+    def test_rollups_in_bulk(self):
+        self.rule(start_date=date(2020, 1, 1), frequency='weekly')
+        MonthlyRollup.objects.create(budget=self.budget, category=self.category, month=date(2020, 1, 1),
+                                     negative_total=0, negative_count=0)
+        recurring.materialise(date(2021, 12, 31))
+
+        fields = ('month', 'positive_total', 'negative_total', 'positive_count', 'negative_count')
+        maintained = list(MonthlyRollup.objects.order_by('month').values_list(*fields))
+        self.assertEqual(len(maintained), 24)
+        rollups.rebuild()
+        self.assertEqual(maintained, list(MonthlyRollup.objects.order_by('month').values_list(*fields)))
+
+    def test_existing_occurrences_are_skipped(self):
+        rule = self.rule(start_date=date(2022, 1, 1))
+        Entry.objects.create(description='Rent', amount=10, date=date(2022, 2, 1), budget=self.budget,
+                             category=self.category, owner=self.owner, recurring=rule)
+        RecurringEntry.objects.filter(pk=rule.pk).update(next_date=date(2022, 1, 1))
+
+        self.assertEqual(recurring.materialise(date(2022, 3, 1))['entries'], 2)
+        self.assertEqual(rule.entries.count(), 3)
+
+    def test_moving_onto_another_occurrence(self):
+        rule = self.rule(start_date=date(2022, 1, 1))
+        recurring.materialise(date(2022, 3, 1))
+        first, second, third = rule.entries.order_by('date')
+        error = {'date': [recurring.OCCURRENCE_TAKEN]}
+
+        response = self.client.patch(f'/api/budgets/entries/{first.pk}/', {'date': '2022-02-01'})
+        self.assertEqual((response.status_code, response.json()), (400, error))
+
+        operations = [{'op': 'update', 'id': first.pk, 'data': {'date': '2022-01-05'}},
+                      {'op': 'update', 'id': second.pk, 'data': {'date': '2022-01-05'}},
+                      {'op': 'update', 'id': third.pk, 'data': {'date': '2022-01-01'}}]
+        response = self.client.post('/api/budgets/entries/batch/', operations, format='json')
+        self.assertEqual((response.status_code, response.json()), (400, {'errors': [None, error, error]}))
+
+        # Other dates and other fields are still writable
+        response = self.client.patch(f'/api/budgets/entries/{first.pk}/', {'date': '2022-01-05', 'amount': '12.00'})
+        self.assertEqual(response.status_code, 200, response.content)
+        response = self.client.post('/api/budgets/entries/batch/', operations[1:2], format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/budgets/entries/batch/', [operations[2]], format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_api(self):
+        response = self.client.post('/api/budgets/recurring/', {
+            'description': 'Salary', 'amount': '2000.00', 'is_positive': True, 'frequency': 'monthly',
+            'day_of_month': 25, 'start_date': '2022-01-01', 'budget': self.budget.pk, 'category': self.category.pk})
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['next_date'], '2022-01-25')
+
+        recurring.materialise(date(2022, 2, 28))
+        rule_url = f'/api/budgets/recurring/{response.json()["id"]}/'
+        # Moving the day continues after the entries already created
+        response = self.client.patch(rule_url, {'day_of_month': 5})
+        self.assertEqual(response.json()['next_date'], '2022-03-05')
+
+        other = Budget.objects.create(title='Other', owner=CustomUser.objects.create_user('other@example.com', 'pw'))
+        for data in [{'budget': other.pk}, {'frequency': 'weekly'}, {'end_date': '2021-01-01'}]:
+            with self.subTest(data=data):
+                self.assertEqual(self.client.patch(rule_url, data).status_code, 400)
+
+
+class AllowanceTests(QueryCountTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner@example.com', 'password')
+        cls.budget = Budget.objects.create(title='Budget', owner=cls.owner)
+        cls.groceries = Category.objects.create(title='Groceries')
+        cls.rent = Category.objects.create(title='Rent')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.owner)
+
+    def spend(self, amount, category, day=None, is_positive=False):
+        return Entry.objects.create(description='Spent', amount=amount, date=day or date.today(), budget=self.budget,
+                                    is_positive=is_positive, category=category, owner=self.owner)
+
+    def allowances(self, **params):
+        response = self.client.get(f'/api/budgets/budgets/{self.budget.pk}/allowances/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return {row['category__title']: row for row in response.json()['allowances']}
+
+    def test_allowances(self):
+        response = self.client.post('/api/budgets/allocations/', {
+            'amount': '100.00', 'budget': self.budget.pk, 'category': self.groceries.pk})
+        self.assertEqual(response.status_code, 201, response.content)
+        Allocation.objects.create(amount=500, budget=self.budget, category=self.rent, owner=self.owner)
+
+        self.spend(30, self.groceries)
+        entry = self.spend(50, self.groceries)
+        self.spend(20, self.groceries, is_positive=True)
+        self.spend(40, self.groceries, day=date.today().replace(day=1) - timedelta(days=1))
+
+        allowances = self.allowances()
+        self.assertEqual(allowances['Groceries'], {
+            'category': self.groceries.pk, 'category__title': 'Groceries', 'allocated': '100.00', 'spent': '80.00',
+            'remaining': '20.00', 'overspent': False})
+        self.assertEqual((allowances['Rent']['spent'], allowances['Rent']['remaining']), ('0.00', '500.00'))
+
+        # Maintained with the entry writes
+        entry.amount = 90
+        entry.save()
+        self.assertEqual(self.allowances()['Groceries']['remaining'], '-20.00')
+        self.assertTrue(self.allowances()['Groceries']['overspent'])
+
+        last_month = date.today().replace(day=1) - timedelta(days=1)
+        self.assertEqual(self.allowances(month=f'{last_month:%Y-%m}')['Groceries']['spent'], '40.00')
+
+    def test_allocation_validation(self):
+        Allocation.objects.create(amount=100, budget=self.budget, category=self.groceries, owner=self.owner)
+        other = Budget.objects.create(title='Other', owner=CustomUser.objects.create_user('other@example.com', 'pw'))
+
+        for data in [{'budget': self.budget.pk, 'category': self.groceries.pk, 'amount': '10.00'},
+                     {'budget': other.pk, 'category': self.rent.pk, 'amount': '10.00'},
+                     {'budget': self.budget.pk, 'category': self.rent.pk, 'amount': '-10.00'}]:
+            with self.subTest(data=data):
+                self.assertEqual(self.client.post('/api/budgets/allocations/', data).status_code, 400)
+
+        # Other users see no allowances of the budget
+        self.client.force_authenticate(other.owner)
+        self.assertEqual(self.allowances(), {})
+
+
+class ArchiveTests(QueryCountTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner@example.com', 'password')
+        cls.budget = Budget.objects.create(title='Budget', base=100, owner=cls.owner)
+        cls.categories = [Category.objects.create(title=f'Category {i}') for i in range(2)]
+        for i in range(24):
+            Entry.objects.create(description=f'Entry {i}', amount=i + 1, date=date(2019 + i // 8, 1 + i % 12, 1 + i),
+                                 is_positive=i % 3 == 0, budget=cls.budget, category=cls.categories[i % 2],
+                                 owner=cls.owner)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.owner)
+
+    def rollups(self):
+        return list(MonthlyRollup.objects.order_by('budget', 'category', 'month').values_list(
+            'month', 'category', 'positive_total', 'negative_total', 'positive_count', 'negative_count'))
+
+    def test_archive(self):
+        balance, summaries = Budget.objects.get().balance, self.rollups()
+        counts = archive.archive(date(2021, 1, 1), batch_size=5)
+        self.assertEqual((counts['entries'], counts['years']), (16, [2019, 2020]))
+
+        self.budget.refresh_from_db()
+        self.assertEqual(self.budget.archived_until, date(2021, 1, 1))
+        self.assertEqual((Entry.objects.count(), ArchivedEntry.objects.count()), (8, 16))
+        # The balances and the rollups stay, and are rebuilt the same
+        self.assertEqual(self.budget.balance, balance)
+        self.assertEqual(self.rollups(), summaries)
+        self.assertEqual(balances.rebuild(), 0)
+        rollups.rebuild()
+        self.assertEqual(self.rollups(), summaries)
+
+        # Writes continue after the archived entries, and not before them
+        data = {'description': 'New', 'amount': '1.00', 'date': '2021-01-01', 'budget': self.budget.pk,
+                'category': self.categories[0].pk}
+        response = self.client.post('/api/budgets/entries/', data)
+        self.assertEqual(response.status_code, 201, response.content)
+        last_archived = ArchivedEntry.objects.order_by('date', 'id').last()
+        self.assertEqual(Entry.objects.get(pk=response.json()['id']).running_balance,
+                         last_archived.running_balance - 1)
+        response = self.client.post('/api/budgets/entries/', {**data, 'date': '2020-12-31'})
+        self.assertEqual(response.json(), {'date': ['Entries before 2021-01-01 are archived']})
+        operations = [{'op': 'create', 'data': {**data, 'date': '2020-06-01'}}]
+        self.assertEqual(self.client.post('/api/budgets/entries/batch/', operations, format='json').status_code, 400)
+
+    def test_big_ids(self):
+        # Entry ids are bigint
+        Entry.objects.create(id=2 ** 31 + 1, description='Big', amount=1, date=date(2019, 6, 1), budget=self.budget,
+                             category=self.categories[0], owner=self.owner)
+        archive.archive(date(2020, 1, 1))
+        self.assertTrue(ArchivedEntry.objects.filter(pk=2 ** 31 + 1).exists())
+
+    def test_entry_list(self):
+        everything = self.client.get('/api/budgets/entries/', {'order': 'date', 'date__gte': '2019-01-01'}).json()
+        newest_first = list(Entry.objects.order_by('-date', '-id').values_list('id', flat=True))
+        archive.archive(date(2021, 1, 1))
+
+        # Without date filters, only the entries table
+        self.assertEqual(self.client.get('/api/budgets/entries/', {'order': 'date'}).json()['count'], 8)
+        self.assertQueryCount('/api/budgets/entries/', 2, data={'order': 'date'})
+
+        self.assertEqual(self.client.get('/api/budgets/entries/', {'order': 'date', 'date__gte': '2019-01-01'}).json(),
+                         everything)
+        self.assertEqual(self.client.get('/api/budgets/entries/', {'date__year': 2020}).json()['count'], 8)
+        self.assertQueryCount('/api/budgets/entries/', 3, data={'date__year': 2022})
+
+        # Keyset pages across the boundary
+        params, seen = {'cursor': '', 'order': '-date', 'date__lte': '2022-12-31'}, []
+        url = '/api/budgets/entries/'
+        while url:
+            page = self.client.get(url, params).json()
+            seen += [entry['id'] for entry in page['results']]
+            url, params = page['next'], None
+        self.assertEqual(seen, newest_first)
+
+        response = self.client.get('/api/budgets/async/entries/', {'date__year': 2020})
+        self.assertEqual(response.json()['count'], 8)
+
+    def test_overview(self):
+        url = f'/api/budgets/budgets/{self.budget.pk}/overview/'
+        params = {'date__gte': '2019-03-15', 'description': 'Entry'}
+        expected = self.client.get(url, params).json()
+        archive.archive(date(2021, 1, 1))
+
+        self.assertEqual(self.client.get(url, params).json(), expected)
+        self.assertEqual(self.client.get(f'/api/budgets/async/budgets/{self.budget.pk}/overview/', params).json(),
+                         expected)
+        # From the rollups, which summarise the archived entries
+        self.assertEqual(self.client.get(url, {'date__gte': '2019-01-01'}).json()['months'][0]['month'], '2019-01-01')
+
+    def test_categories_with_archived_entries_are_protected(self):
+        archive.archive(date(2021, 1, 1))
+        balance = Budget.objects.get().balance
+        self.client.force_authenticate(CustomUser.objects.create_superuser('admin@example.com', 'password'))
+
+        response = self.client.delete(f'/api/budgets/categories/{self.categories[0].pk}/')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('category', response.json())
+        self.assertEqual(Budget.objects.get().balance, balance)
+        self.assertEqual(Entry.objects.filter(category=self.categories[0]).count(), 4)
+        self.assertEqual(balances.rebuild(), 0)
+
+        # Without archived entries the category and its entries go, and the balances follow
+        category = Category.objects.create(title='Recent')
+        Entry.objects.create(description='Recent', amount=5, date=date(2022, 6, 1), budget=self.budget,
+                             category=category, owner=self.owner)
+        self.assertEqual(self.client.delete(f'/api/budgets/categories/{category.pk}/').status_code, 204)
+        self.assertEqual(Budget.objects.get().balance, balance)
+        self.assertEqual(balances.rebuild(), 0)
+
+    def test_overview_paths_agree(self):
+        url = f'/api/budgets/budgets/{self.budget.pk}/overview/'
+        with self.captureOnCommitCallbacks(execute=True):
+            archive.archive_budget(self.budget.pk, date(2021, 1, 1), archive.BATCH_SIZE)
+
+        # From the rollups, and from the entries with filters matching all of them
+        expected = self.client.get(url).json()
+        self.assertEqual(expected['months'][0]['month'], '2019-01-01')
+        for params in [{'amount__gte': '0'}, {'description': 'Entry'}, {'date__lte': '2030-01-15'}]:
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).json(), expected)
+                self.assertEqual(self.client.get(f'/api/budgets/async/budgets/{self.budget.pk}/overview/',
+                                                 params).json(), expected)
+
+    def test_export_analytics_and_balance(self):
+        budget = f'/api/budgets/budgets/{self.budget.pk}'
+        requests = [('/api/budgets/entries/export/', {'date__year': 2019}),
+                    ('/api/budgets/entries/export/', {'date__gte': '2019-03-15', 'file_format': 'jsonl'}),
+                    (f'{budget}/analytics/', {'date__gte': '2019-01-01', 'by_category': True}),
+                    (f'{budget}/balance/', {'date__gte': '2019-01-01'}),
+                    (f'{budget}/balance/', {'resolution': 'month'})]
+        expected = [b''.join(self.client.get(url, params).streaming_content) if 'export' in url
+                    else self.client.get(url, params).json() for url, params in requests]
+        with self.captureOnCommitCallbacks(execute=True):
+            archive.archive(date(2021, 1, 1))
+
+        for (url, params), before in zip(requests, expected):
+            with self.subTest(url=url, params=params):
+                response = self.client.get(url, params)
+                after = b''.join(response.streaming_content) if 'export' in url else response.json()
+                self.assertEqual(after, before)
+
+    def test_recurring_entries_skip_archived_years(self):
+        archive.archive(date(2021, 1, 1))
+        RecurringEntry.objects.create(description='Rent', amount=10, start_date=date(2020, 11, 1), budget=self.budget,
+                                      category=self.categories[0], owner=self.owner)
+        recurring.materialise(date(2021, 2, 1))
+        self.assertEqual(list(Entry.objects.filter(recurring__isnull=False).values_list('date', flat=True)),
+                         [date(2021, 1, 1), date(2021, 2, 1)])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('archive_entries', horizon=date.today().year - 2020, stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['entries'], 8)
+        self.assertEqual(Budget.objects.get().archived_until, date(2020, 1, 1))
+
+
+class ChangeFeedTests(QueryCountTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner@example.com', 'password')
+        cls.other = CustomUser.objects.create_user('other@example.com', 'password')
+        cls.budget = Budget.objects.create(title='Budget', owner=cls.owner)
+        cls.category = Category.objects.create(title='Category')
+        cls.entries = [Entry.objects.create(description=f'Entry {i}', amount=i + 1, budget=cls.budget,
+                                            category=cls.category, owner=cls.owner) for i in range(3)]
+        other_budget = Budget.objects.create(title='Other', owner=cls.other)
+        Entry.objects.create(description='Other', amount=1, budget=other_budget, category=cls.category, owner=cls.other)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.owner)
+
+    def changes(self, cursor=None):
+        response = self.client.get('/api/budgets/changes/', {'cursor': cursor} if cursor else {})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_snapshot_then_changes(self):
+        snapshot = self.changes()
+        self.assertEqual([budget['title'] for budget in snapshot['budgets']], ['Budget'])
+        self.assertEqual([entry['id'] for entry in snapshot['entries']], [entry.pk for entry in self.entries])
+        self.assertEqual([category['title'] for category in snapshot['categories']], ['Category'])
+        self.assertFalse(snapshot['more'])
+
+        # Nothing changed since
+        changes = self.changes(snapshot['cursor'])
+        self.assertEqual((changes['budgets'], changes['entries'], changes['categories']), ([], [], []))
+        self.assertEqual(changes['cursor'], snapshot['cursor'])
+
+        updated, deleted = self.entries[0], self.entries[1]
+        updated.amount = 10
+        updated.save()
+        self.client.delete(f'/api/budgets/entries/{deleted.pk}/')
+        created = self.client.post('/api/budgets/entries/', {
+            'description': 'New', 'amount': '1.00', 'budget': self.budget.pk, 'category': self.category.pk}).json()
+
+        changes = self.changes(snapshot['cursor'])
+        self.assertEqual([(entry['id'], entry['amount']) for entry in changes['entries']],
+                         [(updated.pk, '10.00'), (created['id'], '1.00')])
+        # With its new balance
+        self.assertEqual([budget['balance'] for budget in changes['budgets']],
+                         [str(Budget.objects.get(pk=self.budget.pk).balance)])
+        self.assertEqual(changes['deleted'], {'budgets': [], 'entries': [deleted.pk], 'categories': []})
+        self.assertEqual(changes['categories'], [])
+
+    def test_deletions_and_categories(self):
+        cursor = self.changes()['cursor']
+        self.category.description = 'Updated'
+        self.category.save()
+        removed = Category.objects.create(title='Removed')
+        removed_id = removed.pk
+        removed.delete()
+        self.client.delete(f'/api/budgets/budgets/{self.budget.pk}/')
+
+        changes = self.changes(cursor)
+        self.assertEqual([category['description'] for category in changes['categories']], ['Updated'])
+        self.assertEqual(changes['deleted']['budgets'], [self.budget.pk])
+        self.assertCountEqual(changes['deleted']['entries'], [entry.pk for entry in self.entries])
+        self.assertEqual(changes['deleted']['categories'], [removed_id])
+        self.assertEqual(self.changes(changes['cursor'])['deleted'], {'budgets': [], 'entries': [], 'categories': []})
+
+        # The deletions are per user, the categories shared
+        self.client.force_authenticate(self.other)
+        changes = self.changes(cursor)
+        self.assertEqual(changes['deleted']['budgets'], [])
+        self.assertEqual(changes['deleted']['categories'], [removed_id])
+
+    def test_pages(self):
+        for i in range(4):
+            Entry.objects.create(description=f'More {i}', amount=1, budget=self.budget, category=self.category,
+                                 owner=self.owner)
+        expected = list(Entry.objects.filter(owner=self.owner).order_by('change_seq', 'id')
+                        .values_list('id', flat=True))
+
+        seen, cursor = [], None
+        with mock.patch.object(sync, 'PAGE_SIZE', 2):
+            while True:
+                page = self.changes(cursor)
+                seen += [entry['id'] for entry in page['entries']]
+                cursor = page['cursor']
+                if not page['more']:
+                    break
+        self.assertEqual(seen, expected)
+        self.assertEqual(self.changes(cursor)['entries'], [])
+
+    def test_bulk_writes(self):
+        cursor = self.changes()['cursor']
+        response = self.client.post('/api/budgets/entries/batch/', [
+            {'op': 'create', 'data': {'description': 'Batch', 'amount': '2.00', 'budget': self.budget.pk,
+                                      'category': self.category.pk}},
+            {'op': 'delete', 'id': self.entries[2].pk}], format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+        changes = self.changes(cursor)
+        self.assertEqual([entry['description'] for entry in changes['entries']], ['Batch'])
+        self.assertEqual(changes['deleted']['entries'], [self.entries[2].pk])
 
-# Create your tests here.
+    def test_invalid_cursor(self):
+        for cursor in ['not a cursor', sync.encode_cursor({'s': 'x'})]:
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/budgets/changes/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('cursor', response.json())
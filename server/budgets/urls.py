@@ -1,15 +1,25 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import api
+from . import api, async_api
 
 # Create a router and register our viewsets with it.
 router = DefaultRouter()
 router.register(r'budgets', api.BudgetViewSet)
 router.register(r'categories', api.CategoryViewSet)
 router.register(r'entries', api.EntryViewSet, basename='entries')
+router.register(r'recurring', api.RecurringEntryViewSet, basename='recurring')
+router.register(r'allocations', api.AllocationViewSet, basename='allocations')
 
 # The API URLs are now determined automatically by the router.
 urlpatterns = [
     path('budgets/<int:budget_id>/overview/', api.budget_overview, name='budget_overview'),
+    path('budgets/<int:budget_id>/analytics/', api.budget_analytics, name='budget_analytics'),
+    path('budgets/<int:budget_id>/balance/', api.budget_balance, name='budget_balance'),
+    path('budgets/<int:budget_id>/allowances/', api.budget_allowances, name='budget_allowances'),
+    path('changes/', api.changes, name='changes'),
+    # Async versions of the hot read endpoints, for ASGI servers
+    path('async/entries/', async_api.entry_list, name='async_entry_list'),
+    path('async/budgets/', async_api.budget_list, name='async_budget_list'),
+    path('async/budgets/<int:budget_id>/overview/', async_api.budget_overview, name='async_budget_overview'),
     path('', include(router.urls)),
 ]
@@ -0,0 +1,259 @@
+"""
+Per endpoint timing and query statistics of a sample of the requests.
+
+`instrumentation_middleware` records, for `INSTRUMENTATION_SAMPLE_RATE` of the
+requests resolved to a view, the wall time, the time and number of the
+queries, the queries run more than once with the same parameters and the time
+spent in DRF serializers. They are aggregated in histograms per method and
+view name, kept in the process and served to admins by `stats_view`.
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework import permissions, serializers
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+
+from accounts.authentication import stats as token_cache_stats
+
+# Upper bounds in milliseconds of the histogram buckets, the last one is unbounded
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float('inf'))
+
+_recording = ContextVar('instrumentation_recording', default=None)
+_lock = threading.Lock()
+_endpoints = {}
+
+
+class Recording:
+    """
+    Measures of the request being recorded.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = Counter()
+        self.serializer_time = 0.0
+        self.serializing = False
+
+    @property
+    def duplicates(self):
+        return sum(count - 1 for count in self.statements.values())
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+
+    def add(self, milliseconds):
+        self.total += milliseconds
+        for i, bound in enumerate(BUCKETS):
+            if milliseconds <= bound:
+                self.counts[i] += 1
+                return
+
+    def percentile(self, fraction):
+        """
+        Upper bound of the bucket holding the `fraction` percentile, None when unbounded or empty.
+        """
+        target = fraction * sum(self.counts)
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if count and seen >= target:
+                return bound if bound != float('inf') else None
+        return None
+
+    def as_dict(self, count):
+        return {
+            'mean_ms': round(self.total / count, 3) if count else None,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'buckets': {('inf' if bound == float('inf') else bound): n for bound, n in zip(BUCKETS, self.counts)},
+        }
+
+
+class EndpointStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.wall = Histogram()
+        self.db = Histogram()
+        self.serializer = Histogram()
+        self.queries = 0
+        self.max_queries = 0
+        self.duplicate_queries = 0
+        self.requests_with_duplicates = 0
+
+    def add(self, recording, wall_time, status_code):
+        self.count += 1
+        self.errors += status_code >= 500
+        self.wall.add(wall_time * 1000)
+        self.db.add(recording.db_time * 1000)
+        self.serializer.add(recording.serializer_time * 1000)
+        self.queries += recording.queries
+        self.max_queries = max(self.max_queries, recording.queries)
+        duplicates = recording.duplicates
+        self.duplicate_queries += duplicates
+        self.requests_with_duplicates += duplicates > 0
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'wall': self.wall.as_dict(self.count),
+            'db': self.db.as_dict(self.count),
+            'serializer': self.serializer.as_dict(self.count),
+            'queries_mean': round(self.queries / self.count, 2),
+            'queries_max': self.max_queries,
+            'duplicate_queries': self.duplicate_queries,
+            'requests_with_duplicates': self.requests_with_duplicates,
+        }
+
+
+def record_query(execute, sql, params, many, context):
+    recording = _recording.get()
+    if recording is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recording.db_time += time.perf_counter() - started
+        recording.queries += 1
+        if not many:
+            recording.statements[(sql, repr(params))] += 1
+
+
+def wrap_connection(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def serializing():
+    """
+    Count the time of the block as serializer time, the outermost block only when they nest.
+    """
+    recording = _recording.get()
+    if recording is None or recording.serializing:
+        yield
+        return
+
+    recording.serializing = True
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        recording.serializer_time += time.perf_counter() - started
+        recording.serializing = False
+
+
+def timed_data(data):
+    def wrapper(self):
+        with serializing():
+            return data.fget(self)
+
+    wrapper.instrumented = True
+    return property(wrapper)
+
+
+def install():
+    # DRF has no hook around the serialization, so the `data` properties are wrapped
+    connection_created.connect(wrap_connection)
+    for serializer in (serializers.BaseSerializer, serializers.Serializer, serializers.ListSerializer):
+        if not getattr(serializer.data.fget, 'instrumented', False):
+            serializer.data = timed_data(serializer.data)
+
+
+def start(request):
+    if random.random() >= getattr(settings, 'INSTRUMENTATION_SAMPLE_RATE', 0):
+        return None
+    # Connections opened before the middleware was loaded
+    for connection in connections.all():
+        wrap_connection(connection)
+    return _recording.set(Recording())
+
+
+def finish(request, response):
+    recording = _recording.get()
+    match = request.resolver_match
+    if match is None:
+        return
+
+    key = f'{request.method} {match.view_name}'
+    wall_time = time.perf_counter() - recording.started
+    with _lock:
+        if key not in _endpoints:
+            _endpoints[key] = EndpointStats()
+        _endpoints[key].add(recording, wall_time, response.status_code)
+
+
+def stats():
+    with _lock:
+        return {key: endpoint.as_dict() for key, endpoint in sorted(_endpoints.items())}
+
+
+def reset():
+    with _lock:
+        _endpoints.clear()
+
+
+@sync_and_async_middleware
+def instrumentation_middleware(get_response):
+    install()
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = start(request)
+            if token is None:
+                return await get_response(request)
+            try:
+                response = await get_response(request)
+                finish(request, response)
+                return response
+            finally:
+                _recording.reset(token)
+    else:
+        def middleware(request):
+            token = start(request)
+            if token is None:
+                return get_response(request)
+            try:
+                response = get_response(request)
+                finish(request, response)
+                return response
+            finally:
+                _recording.reset(token)
+
+    return middleware
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([permissions.IsAdminUser])
+def stats_view(request):
+    """
+    Statistics of the sampled requests handled by this process, DELETE resets them.
+    """
+    if request.method == 'DELETE':
+        reset()
+        return Response(status=204)
+
+    return Response({
+        'sample_rate': getattr(settings, 'INSTRUMENTATION_SAMPLE_RATE', 0),
+        'endpoints': stats(),
+        'token_cache': token_cache_stats(),
+    })
@@ -0,0 +1,120 @@
+"""
+Full-text search on text columns, with the index of the database in use.
+
+On PostgreSQL the columns are indexed with a GIN index on their `tsvector`,
+maintained by the database. On SQLite they are copied in an FTS5 table keyed
+by the primary key, which the apps keep in sync with `SearchIndex.update` when
+they write. Other databases fall back to `icontains`.
+
+The index is created by a migration calling `create_index` and `drop_index`.
+"""
+import re
+
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+# Language-neutral: no stemming nor stop words, descriptions are not all in one language.
+CONFIG = 'simple'
+WORD = re.compile(r'\w+')
+
+
+def fts_table(table):
+    return f'{table}_fts'
+
+
+def index_name(table):
+    return f'{table}_search_idx'
+
+
+def tsvector_sql(columns):
+    # Same expression as SearchVector(*columns, config=CONFIG), so the planner matches the index.
+    text = " || ' ' || ".join(f"COALESCE({column}, '')" for column in columns)
+    return f"to_tsvector('{CONFIG}'::regconfig, {text})"
+
+
+def create_index(schema_editor, table, columns):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(f'CREATE INDEX {index_name(table)} ON {table} USING GIN ({tsvector_sql(columns)})')
+    elif vendor == 'sqlite':
+        fts = fts_table(table)
+        schema_editor.execute(f'CREATE VIRTUAL TABLE {fts} USING fts5({", ".join(columns)})')
+        schema_editor.execute(f'INSERT INTO {fts} (rowid, {", ".join(columns)}) '
+                              f'SELECT id, {", ".join(columns)} FROM {table}')
+
+
+def drop_index(schema_editor, table, columns):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {index_name(table)}')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {fts_table(table)}')
+
+
+def fts5_query(text):
+    """
+    FTS5 query matching all the words of `text`, each quoted so the input is not parsed as query syntax.
+    """
+    return ' '.join(f'"{word}"' for word in WORD.findall(text))
+
+
+class SearchIndex:
+    """
+    Search on the `columns` of `model`, annotating the matches with `search_rank` (higher is better).
+    """
+
+    def __init__(self, model, columns):
+        self.model = model
+        self.columns = columns
+
+    @property
+    def table(self):
+        return self.model._meta.db_table
+
+    def filter(self, queryset, text):
+        vendor = connections[queryset.db].vendor
+
+        if vendor == 'postgresql':
+            from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+            vector = SearchVector(*self.columns, config=CONFIG)
+            query = SearchQuery(text, config=CONFIG, search_type='websearch')
+            return queryset.annotate(search_vector=vector).filter(search_vector=query).annotate(
+                search_rank=SearchRank(vector, query))
+
+        if vendor == 'sqlite':
+            query = fts5_query(text)
+            if not query:
+                return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+            fts = fts_table(self.table)
+            # bm25() is lower for better matches
+            rank = RawSQL(f'SELECT -rank FROM {fts} WHERE {fts} MATCH %s AND rowid = {self.table}.id', [query],
+                          output_field=FloatField())
+            return queryset.filter(pk__in=RawSQL(f'SELECT rowid FROM {fts} WHERE {fts} MATCH %s', [query])).annotate(
+                search_rank=rank)
+
+        condition = Q()
+        for word in WORD.findall(text):
+            condition &= Q(*[(f'{column}__icontains', word) for column in self.columns], _connector=Q.OR)
+        return queryset.filter(condition).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    def update(self, removed_ids=(), added=(), using='default'):
+        """
+        Remove the rows of `removed_ids` and index the `added` rows, dicts with the id and the columns.
+        Only needed with SQLite, the other databases index the table itself.
+        """
+        if connections[using].vendor != 'sqlite' or not (removed_ids or added):
+            return
+
+        fts = fts_table(self.table)
+        with connections[using].cursor() as cursor:
+            if removed_ids:
+                removed_ids = list(removed_ids)
+                cursor.execute(f'DELETE FROM {fts} WHERE rowid IN ({", ".join(["%s"] * len(removed_ids))})',
+                               removed_ids)
+            if added:
+                cursor.executemany(
+                    f'INSERT INTO {fts} (rowid, {", ".join(self.columns)}) '
+                    f'VALUES (%s, {", ".join(["%s"] * len(self.columns))})',
+                    [[row['id']] + [row[column] for column in self.columns] for row in added])
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -45,9 +48,11 @@ INSTALLED_APPS = [
     'accounts.apps.AccountsConfig',
     'snippets.apps.SnippetsConfig',
     'budgets.apps.BudgetsConfig',
+    'benchmarks.apps.BenchmarksConfig',
 ]
 
 MIDDLEWARE = [
+    'portfolio.instrumentation.instrumentation_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,6 +62,9 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Fraction of the requests measured by the instrumentation middleware, see /api/stats/
+INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get('INSTRUMENTATION_SAMPLE_RATE', '0.05'))
+
 ROOT_URLCONF = 'portfolio.urls'
 
 TEMPLATES = [
@@ -82,14 +90,87 @@ WSGI_APPLICATION = 'portfolio.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
+# SQLite unless SQL_ENGINE is set, see .env.dev for the Postgres container
+SQL_ENGINE = os.environ.get('SQL_ENGINE', 'django.db.backends.sqlite3')
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'ENGINE': SQL_ENGINE,
+        'NAME': os.environ.get('SQL_DATABASE', BASE_DIR / 'db.sqlite3'),
+        'USER': os.environ.get('SQL_USER', ''),
+        'PASSWORD': os.environ.get('SQL_PASSWORD', ''),
+        'HOST': os.environ.get('SQL_HOST', ''),
+        'PORT': os.environ.get('SQL_PORT', ''),
+        # Seconds a connection is reused across requests: 0 opens one per request, 'none' keeps it forever
+        'CONN_MAX_AGE': (None if os.environ.get('SQL_CONN_MAX_AGE', '0').lower() == 'none'
+                         else int(os.environ.get('SQL_CONN_MAX_AGE', '0'))),
+        # Check a reused connection is still alive before the first query of a request
+        'CONN_HEALTH_CHECKS': os.environ.get('SQL_CONN_HEALTH_CHECKS', '0') == '1',
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+
+# locmem, file or redis, for the caches the workers have to share.
+# locmem keeps them in each process: it is only correct with a single worker (runserver, the tests),
+# other workers would serve stale budget responses for up to an hour and accept revoked tokens for
+# up to 5 minutes. Use file for several workers on one host, redis for several hosts.
+BUDGETS_CACHE_BACKEND = os.environ.get('BUDGETS_CACHE_BACKEND', 'locmem')
+# Directory of the file caches, or URL of the redis server
+BUDGETS_CACHE_LOCATION = os.environ.get('BUDGETS_CACHE_LOCATION')
+
+
+def shared_cache(name):
+    """
+    Settings of the cache `name` on the BUDGETS_CACHE_BACKEND.
+    """
+    return {
+        'locmem': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': name,
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        },
+        'file': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': Path(BUDGETS_CACHE_LOCATION or BASE_DIR / 'cache') / name,
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        },
+        'redis': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': BUDGETS_CACHE_LOCATION or 'redis://127.0.0.1:6379',
+            'KEY_PREFIX': name,
+        },
+    }[BUDGETS_CACHE_BACKEND]
+
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Highlighted snippets by content hash, least recently used entries are evicted first
+    'highlight': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'highlight',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+    # API token -> user, see accounts.authentication. Shared, so that a revoked token is refused by all the workers.
+    'tokens': {
+        **shared_cache('tokens'),
+        'TIMEOUT': 300,
+    },
+    # Budget list and overview responses, see budgets.caching
+    'budgets': {
+        **shared_cache('budgets'),
+        'TIMEOUT': 3600,
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -135,10 +216,13 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Django Rest Framework
 
+# Basic authentication hashes the password on every request, API clients should use a token
+API_BASIC_AUTHENTICATION = os.environ.get('API_BASIC_AUTHENTICATION', '1') == '1'
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
+        'accounts.authentication.CachedTokenAuthentication',
+        *(['rest_framework.authentication.BasicAuthentication'] if API_BASIC_AUTHENTICATION else []),
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': (
@@ -148,6 +232,20 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10
 }
 
+# Budgets
+
+# Entries of the years before the last ENTRY_ARCHIVE_HORIZON_YEARS are moved to the archive by
+# `manage.py archive_entries`
+ENTRY_ARCHIVE_HORIZON_YEARS = int(os.environ.get('ENTRY_ARCHIVE_HORIZON_YEARS', '2'))
+
+# Snippets
+
+# 'sync' highlights on save, 'pool' in a local process pool, 'queue' with `manage.py highlight_worker`
+SNIPPETS_HIGHLIGHT_MODE = os.environ.get('SNIPPETS_HIGHLIGHT_MODE', 'sync')
+if SNIPPETS_HIGHLIGHT_MODE not in ('sync', 'pool', 'queue'):
+    raise ImproperlyConfigured('SNIPPETS_HIGHLIGHT_MODE must be sync, pool or queue')
+SNIPPETS_HIGHLIGHT_WORKERS = int(os.environ.get('SNIPPETS_HIGHLIGHT_WORKERS', '2'))
+
 DJOSER = {
     'SERIALIZERS': {
         'user': 'accounts.serializers.CustomUserSerializer',
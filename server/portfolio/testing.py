@@ -0,0 +1,49 @@
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+
+class QueryCountTestCase(APITestCase):
+    """
+    Base class for the tests asserting how many queries the API endpoints run.
+
+    `assertQueryCount` bounds the queries of a request, `assertConstantQueries`
+    checks that the count does not grow with the number of rows returned.
+    """
+
+    def setUp(self):
+        # Cached responses would hide the queries, and outlive the rows of a previous test.
+        for cache in caches.all():
+            cache.clear()
+
+    def count_queries(self, url, method='get', data=None, status=200):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, data, format='json')
+
+        self.assertEqual(response.status_code, status, response.content)
+        return len(context.captured_queries), context.captured_queries
+
+    def assertQueryCount(self, url, max_queries, method='get', data=None, status=200):
+        count, queries = self.count_queries(url, method, data, status)
+        details = '\n'.join(query['sql'] for query in queries)
+        self.assertLessEqual(count, max_queries, f'{url} ran {count} queries, expected at most {max_queries}:\n{details}')
+        return count
+
+    def assertConstantQueries(self, url, max_queries, grow, data=None):
+        """
+        Request `url`, call `grow()` to add rows, then check that the same request
+        runs the same number of queries and at most `max_queries`.
+        """
+        before = self.assertQueryCount(url, max_queries, data=data)
+        with self.captureOnCommitCallbacks(execute=True):
+            grow()
+        after = self.assertQueryCount(url, max_queries, data=data)
+        self.assertEqual(before, after, f'{url} ran {before} queries, then {after} with more rows')
+
+    def assertRoutesCovered(self, router, budgets):
+        """
+        Fail when a route of `router` has no query budget, so new endpoints get one.
+        """
+        prefixes = {prefix for prefix, viewset, basename in router.registry}
+        self.assertEqual(prefixes - set(budgets), set(), 'Router endpoints without a query budget')
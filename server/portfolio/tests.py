@@ -0,0 +1,80 @@
+from datetime import date
+
+from django.db import connection
+from django.test import RequestFactory, override_settings
+
+from accounts.models import CustomUser
+from budgets.models import Budget, Category, Entry
+from . import instrumentation
+from .testing import QueryCountTestCase
+
+
+@override_settings(INSTRUMENTATION_SAMPLE_RATE=1)
+class InstrumentationTests(QueryCountTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser('admin@example.com', 'password')
+        cls.budget = Budget.objects.create(title='Budget', owner=cls.admin)
+        category = Category.objects.create(title='Category')
+        for i in range(3):
+            Entry.objects.create(description=f'Entry {i}', amount=i + 1, date=date(2022, 1, 1 + i), budget=cls.budget,
+                                 category=category, owner=cls.admin)
+
+    def setUp(self):
+        super().setUp()
+        instrumentation.reset()
+        self.client.force_authenticate(self.admin)
+
+    def test_endpoint_stats(self):
+        for _ in range(3):
+            self.client.get('/api/budgets/entries/')
+        self.client.get(f'/api/budgets/budgets/{self.budget.pk}/')
+        self.client.get('/api/budgets/missing/')
+
+        endpoints = self.client.get('/api/stats/').json()['endpoints']
+        self.assertEqual(set(endpoints), {'GET entries-list', 'GET budget-detail'})
+
+        entries = endpoints['GET entries-list']
+        self.assertEqual(entries['count'], 3)
+        self.assertEqual(entries['errors'], 0)
+        self.assertEqual(entries['queries_max'], 2)
+        self.assertEqual(sum(entries['wall']['buckets'].values()), 3)
+        self.assertGreater(entries['wall']['mean_ms'], 0)
+        self.assertGreater(entries['serializer']['mean_ms'], 0)
+
+    def test_duplicate_queries(self):
+        instrumentation.wrap_connection(connection)
+        recording = instrumentation.Recording()
+        token = instrumentation._recording.set(recording)
+        try:
+            for pk in (self.budget.pk, self.budget.pk, 0):
+                Budget.objects.filter(pk=pk).exists()
+        finally:
+            instrumentation._recording.reset(token)
+
+        self.assertEqual(recording.queries, 3)
+        self.assertEqual(recording.duplicates, 1)
+        self.assertGreater(recording.db_time, 0)
+
+    def test_recording_reset_on_exception(self):
+        def get_response(request):
+            raise ValueError
+
+        middleware = instrumentation.instrumentation_middleware(get_response)
+        with self.assertRaises(ValueError):
+            middleware(RequestFactory().get('/api/budgets/entries/'))
+        self.assertIsNone(instrumentation._recording.get())
+
+    def test_sampling(self):
+        with override_settings(INSTRUMENTATION_SAMPLE_RATE=0):
+            self.client.get('/api/budgets/entries/')
+        self.assertEqual(instrumentation.stats(), {})
+
+    def test_admins_only(self):
+        self.client.force_authenticate(CustomUser.objects.create_user('user@example.com', 'password'))
+        self.assertEqual(self.client.get('/api/stats/').status_code, 403)
+
+        self.client.force_authenticate(self.admin)
+        self.client.get('/api/budgets/entries/')
+        self.assertEqual(self.client.delete('/api/stats/').status_code, 204)
+        self.assertNotIn('GET entries-list', instrumentation.stats())
@@ -16,6 +16,8 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from . import instrumentation
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     # Add auth to browserable api
@@ -26,4 +28,6 @@ urlpatterns = [
     path('api/users/', include('accounts.urls')),
     path('api/snippets/', include('snippets.urls')),
     path('api/budgets/', include('budgets.urls')),
+    # Per endpoint statistics of the sampled requests, admins only
+    path('api/stats/', instrumentation.stats_view, name='stats'),
 ]
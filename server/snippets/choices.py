@@ -0,0 +1,39 @@
+"""
+Language and style choices of the snippets.
+
+Listing them from Pygments imports its plugins and every style module, so they
+are read from the table generated by `manage.py generate_pygments_choices`
+and only computed from Pygments, once, when the table was generated for
+another Pygments version.
+"""
+from functools import lru_cache
+
+from pygments import __version__ as pygments_version
+
+from . import pygments_choices
+
+
+def compute_language_choices():
+    from pygments.lexers import get_all_lexers
+
+    return sorted([(item[1][0], item[0]) for item in get_all_lexers() if item[1]])
+
+
+def compute_style_choices():
+    from pygments.styles import get_all_styles
+
+    return sorted([(item, item) for item in get_all_styles()])
+
+
+@lru_cache(maxsize=None)
+def language_choices():
+    if pygments_choices.PYGMENTS_VERSION == pygments_version:
+        return pygments_choices.LANGUAGE_CHOICES
+    return compute_language_choices()
+
+
+@lru_cache(maxsize=None)
+def style_choices():
+    if pygments_choices.PYGMENTS_VERSION == pygments_version:
+        return pygments_choices.STYLE_CHOICES
+    return compute_style_choices()
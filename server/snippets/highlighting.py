@@ -0,0 +1,79 @@
+import hashlib
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+
+CACHE_ALIAS = 'highlight'
+
+
+def cache_key(code, language, style, linenos):
+    """
+    Content address of a highlighted snippet.
+    """
+    digest = hashlib.sha256()
+    for part in (language, style, 'table' if linenos else '', code):
+        digest.update(part.encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def get_formatter(style, linenos):
+    # Imported on first use to keep Pygments out of the startup path.
+    from pygments.formatters.html import HtmlFormatter
+
+    return HtmlFormatter(style=style, linenos='table' if linenos else False, classprefix="snippet", wrapcode=True,
+                         nobackground=True)
+
+
+def is_deferred():
+    """
+    Whether snippets are highlighted outside of the request, see `snippets.tasks`.
+    """
+    return settings.SNIPPETS_HIGHLIGHT_MODE != 'sync'
+
+
+def highlight_code(code, language, style, linenos):
+    """
+    Return the highlighted HTML fragment of the code, without the stylesheet (see `full_page`).
+    """
+    from pygments import highlight
+    from pygments.lexers import get_lexer_by_name
+
+    return highlight(code, get_lexer_by_name(language), get_formatter(style, linenos))
+
+
+def cached(key):
+    return caches[CACHE_ALIAS].get(key)
+
+
+def store(key, fragment):
+    caches[CACHE_ALIAS].set(key, fragment)
+
+
+def render(code, language, style, linenos, key=None):
+    """
+    Return the highlighted HTML fragment of the code, from the cache when possible.
+    """
+    key = key or cache_key(code, language, style, linenos)
+    fragment = cached(key)
+
+    if fragment is None:
+        fragment = highlight_code(code, language, style, linenos)
+        store(key, fragment)
+
+    return fragment
+
+
+@lru_cache(maxsize=None)
+def style_defs(style):
+    return get_formatter(style, False).get_style_defs('body')
+
+
+def full_page(fragment, style, title=''):
+    """
+    Wrap a fragment in the standalone HTML page pygments renders with `full=True`.
+    """
+    from pygments.formatters.html import DOC_FOOTER, DOC_HEADER
+
+    return DOC_HEADER % dict(title=title, styledefs=style_defs(style), encoding=None) + fragment + DOC_FOOTER
@@ -0,0 +1,53 @@
+import json
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Run in a fresh interpreter, so nothing is imported yet.
+SETUP = '''
+import json, os, sys, time
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', {settings_module!r})
+start = time.perf_counter()
+import django
+django.setup()
+if {eager!r}:
+    # What snippets.models did at import time before the choices table.
+    from pygments.lexers import get_all_lexers
+    from pygments.styles import get_all_styles
+    sorted([(item[1][0], item[0]) for item in get_all_lexers() if item[1]])
+    sorted([(item, item) for item in get_all_styles()])
+print(json.dumps({{'seconds': time.perf_counter() - start, 'modules': len(sys.modules)}}))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Measure django.setup() wall time and imported modules, with and without the eager Pygments scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+
+    def handle(self, *args, **options):
+        results = {
+            'eager_choices': self.measure(options['runs'], eager=True),
+            'choices_table': self.measure(options['runs'], eager=False),
+        }
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def measure(self, runs, eager):
+        samples = []
+        for _ in range(runs):
+            code = SETUP.format(settings_module=settings.SETTINGS_MODULE, eager=eager)
+            output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                    cwd=settings.BASE_DIR).stdout
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+
+        seconds = [sample['seconds'] for sample in samples]
+        return {
+            'runs': runs,
+            'median_seconds': round(statistics.median(seconds), 4),
+            'min_seconds': round(min(seconds), 4),
+            'modules': samples[-1]['modules'],
+        }
@@ -0,0 +1,42 @@
+import pprint
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from pygments import __version__ as pygments_version
+
+from snippets import choices
+
+TEMPLATE = '''"""
+Generated by `manage.py generate_pygments_choices`, do not edit.
+"""
+
+PYGMENTS_VERSION = {version!r}
+
+LANGUAGE_CHOICES = {languages}
+
+STYLE_CHOICES = {styles}
+'''
+
+
+class Command(BaseCommand):
+    help = 'Generate the table of snippet languages and styles for the installed Pygments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Fail if the table is not up to date')
+
+    def handle(self, *args, **options):
+        path = Path(choices.pygments_choices.__file__)
+        content = TEMPLATE.format(
+            version=pygments_version,
+            languages=pprint.pformat(choices.compute_language_choices(), width=120),
+            styles=pprint.pformat(choices.compute_style_choices(), width=120),
+        )
+
+        if options['check']:
+            if path.read_text() != content:
+                raise CommandError(f'{path.name} is out of date, run manage.py generate_pygments_choices')
+            self.stdout.write(f'{path.name} is up to date')
+            return
+
+        path.write_text(content)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {path.name} for Pygments {pygments_version}'))
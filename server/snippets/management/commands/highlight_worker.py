@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from snippets import tasks
+
+
+class Command(BaseCommand):
+    help = 'Highlight the pending snippets, for SNIPPETS_HIGHLIGHT_MODE = "queue"'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10)
+        parser.add_argument('--interval', type=float, default=1, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            count = tasks.render_pending(options['batch_size'])
+            if count:
+                self.stdout.write(f'Highlighted {count} snippets')
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['interval'])
@@ -0,0 +1,33 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+def render_fragments(apps, schema_editor):
+    """
+    `highlighted` now holds the HTML fragment only, the page and stylesheet are added when served.
+    """
+    from snippets import highlighting
+
+    Snippet = apps.get_model('snippets', 'Snippet')
+    for snippet in Snippet.objects.iterator():
+        snippet.highlight_key = highlighting.cache_key(snippet.code, snippet.language, snippet.style, snippet.linenos)
+        snippet.highlighted = highlighting.render(snippet.code, snippet.language, snippet.style, snippet.linenos,
+                                                  key=snippet.highlight_key)
+        snippet.save(update_fields=['highlight_key', 'highlighted'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0002_alter_snippet_style'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='snippet',
+            name='highlight_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.RunPython(render_fragments, migrations.RunPython.noop),
+    ]
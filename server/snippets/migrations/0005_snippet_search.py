@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from portfolio import search
+
+
+def create_index(apps, schema_editor):
+    search.create_index(schema_editor, 'snippets_snippet', ['title', 'code'])
+
+
+def drop_index(apps, schema_editor):
+    search.drop_index(schema_editor, 'snippets_snippet', ['title', 'code'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0004_snippet_render_status'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
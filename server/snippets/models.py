@@ -1,16 +1,18 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
-from pygments.lexers import get_all_lexers, get_lexer_by_name
-from pygments.styles import get_all_styles
-from pygments.formatters.html import HtmlFormatter
-from pygments import highlight
 
-LEXERS = [item for item in get_all_lexers() if item[1]]
-LANGUAGE_CHOICES = sorted([(item[1][0], item[0]) for item in LEXERS])
-STYLE_CHOICES = sorted([(item, item) for item in get_all_styles()])
+from . import choices, highlighting
+
+LANGUAGE_CHOICES = choices.language_choices()
+STYLE_CHOICES = choices.style_choices()
 
 
 class Snippet(models.Model):
+    READY = 'ready'
+    PENDING = 'pending'
+    FAILED = 'failed'
+    RENDER_STATUS_CHOICES = [(READY, 'Ready'), (PENDING, 'Pending'), (FAILED, 'Failed')]
+
     created = models.DateTimeField(auto_now_add=True)
     title = models.CharField(max_length=100, blank=True, default='')
     code = models.TextField()
@@ -18,6 +20,8 @@ class Snippet(models.Model):
     language = models.CharField(choices=LANGUAGE_CHOICES, default='python', max_length=100)
     style = models.CharField(choices=STYLE_CHOICES, default='monokai', max_length=100)
     highlighted = models.TextField()
+    highlight_key = models.CharField(max_length=64, blank=True, default='', editable=False)
+    render_status = models.CharField(choices=RENDER_STATUS_CHOICES, default=READY, max_length=10, editable=False)
 
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='snippets', on_delete=models.CASCADE)
 
@@ -27,13 +31,36 @@ class Snippet(models.Model):
     def save(self, *args, **kwargs):
         """
         Use the `pygments` library to create a highlighted HTML
-        representation of the code snippet.
+        representation of the code snippet, unless the code, language,
+        style and line numbers did not change since the last save.
+
+        When highlighting is deferred (`SNIPPETS_HIGHLIGHT_MODE`), the snippet is
+        saved as pending and rendered by `snippets.tasks` after the commit.
         """
-        lexer = get_lexer_by_name(self.language)
-        linenos = 'table' if self.linenos else False
-        options = {'title': self.title} if self.title else {}
-        formatter = HtmlFormatter(style=self.style, linenos=linenos, classprefix="snippet", full=True, wrapcode=True,
-                                  nobackground=True, **options)
-        formatter.get_style_defs("td.code")
-        self.highlighted = highlight(self.code, lexer, formatter)
+        key = highlighting.cache_key(self.code, self.language, self.style, self.linenos)
+        deferred = False
+
+        if key != self.highlight_key:
+            self.highlight_key = key
+            fragment = highlighting.cached(key)
+
+            if fragment is None and highlighting.is_deferred():
+                self.highlighted, self.render_status, deferred = '', self.PENDING, True
+            else:
+                self.highlighted = fragment or self.render_highlight()
+                self.render_status = self.READY
+
         super().save(*args, **kwargs)
+
+        if deferred:
+            from . import tasks
+            transaction.on_commit(lambda: tasks.enqueue(self))
+
+    def render_highlight(self):
+        return highlighting.render(self.code, self.language, self.style, self.linenos, key=self.highlight_key)
+
+    def highlighted_page(self):
+        """
+        The highlighted code as a standalone HTML page, with the stylesheet of the snippet style.
+        """
+        return highlighting.full_page(self.highlighted, self.style, self.title)
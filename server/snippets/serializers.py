@@ -8,4 +8,4 @@ class SnippetSerializer(serializers.HyperlinkedModelSerializer):
 
     class Meta:
         model = Snippet
-        fields = ['id', 'url', 'highlight', 'title', 'code', 'linenos', 'language', 'style', 'owner']
+        fields = ['id', 'url', 'highlight', 'title', 'code', 'linenos', 'language', 'style', 'render_status', 'owner']
@@ -0,0 +1,21 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Snippet
+from .search import snippets
+
+INDEXED_FIELDS = set(snippets.columns)
+
+
+@receiver(post_save, sender=Snippet)
+def index_snippet(sender, instance, created, update_fields, **kwargs):
+    if update_fields is not None and not INDEXED_FIELDS & set(update_fields):
+        return
+
+    row = {'id': instance.pk, **{column: getattr(instance, column) for column in snippets.columns}}
+    snippets.update(removed_ids=[] if created else [instance.pk], added=[row])
+
+
+@receiver(post_delete, sender=Snippet)
+def unindex_snippet(sender, instance, **kwargs):
+    snippets.update(removed_ids=[instance.pk])
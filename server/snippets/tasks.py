@@ -0,0 +1,90 @@
+"""
+Deferred highlighting of snippets, selected with `SNIPPETS_HIGHLIGHT_MODE`:
+
+- `sync`: highlight in `Snippet.save`, on the request thread.
+- `pool`: highlight in a local process pool, the result is stored when the job completes.
+- `queue`: pending snippets are the queue, drained by `manage.py highlight_worker`.
+
+Failed snippets stay failed until `retry` is called, from the `rehighlight` action of the API.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from . import highlighting
+from .models import Snippet
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.SNIPPETS_HIGHLIGHT_WORKERS)
+    return _executor
+
+
+def enqueue(snippet):
+    if settings.SNIPPETS_HIGHLIGHT_MODE != 'pool':
+        return
+
+    future = get_executor().submit(highlighting.highlight_code, snippet.code, snippet.language, snippet.style,
+                                   snippet.linenos)
+    future.add_done_callback(partial(_store_result, snippet.pk, snippet.highlight_key))
+
+
+def _store_result(pk, key, future):
+    # Runs on a thread of the executor, which has its own database connection.
+    close_old_connections()
+    try:
+        try:
+            fragment = future.result()
+        except Exception:
+            store(pk, key, '', Snippet.FAILED)
+        else:
+            highlighting.store(key, fragment)
+            store(pk, key, fragment, Snippet.READY)
+    finally:
+        connection.close()
+
+
+def store(pk, key, fragment, status):
+    # The snippet may have been edited meanwhile, only store the result for the code it was computed from.
+    return Snippet.objects.filter(pk=pk, highlight_key=key).update(highlighted=fragment, render_status=status)
+
+
+def retry(snippet):
+    """
+    Highlight a failed snippet again: on the request when highlighting is synchronous,
+    else by marking it pending for the pool or the queue worker.
+    """
+    if not highlighting.is_deferred():
+        # Let the error surface as it would when saving the snippet.
+        fragment = snippet.render_highlight()
+        store(snippet.pk, snippet.highlight_key, fragment, Snippet.READY)
+        return
+
+    store(snippet.pk, snippet.highlight_key, '', Snippet.PENDING)
+    transaction.on_commit(lambda: enqueue(snippet))
+
+
+def render_pending(batch_size=10):
+    """
+    Highlight a batch of pending snippets, returns how many were processed.
+    Rows are locked and skipped by concurrent workers where the database supports it.
+    """
+    with transaction.atomic():
+        snippets = list(Snippet.objects.filter(render_status=Snippet.PENDING).order_by('id')
+                        .select_for_update(skip_locked=True)[:batch_size])
+
+        for snippet in snippets:
+            try:
+                fragment = snippet.render_highlight()
+            except Exception:
+                store(snippet.pk, snippet.highlight_key, '', Snippet.FAILED)
+            else:
+                store(snippet.pk, snippet.highlight_key, fragment, Snippet.READY)
+
+    return len(snippets)
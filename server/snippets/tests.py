@@ -1,3 +1,241 @@
-from django.test import TestCase
+from concurrent.futures import Future
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.test import SimpleTestCase, override_settings
+
+from accounts.models import CustomUser
+from portfolio.testing import QueryCountTestCase
+from . import choices, highlighting, pygments_choices, tasks
+from .models import Snippet
+from .serializers import SnippetSerializer
+from .urls import router
+from .views import RENDERING_PLACEHOLDER
+
+
+class SnippetsQueryCountTests(QueryCountTestCase):
+    query_budgets = {
+        '': 2,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner@example.com', 'password')
+        cls.other = CustomUser.objects.create_user('other@example.com', 'password')
+        cls.add_snippets(2)
+
+    @classmethod
+    def add_snippets(cls, count):
+        for i in range(count):
+            Snippet.objects.create(title=f'Snippet {i}', code=f'print({i})', owner=[cls.owner, cls.other][i % 2])
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.owner)
+
+    def test_routes_have_a_budget(self):
+        self.assertRoutesCovered(router, self.query_budgets)
+
+    def test_list(self):
+        self.assertConstantQueries('/api/snippets/', self.query_budgets[''], lambda: self.add_snippets(6))
+
+    def test_detail(self):
+        snippet = Snippet.objects.first()
+        self.assertQueryCount(f'/api/snippets/{snippet.pk}/', 1)
+        self.assertQueryCount(f'/api/snippets/{snippet.pk}/highlight/', 1)
+
+    def test_search(self):
+        self.assertConstantQueries('/api/snippets/', self.query_budgets[''], lambda: self.add_snippets(6),
+                                   data={'search': 'print'})
+
+        snippet = Snippet.objects.create(title='Greeting', code='print("hello")', owner=self.owner)
+        results = self.client.get('/api/snippets/', {'search': 'hello'}).data['results']
+        self.assertEqual([row['title'] for row in results], ['Greeting'])
+
+        snippet.code = 'print("bye")'
+        snippet.save()
+        self.assertEqual(self.client.get('/api/snippets/', {'search': 'hello'}).data['results'], [])
+
+
+@override_settings(SNIPPETS_HIGHLIGHT_MODE='queue')
+class DeferredHighlightTests(QueryCountTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner@example.com', 'password')
+        cls.other = CustomUser.objects.create_user('other@example.com', 'password')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.owner)
+
+    def highlight(self, snippet):
+        return self.client.get(f'/api/snippets/{snippet.pk}/highlight/')
+
+    def test_queue_worker(self):
+        snippet = Snippet.objects.create(title='Queued', code='print(1)', owner=self.owner)
+        self.assertEqual(snippet.render_status, Snippet.PENDING)
+
+        response = self.highlight(snippet)
+        self.assertEqual((response.status_code, response['Retry-After']), (202, '1'))
+        self.assertEqual(response.content.decode(), RENDERING_PLACEHOLDER)
+
+        self.assertEqual(tasks.render_pending(), 1)
+        self.assertEqual(tasks.render_pending(), 0)
+        snippet.refresh_from_db()
+        self.assertEqual(snippet.render_status, Snippet.READY)
+        response = self.highlight(snippet)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(snippet.highlighted, response.content.decode())
+
+    def test_failed_snippets_are_retried_explicitly(self):
+        snippet = Snippet.objects.create(title='Broken', code='print(1)', language='not-a-language', owner=self.owner)
+        tasks.render_pending()
+        snippet.refresh_from_db()
+        self.assertEqual(snippet.render_status, Snippet.FAILED)
+
+        # Reads don't highlight again nor write
+        with self.assertNumQueries(1):
+            response = self.highlight(snippet)
+        self.assertEqual(response.status_code, 409)
+        self.assertIn(f'/api/snippets/{snippet.pk}/rehighlight/', response.content.decode())
+
+        url = f'/api/snippets/{snippet.pk}/rehighlight/'
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.post(url).status_code, 403)
+
+        self.client.force_authenticate(self.owner)
+        Snippet.objects.filter(pk=snippet.pk).update(language='python')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(url).status_code, 202)
+        self.assertEqual(tasks.render_pending(), 1)
+        self.assertEqual(self.highlight(snippet).status_code, 200)
+
+        with override_settings(SNIPPETS_HIGHLIGHT_MODE='sync'):
+            Snippet.objects.filter(pk=snippet.pk).update(render_status=Snippet.FAILED)
+            self.assertEqual(self.client.post(url).status_code, 200)
+            snippet.refresh_from_db()
+            self.assertEqual(snippet.render_status, Snippet.READY)
+
+    def test_results_of_edited_snippets_are_dropped(self):
+        snippet = Snippet.objects.create(title='Edited', code='print(1)', owner=self.owner)
+        key = snippet.highlight_key
+        snippet.code = 'print(2)'
+        snippet.save()
+
+        self.assertEqual(tasks.store(snippet.pk, key, 'stale', Snippet.READY), 0)
+        self.assertEqual(tasks.store(snippet.pk, snippet.highlight_key, 'fresh', Snippet.READY), 1)
+
+    @override_settings(SNIPPETS_HIGHLIGHT_MODE='pool')
+    def test_pool_result(self):
+        snippet = Snippet.objects.create(title='Pooled', code='print(1)', owner=self.owner)
+        done, failed = Future(), Future()
+        done.set_result('<pre>print(1)</pre>')
+        failed.set_exception(RuntimeError('worker died'))
+
+        # The callback closes the connection of its thread, which here holds the test transaction
+        with mock.patch.object(tasks, 'connection'), mock.patch.object(tasks, 'close_old_connections'):
+            tasks._store_result(snippet.pk, snippet.highlight_key, failed)
+            self.assertEqual(Snippet.objects.get(pk=snippet.pk).render_status, Snippet.FAILED)
+            tasks._store_result(snippet.pk, snippet.highlight_key, done)
+
+        snippet.refresh_from_db()
+        self.assertEqual((snippet.render_status, snippet.highlighted), (Snippet.READY, '<pre>print(1)</pre>'))
+
+
+class HighlightCacheTests(QueryCountTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner@example.com', 'password')
+
+    def test_key(self):
+        key = highlighting.cache_key('print(1)', 'python', 'monokai', False)
+        self.assertEqual(key, highlighting.cache_key('print(1)', 'python', 'monokai', False))
+        for args in [('print(2)', 'python', 'monokai', False), ('print(1)', 'python3', 'monokai', False),
+                     ('print(1)', 'python', 'default', False), ('print(1)', 'python', 'monokai', True)]:
+            with self.subTest(args=args):
+                self.assertNotEqual(highlighting.cache_key(*args), key)
+        # The parts are delimited, moving text from one to the other changes the key
+        self.assertNotEqual(highlighting.cache_key('x', 'python', 'monokai', False),
+                            highlighting.cache_key('x', 'pythonm', 'onokai', False))
+
+    def test_hit_and_miss(self):
+        with mock.patch.object(highlighting, 'highlight_code', wraps=highlighting.highlight_code) as highlight:
+            first = highlighting.render('print(1)', 'python', 'monokai', False)
+            self.assertEqual(highlighting.render('print(1)', 'python', 'monokai', False), first)
+            self.assertEqual(highlight.call_count, 1)
+
+            highlighting.render('print(1)', 'python', 'monokai', True)
+            self.assertEqual(highlight.call_count, 2)
+
+    def test_snippets_share_the_cache(self):
+        with mock.patch.object(highlighting, 'highlight_code', wraps=highlighting.highlight_code) as highlight:
+            snippet = Snippet.objects.create(title='First', code='print(1)', owner=self.owner)
+            copy = Snippet.objects.create(title='Copy', code='print(1)', owner=self.owner)
+            snippet.title = 'Renamed'
+            snippet.save()
+            self.assertEqual(highlight.call_count, 1)
+
+            snippet.linenos = True
+            snippet.save()
+            self.assertEqual(highlight.call_count, 2)
+
+        self.assertEqual(copy.highlighted, Snippet.objects.get(pk=copy.pk).highlighted)
+        self.assertEqual(copy.highlight_key, highlighting.cache_key('print(1)', 'python', 'monokai', False))
+
+    def test_shared_stylesheet(self):
+        snippet = Snippet.objects.create(title='Styled', code='print(1)', style='monokai', owner=self.owner)
+        # The stored fragment has no stylesheet, the page gets the one of the style
+        self.assertNotIn('<style', snippet.highlighted)
+        page = snippet.highlighted_page()
+        self.assertIn(highlighting.style_defs('monokai'), page)
+        self.assertIn(snippet.highlighted, page)
+        self.assertIn('<title>Styled</title>', page)
+
+        with mock.patch.object(highlighting, 'get_formatter', wraps=highlighting.get_formatter) as formatter:
+            snippet.highlighted_page()
+            Snippet(title='Other', code='x = 1', style='monokai', highlighted='', owner=self.owner).highlighted_page()
+            formatter.assert_not_called()
+
+    def test_migration_renders_fragments(self):
+        migration = import_module('snippets.migrations.0003_snippet_highlight_key')
+        snippet = Snippet.objects.create(title='Old', code='print(1)', owner=self.owner)
+        fragment = snippet.highlighted
+        Snippet.objects.filter(pk=snippet.pk).update(highlight_key='', highlighted=snippet.highlighted_page())
+
+        migration.render_fragments(apps, None)
+        snippet.refresh_from_db()
+        self.assertEqual((snippet.highlighted, snippet.highlight_key),
+                         (fragment, highlighting.cache_key('print(1)', 'python', 'monokai', False)))
+
+
+class ChoicesTests(SimpleTestCase):
+    def setUp(self):
+        choices.language_choices.cache_clear()
+        choices.style_choices.cache_clear()
+        self.addCleanup(choices.language_choices.cache_clear)
+        self.addCleanup(choices.style_choices.cache_clear)
+
+    def test_table_is_used(self):
+        table = [('python', 'Python')]
+        with mock.patch.object(pygments_choices, 'PYGMENTS_VERSION', choices.pygments_version), \
+                mock.patch.object(pygments_choices, 'LANGUAGE_CHOICES', table), \
+                mock.patch.object(choices, 'compute_language_choices') as compute:
+            self.assertIs(choices.language_choices(), table)
+            compute.assert_not_called()
+
+    def test_other_pygments_version(self):
+        with mock.patch.object(pygments_choices, 'PYGMENTS_VERSION', '0.0'), \
+                mock.patch.object(pygments_choices, 'LANGUAGE_CHOICES', []), \
+                mock.patch.object(pygments_choices, 'STYLE_CHOICES', []):
+            self.assertIn(('python', 'Python'), choices.language_choices())
+            self.assertIn(('monokai', 'monokai'), choices.style_choices())
+
+    def test_unknown_choices_are_rejected(self):
+        for data, field in [({'language': 'not-a-language'}, 'language'), ({'style': 'not-a-style'}, 'style')]:
+            with self.subTest(data=data):
+                serializer = SnippetSerializer(data={'code': 'print(1)', **data})
+                self.assertFalse(serializer.is_valid())
+                self.assertEqual(serializer.errors[field][0].code, 'invalid_choice')
+
+        self.assertTrue(SnippetSerializer(data={'code': 'print(1)', 'language': 'rust', 'style': 'default'}).is_valid())
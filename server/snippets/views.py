@@ -1,13 +1,22 @@
 # from rest_framework import mixins
+from django.utils.html import escape
 from rest_framework import generics, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework import permissions
 from rest_framework import renderers
+from rest_framework import status
 
 from .models import Snippet
 from .serializers import SnippetSerializer
 from .permissions import IsOwnerOrReadOnly
+from .search import snippets
+from . import tasks
+
+RENDERING_PLACEHOLDER = '<!DOCTYPE html>\n<html>\n<body>\n<p>Highlighting in progress.</p>\n</body>\n</html>\n'
+RENDERING_FAILED = ('<!DOCTYPE html>\n<html>\n<body>\n<p>Highlighting failed, POST to <code>{url}</code> to try again.</p>\n'
+                    '</body>\n</html>\n')
 
 
 class SnippetViewSet(viewsets.ModelViewSet):
@@ -15,17 +24,46 @@ class SnippetViewSet(viewsets.ModelViewSet):
     This viewset automatically provides `list`, `create`, `retrieve`,
     `update` and `destroy` actions.
 
-    Additionally we also provide an extra `highlight` action.
+    Additionally we also provide an extra `highlight` action, a `rehighlight` action
+    highlighting a failed snippet again, and the list takes a `search` parameter
+    matching the title and code, best matches first.
     """
-    queryset = Snippet.objects.all()
+    queryset = Snippet.objects.select_related('owner')
     serializer_class = SnippetSerializer
     permission_classes = [permissions.IsAuthenticated,
                           IsOwnerOrReadOnly]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        text = self.request.query_params.get('search')
+        if self.action == 'list' and text:
+            queryset = snippets.filter(queryset, text).order_by('-search_rank', 'id')
+        return queryset
+
     @action(detail=True, renderer_classes=[renderers.StaticHTMLRenderer])
     def highlight(self, request, *args, **kwargs):
+        return self.highlighted_response(self.get_object())
+
+    @action(detail=True, methods=['post'], renderer_classes=[renderers.StaticHTMLRenderer])
+    def rehighlight(self, request, *args, **kwargs):
         snippet = self.get_object()
-        return Response(snippet.highlighted)
+
+        if snippet.render_status == Snippet.FAILED:
+            tasks.retry(snippet)
+            snippet.refresh_from_db(fields=['highlighted', 'render_status'])
+
+        return self.highlighted_response(snippet)
+
+    def highlighted_response(self, snippet):
+        if snippet.render_status == Snippet.PENDING:
+            return Response(RENDERING_PLACEHOLDER, status=status.HTTP_202_ACCEPTED, headers={'Retry-After': '1'})
+
+        if snippet.render_status == Snippet.FAILED:
+            # A known state, not a server error: highlighted again with the `rehighlight` action, not on reads.
+            url = reverse('snippet-rehighlight', args=[snippet.pk], request=self.request)
+            return Response(RENDERING_FAILED.format(url=escape(url)), status=status.HTTP_409_CONFLICT)
+
+        return Response(snippet.highlighted_page())
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)